@@ -0,0 +1,789 @@
+import argparse
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import pandas as pd
+
+# ---------------------------
+# Messhilfen für die Performance-Arbeiten am Shop
+# ---------------------------
+# Aufruf: python benchmark.py <messung> [--runs N]
+
+storelist_path = "data/storelist_new.xlsx"
+products_path = "data/produkte.xlsx"
+special_products_path = "data/produkte_special.xlsx"
+catalog_files = [storelist_path, products_path, special_products_path]
+
+# ---------------------------
+# Funktion: Laufzeit einer Funktion messen (Median und Minimum in ms)
+# ---------------------------
+def measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[0]
+
+def print_result(label, median_ms, min_ms):
+    print(f"{label:<45} median {median_ms:9.2f} ms   min {min_ms:9.2f} ms")
+
+# ---------------------------
+# Messung: Katalog aus Excel vs. kompilierter Parquet-Cache
+# ---------------------------
+def benchmark_catalog(args):
+    from katalog import load_catalog_frame
+
+    cache_folder = tempfile.mkdtemp(prefix="katalog-bench-")
+    try:
+        def parse_excel():
+            for path in catalog_files:
+                pd.read_excel(path)
+
+        def load_compiled():
+            for path in catalog_files:
+                load_catalog_frame(path, cache_folder)
+
+        print_result("Excel (openpyxl), 3 Dateien", *measure(parse_excel, args.runs))
+        print_result("Erster Start (Excel + Kompilieren)", *measure(lambda: (shutil.rmtree(cache_folder), load_compiled()), 1))
+        print_result("Kompilierter Katalog (Parquet), 3 Dateien", *measure(load_compiled, args.runs))
+    finally:
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+# ---------------------------
+# Funktion: Produktkatalog künstlich auf n Zeilen vergrössern
+# ---------------------------
+def synthetic_products(rows):
+    base = pd.read_excel(products_path)
+    df = pd.concat([base] * (rows // len(base) + 1), ignore_index=True).head(rows)
+    df["SAP Number"] = range(90000000, 90000000 + rows)
+    return df
+
+# ---------------------------
+# Messung: Zeilenaufbereitung mit iterrows vs. vorberechnete Produktkarten
+# ---------------------------
+def benchmark_cards(args):
+    from katalog import build_cards, format_number
+
+    df = synthetic_products(args.rows)
+
+    def per_row():
+        # Aufbereitung wie früher in display_products, ohne Streamlit-Ausgabe
+        for index, row in df.iterrows():
+            not pd.isna(row.get("Bemerkungen", "")) and str(row["Bemerkungen"]).strip()
+            format_number(row["SAP Number"])
+            format_number(row["actual Stock"])
+            [qty for qty in [row.get("Qty 1"), row.get("Qty 2"), row.get("Qty 3"), row.get("Qty 4")] if not pd.isna(qty)]
+
+    cards = build_cards(df)
+
+    def read_cards():
+        for card in cards:
+            card.remark, card.sap_number, card.stock_text, card.qty_options
+
+    print(f"{args.rows} Produkte")
+    print_result("iterrows pro Rerun", *measure(per_row, args.runs))
+    print_result("build_cards (einmal pro Katalogstand)", *measure(lambda: build_cards(df), args.runs))
+    print_result("Produktkarten lesen pro Rerun", *measure(read_cards, args.runs))
+
+# ---------------------------
+# Messung: Suchindex vs. str.contains auf dem DataFrame
+# ---------------------------
+def benchmark_search(args):
+    from katalog import build_cards, SearchIndex
+
+    df = synthetic_products(args.rows)
+    cards = build_cards(df)
+    queries = ["karte", "9005", "bag small", "label a6", "x"]
+
+    def contains_filter():
+        for query in queries:
+            haystack = (df["Name"].astype(str) + " " + df["SAP Number"].astype(str) + " "
+                        + df["Bemerkungen"].fillna("").astype(str))
+            haystack.str.contains(query, case=False, regex=False)
+
+    print(f"{args.rows} Produkte, {len(queries)} Suchbegriffe")
+    print_result("str.contains pro Eingabe", *measure(contains_filter, args.runs))
+    print_result("SearchIndex aufbauen (einmal pro Katalogstand)", *measure(lambda: SearchIndex(cards), args.runs))
+    index = SearchIndex(cards)
+    print_result("SearchIndex, ohne Ergebnis-Cache", *measure(lambda: [index._search(q) for q in queries], args.runs))
+    print_result("SearchIndex, mit Ergebnis-Cache", *measure(lambda: [index.search(q) for q in queries], args.runs))
+
+# ---------------------------
+# Messung: Engine + Schema pro Rerun vs. einmal pro Prozess
+# ---------------------------
+def benchmark_engine(args):
+    import datenbank
+    import protokoll
+    from sqlalchemy import create_engine, Table, Column, Integer, String, MetaData, text
+
+    folder = tempfile.mkdtemp(prefix="engine-bench-")
+    datenbank.db_path = os.path.join(folder, "bestellungen.db")
+    protokoll.log_db_path = os.path.join(folder, "merch_shop.db")
+    try:
+        def per_rerun():
+            # So lief es früher bei jeder Interaktion am Anfang von mein_app.py
+            engine = create_engine(f"sqlite:///{datenbank.db_path}")
+            meta = MetaData()
+            Table(
+                'bestellungen', meta,
+                Column('id', Integer, primary_key=True),
+                Column('Datum', String),
+                Column('Storenummer', String),
+                Column('Produktname', String),
+                Column('SAP_Nummer', String),
+                Column('Anzahl', Integer)
+            )
+            meta.create_all(engine)
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            engine.dispose()
+
+        def shared_engine():
+            with datenbank.get_engine().connect() as conn:
+                conn.execute(text("SELECT 1"))
+
+        print_result("create_engine + create_all pro Rerun", *measure(per_rerun, args.runs))
+        print_result("get_engine() (Prozess-Engine, Pool)", *measure(shared_engine, args.runs))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Funktion: Viele Threads gleichzeitig bestellen lassen, Leser parallel messen
+# ---------------------------
+def hammer(order_func, read_func, threads, orders_per_thread):
+    errors = []
+    read_latencies = []
+    stop = threading.Event()
+
+    def store_worker(store_number):
+        for i in range(orders_per_thread):
+            try:
+                order_func(str(store_number), str(90000000 + i), f"Produkt {i}", 1)
+            except Exception as e:
+                errors.append(e)
+
+    def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                read_func()
+            except Exception as e:
+                errors.append(e)
+            read_latencies.append((time.perf_counter() - start) * 1000)
+
+    workers = [threading.Thread(target=store_worker, args=(200 + n,)) for n in range(threads)]
+    reader_thread = threading.Thread(target=reader)
+    start = time.perf_counter()
+    reader_thread.start()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    reader_thread.join()
+
+    total = threads * orders_per_thread
+    locked = sum(1 for e in errors if "locked" in str(e))
+    read_latencies.sort()
+    p99 = read_latencies[int(len(read_latencies) * 0.99)] if read_latencies else 0.0
+    print(f"  {total - len(errors)}/{total} Bestellungen in {elapsed:.2f} s "
+          f"({(total - len(errors)) / elapsed:.0f}/s), 'database is locked': {locked}, andere Fehler: {len(errors) - locked}")
+    print(f"  Leser: {len(read_latencies)} Abfragen, p99 {p99:.2f} ms, max {read_latencies[-1] if read_latencies else 0:.2f} ms")
+
+# ---------------------------
+# Messung: gleichzeitige Bestellungen (vorher: Verbindung pro Bestellung, Rollback-Journal)
+# ---------------------------
+def benchmark_load(args):
+    import datenbank
+    import protokoll
+    from sqlalchemy import create_engine, text
+
+    folder = tempfile.mkdtemp(prefix="last-bench-")
+    try:
+        # Vorher: jede Session schreibt selbst, Rollback-Journal
+        datenbank.db_path = os.path.join(folder, "klassisch.db")
+        engine = datenbank.apply_storage_profile(
+            create_engine(f"sqlite:///{datenbank.db_path}"), "klassisch")
+        datenbank.bootstrap_schema(engine)
+
+        # bestellungen ist seit Migration 5 eine View, deshalb über insert_order_rows schreiben
+        def direct_order(store_number, sap_number, product_name, quantity):
+            with engine.begin() as conn:
+                datenbank.insert_order_rows(conn, [{
+                    "Datum": time.strftime("%Y-%m-%d"), "Storenummer": store_number,
+                    "Produktname": product_name, "SAP_Nummer": sap_number, "Anzahl": quantity}])
+
+        def direct_read():
+            with engine.connect() as conn:
+                conn.execute(text("SELECT COUNT(*) FROM bestellungen")).scalar()
+
+        print(f"Klassisch ({args.threads} Threads x {args.orders} Bestellungen, Verbindung pro Bestellung):")
+        hammer(direct_order, direct_read, args.threads, args.orders)
+        engine.dispose()
+
+        # Nachher: Profil aus SHOP_DB_PROFIL, ein Schreib-Thread, Nur-Lese-Pool
+        datenbank.db_path = os.path.join(folder, "wal.db")
+        protokoll.log_db_path = os.path.join(folder, "merch_shop.db")
+
+        def pooled_read():
+            with datenbank.get_read_engine().connect() as conn:
+                conn.execute(text("SELECT COUNT(*) FROM bestellungen")).scalar()
+
+        print(f"Profil '{datenbank.storage_profile}' mit Schreib-Thread und Nur-Lese-Pool:")
+        hammer(datenbank.save_order, pooled_read, args.threads, args.orders)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Messung: Latenz pro Bestellung, synchron vs. Bestellpuffer
+# ---------------------------
+def benchmark_buffer(args):
+    import datenbank
+    import bestellpuffer
+    import protokoll
+
+    folder = tempfile.mkdtemp(prefix="puffer-bench-")
+    try:
+        datenbank.db_path = os.path.join(folder, "bestellungen.db")
+        protokoll.log_db_path = os.path.join(folder, "merch_shop.db")
+        lines = {str(90000000 + i): {"name": f"Produkt {i}", "quantity": 10} for i in range(5)}
+
+        def latencies(order_func):
+            results = []
+
+            def store_worker(store_number):
+                for _ in range(args.orders):
+                    start = time.perf_counter()
+                    order_func(store_number, lines)
+                    results.append((time.perf_counter() - start) * 1000)
+
+            workers = [threading.Thread(target=store_worker, args=(str(200 + n),)) for n in range(args.threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            results.sort()
+            p50 = results[len(results) // 2]
+            p99 = results[int(len(results) * 0.99)]
+            return f"p50 {p50:8.2f} ms   p99 {p99:8.2f} ms   {len(results) / elapsed:6.0f} Bestellungen/s"
+
+        print(f"Profil '{datenbank.storage_profile}', {args.threads} Stores x {args.orders} Bestellungen à {len(lines)} Positionen")
+        print(f"{'save_cart_order (Commit pro Bestellung)':<45} {latencies(datenbank.save_cart_order)}")
+        buffer = bestellpuffer.OrderBuffer(os.path.join(folder, "bestellungen.journal"))
+        print(f"{'Bestellpuffer (Quittung nach Journal)':<45} {latencies(buffer.submit)}")
+        start = time.perf_counter()
+        buffer.flush()
+        print(f"Bestellpuffer vollständig gespeichert nach weiteren {(time.perf_counter() - start) * 1000:.0f} ms")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Funktion: Bestelltabelle mit vielen Zeilen füllen (110 Stores, 40 SAP-Nummern, 2 Jahre)
+# ---------------------------
+def fill_orders(engine, rows):
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text('''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows)
+            INSERT INTO bestellungen ("Datum", "Storenummer", "Produktname", "SAP_Nummer", "Anzahl")
+            SELECT date('2024-01-01', '+' || (i % 730) || ' days'),
+                   CAST(200 + (i * 7) % 110 AS TEXT),
+                   'Produkt ' || (i % 40),
+                   CAST(90050000 + (i * 13) % 40 AS TEXT),
+                   1 + i % 50
+            FROM n
+        '''), {"rows": rows})
+
+# ---------------------------
+# Messung: typische Auswertungen vor und nach den Indizes (Migration 4)
+# ---------------------------
+def benchmark_queries(args):
+    from sqlalchemy import create_engine, text
+    from init_bestellungen_db import migrate
+
+    queries = {
+        "Store, letzte 30 Tage": (
+            'SELECT "SAP_Nummer", SUM("Anzahl") FROM bestellungen '
+            'WHERE "Storenummer" = \'257\' AND "Datum" >= \'2025-12-01\' GROUP BY "SAP_Nummer"'),
+        "SAP-Nummer, ein Monat": (
+            'SELECT "Storenummer", SUM("Anzahl") FROM bestellungen '
+            'WHERE "SAP_Nummer" = \'90050013\' AND "Datum" BETWEEN \'2025-06-01\' AND \'2025-06-30\' '
+            'GROUP BY "Storenummer"'),
+        "Store, ganze Historie": (
+            'SELECT COUNT(*), SUM("Anzahl") FROM bestellungen WHERE "Storenummer" = \'201\''),
+        "SAP-Nummer, ganze Historie": (
+            'SELECT COUNT(*) FROM bestellungen WHERE "SAP_Nummer" = \'90050001\''),
+    }
+
+    folder = tempfile.mkdtemp(prefix="abfragen-bench-")
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bestellungen.db')}")
+        migrate(engine, target_version=3)
+        start = time.perf_counter()
+        fill_orders(engine, args.rows)
+        print(f"{args.rows} Bestellungen erzeugt in {time.perf_counter() - start:.1f} s")
+
+        def run_all(label):
+            print(label)
+            with engine.connect() as conn:
+                for name, sql in queries.items():
+                    print_result(f"  {name}", *measure(lambda: conn.execute(text(sql)).fetchall(), args.runs))
+
+        run_all("Ohne Indizes (Schema-Version 3):")
+        start = time.perf_counter()
+        migrate(engine, target_version=4)
+        print(f"Migration 4 (Indizes + ANALYZE) in {time.perf_counter() - start:.1f} s")
+        run_all("Mit Indizes (Schema-Version 4):")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Messung: Auswertung eines Monats über die ganze Tabelle vs. nur die Monatspartition (Migration 5)
+# ---------------------------
+def benchmark_partitions(args):
+    from sqlalchemy import create_engine, text
+    from init_bestellungen_db import migrate
+    from datenbank import month_bounds, orders_source
+
+    folder = tempfile.mkdtemp(prefix="monate-bench-")
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bestellungen.db')}")
+        migrate(engine, target_version=4)
+        fill_orders(engine, args.rows)
+        month = "2025-06"
+        start_ts, end_ts = month_bounds(month)
+
+        print("Eine Tabelle (Schema-Version 4):")
+        with engine.connect() as conn:
+            sql = ('SELECT "Storenummer", SUM("Anzahl") FROM bestellungen '
+                   'WHERE "Datum" BETWEEN \'2025-06-01\' AND \'2025-06-30\' GROUP BY "Storenummer"')
+            print_result(f"  Alle Stores, {month}", *measure(lambda: conn.execute(text(sql)).fetchall(), args.runs))
+
+        start = time.perf_counter()
+        migrate(engine)
+        print(f"Migration 5 (Monatspartitionen) in {time.perf_counter() - start:.1f} s")
+        print("Monatspartitionen (Schema-Version 5):")
+        with engine.connect() as conn:
+            params = {"start": start_ts, "end": end_ts}
+            for label, source in (("über die View", "bestellungen"),
+                                  ("nur Partition", orders_source(conn, start_ts, end_ts))):
+                sql = (f'SELECT "Storenummer", SUM("Anzahl") FROM {source} '
+                       'WHERE "Zeitstempel" >= :start AND "Zeitstempel" < :end GROUP BY "Storenummer"')
+                print_result(f"  Alle Stores, {month}, {label}",
+                             *measure(lambda: conn.execute(text(sql), params).fetchall(), args.runs))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Messung: Export aller Bestellungen, DataFrame vs. blockweise
+# ---------------------------
+# Jede Variante läuft in einem frischen Prozess; gemessen wird dessen maximale Speichernutzung
+# (ru_maxrss, inklusive der Importe von pandas und openpyxl, siehe Zeile "nur Importe").
+def export_variant(variant, db_file, folder, result_queue):
+    import resource
+    from sqlalchemy import create_engine
+    from export_bestellungen import export_orders
+
+    engine = create_engine(f"sqlite:///{db_file}")
+    csv_path = os.path.join(folder, f"{variant}.csv")
+    excel_path = os.path.join(folder, f"{variant}.xlsx")
+    start = time.perf_counter()
+    if variant == "dataframe":
+        df = pd.read_sql_query("SELECT * FROM bestellungen", engine)
+        df.to_excel(excel_path, index=False)
+        df.to_csv(csv_path, index=False)
+    elif variant == "blockweise":
+        export_orders(csv_path=csv_path, excel_path=excel_path, engine=engine)
+    elapsed = time.perf_counter() - start
+    result_queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+def benchmark_export(args):
+    import multiprocessing
+    from sqlalchemy import create_engine
+    from init_bestellungen_db import migrate
+
+    folder = tempfile.mkdtemp(prefix="export-bench-")
+    try:
+        db_file = os.path.join(folder, "bestellungen.db")
+        engine = create_engine(f"sqlite:///{db_file}")
+        migrate(engine, target_version=4)
+        fill_orders(engine, args.rows)
+        migrate(engine)
+        engine.dispose()
+
+        context = multiprocessing.get_context("spawn")
+        print(f"Export von {args.rows} Bestellpositionen (Excel und CSV):")
+        for variant, label in (("importe", "nur Importe"), ("dataframe", "DataFrame (bisher)"), ("blockweise", "blockweise")):
+            result_queue = context.Queue()
+            process = context.Process(target=export_variant, args=(variant, db_file, folder, result_queue))
+            process.start()
+            elapsed, max_rss_kb = result_queue.get()
+            process.join()
+            print(f"  {label:<24} {elapsed:8.1f} s   max. Speicher {max_rss_kb / 1024:8.1f} MB")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Messung: inkrementeller Export (erster Lauf, Lauf ohne und mit neuen Bestellungen)
+# ---------------------------
+def benchmark_incremental(args):
+    from sqlalchemy import create_engine
+    from init_bestellungen_db import migrate
+    from datenbank import insert_order_rows
+    from export_bestellungen import export_incremental
+
+    folder = tempfile.mkdtemp(prefix="inkrementell-bench-")
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bestellungen.db')}")
+        migrate(engine, target_version=4)
+        fill_orders(engine, args.rows)
+        migrate(engine)
+        csv_path = os.path.join(folder, "export.csv")
+        parts_path = os.path.join(folder, "teile")
+
+        def run():
+            export_incremental(csv_path=csv_path, parts_path=parts_path, engine=engine)
+
+        print(f"Inkrementeller Export, {args.rows} Bestellpositionen in der Datenbank:")
+        start = time.perf_counter()
+        run()
+        print(f"  Erster Lauf (alles)        {time.perf_counter() - start:8.2f} s")
+        print_result("  Lauf ohne neue Bestellungen", *measure(run, args.runs))
+
+        def add_and_run():
+            with engine.begin() as conn:
+                insert_order_rows(conn, [
+                    {"Datum": "2026-01-01", "Storenummer": "201", "Produktname": "Neu",
+                     "SAP_Nummer": "90050001", "Anzahl": 1}
+                    for _ in range(args.orders)
+                ])
+            run()
+
+        print_result(f"  Lauf mit {args.orders} neuen Positionen", *measure(add_and_run, args.runs))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Messung: Bestellmatrix Store × SAP-Nummer, pandas-Pivot vs. Summentabelle in SQLite
+# ---------------------------
+def benchmark_matrix(args):
+    from sqlalchemy import create_engine
+    from init_bestellungen_db import migrate
+    from export_bestellungen import export_matrix
+
+    folder = tempfile.mkdtemp(prefix="matrix-bench-")
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bestellungen.db')}")
+        migrate(engine, target_version=4)
+        fill_orders(engine, args.rows)
+        migrate(engine)
+        excel_path = os.path.join(folder, "matrix.xlsx")
+        csv_path = os.path.join(folder, "matrix.csv")
+
+        def pandas_matrix(start=None, end=None):
+            df = pd.read_sql_query("SELECT * FROM bestellungen", engine)
+            if start:
+                df = df[(df["Tag"] >= start) & (df["Tag"] <= end)]
+            matrix = df.pivot_table(index="Storenummer", columns="SAP_Nummer", values="Anzahl", aggfunc="sum")
+            matrix.to_excel(excel_path)
+            matrix.to_csv(csv_path)
+
+        def sql_matrix(start=None, end=None):
+            export_matrix(start, end, csv_path=csv_path, excel_path=excel_path, engine=engine)
+
+        print(f"Bestellmatrix aus {args.rows} Bestellpositionen (Excel und CSV):")
+        for window, start, end in (("ganze Historie", None, None), ("ein Monat", "2025-06-01", "2025-06-30")):
+            print_result(f"  pandas-Pivot, {window}", *measure(lambda: pandas_matrix(start, end), args.runs))
+            print_result(f"  Summentabelle, {window}", *measure(lambda: sql_matrix(start, end), args.runs))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Messung: Exportformate im Vergleich (Schreiben, Grösse, Wiedereinlesen mit pandas)
+# ---------------------------
+def benchmark_formats(args):
+    import pyarrow as pa
+    from sqlalchemy import create_engine
+    from init_bestellungen_db import migrate
+    from export_bestellungen import export_orders
+
+    folder = tempfile.mkdtemp(prefix="formate-bench-")
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bestellungen.db')}")
+        migrate(engine, target_version=4)
+        fill_orders(engine, args.rows)
+        migrate(engine)
+        paths = {
+            "csv": os.path.join(folder, "export.csv"),
+            "xlsx": os.path.join(folder, "export.xlsx"),
+            "parquet": os.path.join(folder, "export.parquet"),
+            "arrow": os.path.join(folder, "export.arrows"),
+        }
+        readers = {
+            "csv": pd.read_csv,
+            "xlsx": pd.read_excel,
+            "parquet": pd.read_parquet,
+            "arrow": lambda path: pa.ipc.open_stream(path).read_pandas(),
+        }
+
+        print(f"Export von {args.rows} Bestellpositionen pro Format:")
+        for format, path in paths.items():
+            start = time.perf_counter()
+            export_orders(formats=(format,), csv_path=paths["csv"], excel_path=paths["xlsx"],
+                          parquet_path=paths["parquet"], arrow_path=paths["arrow"], engine=engine)
+            written = time.perf_counter() - start
+            start = time.perf_counter()
+            readers[format](path)
+            read = time.perf_counter() - start
+            print(f"  {format:<8} schreiben {written:7.2f} s   lesen {read:7.2f} s   "
+                  f"{os.path.getsize(path) / 1024 / 1024:8.1f} MB")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Messung: typische Dashboard-Abfragen über alle Bestellungen vs. über die Summentabellen
+# ---------------------------
+def benchmark_totals(args):
+    from sqlalchemy import create_engine, text
+    from init_bestellungen_db import migrate
+
+    queries = {
+        "Store × SAP, ein Monat": (
+            'SELECT SUM("Anzahl") FROM bestellungen WHERE "Storenummer" = \'257\' '
+            'AND "SAP_Nummer" = \'90050013\' AND "Monat" = \'2025-06\'',
+            'SELECT SUM("Anzahl") FROM summen_store_sap_tag WHERE "Storenummer" = \'257\' '
+            'AND "SAP_Nummer" = \'90050013\' AND "Tag" BETWEEN \'2025-06-01\' AND \'2025-06-30\''),
+        "SAP, Menge pro Monat": (
+            'SELECT "Monat", SUM("Anzahl") FROM bestellungen WHERE "SAP_Nummer" = \'90050013\' GROUP BY "Monat"',
+            'SELECT "Monat", "Anzahl" FROM summen_sap_monat WHERE "SAP_Nummer" = \'90050013\''),
+        "Alle SAP, ein Monat": (
+            'SELECT "SAP_Nummer", SUM("Anzahl") FROM bestellungen WHERE "Monat" = \'2025-06\' GROUP BY "SAP_Nummer"',
+            'SELECT "SAP_Nummer", "Anzahl" FROM summen_sap_monat WHERE "Monat" = \'2025-06\''),
+    }
+
+    folder = tempfile.mkdtemp(prefix="summen-bench-")
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bestellungen.db')}")
+        migrate(engine, target_version=4)
+        fill_orders(engine, args.rows)
+        start = time.perf_counter()
+        migrate(engine)
+        print(f"Migrationen 5 und 6 für {args.rows} Bestellungen in {time.perf_counter() - start:.1f} s")
+        with engine.connect() as conn:
+            for name, (raw_sql, totals_sql) in queries.items():
+                print_result(f"  {name}, Bestellungen", *measure(lambda: conn.execute(text(raw_sql)).fetchall(), args.runs))
+                print_result(f"  {name}, Summen", *measure(lambda: conn.execute(text(totals_sql)).fetchall(), args.runs))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Test-Mailserver: nimmt Mails an und verwirft sie
+# ---------------------------
+# Nur so viel SMTP, wie smtplib braucht (das Modul smtpd gibt es ab Python 3.12 nicht mehr).
+# Lokal kostet ein Verbindungsaufbau fast nichts; die Begrüssung wird um greeting_delay_s
+# verzögert, wie beim Verbindungsaufbau zu einem echten Server (Netz, TLS, Anmeldung).
+class DiscardingSMTPHandler(socketserver.StreamRequestHandler):
+    greeting_delay_s = 0.02
+
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        time.sleep(self.greeting_delay_s)
+        self.reply("220 localhost Test-Mailserver")
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b"DATA":
+                self.reply("354 Ende mit <CRLF>.<CRLF>")
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            elif command in (b"EHLO", b"HELO"):
+                self.reply("250 localhost")
+            else:
+                self.reply("250 OK")
+
+def start_smtp_stub():
+    server = socketserver.ThreadingTCPServer(("localhost", 0), DiscardingSMTPHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ---------------------------
+# Messung: Postausgang mit wiederverwendeter SMTP-Verbindung vs. Verbindung pro Mail
+# ---------------------------
+# Startet einen lokalen Test-Mailserver (start_smtp_stub) auf einem freien Port.
+def benchmark_mails(args):
+    import datenbank
+    import mailversand
+    import protokoll
+
+    server = start_smtp_stub()
+    port = server.server_address[1]
+    folder = tempfile.mkdtemp(prefix="mail-bench-")
+    try:
+        datenbank.db_path = os.path.join(folder, "bestellungen.db")
+        protokoll.log_db_path = os.path.join(folder, "merch_shop.db")
+        mailversand.smtp_port = port
+        mailversand.dispatch_in_app = False
+        count = args.orders * 10
+
+        def enqueue_all():
+            timings = []
+            for n in range(count):
+                start = time.perf_counter()
+                mailversand.enqueue_special_order("Logistics@example.ch", "257", "Bern", str(90050000 + n), "Banner", 1)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            return timings
+
+        timings = enqueue_all()
+        print(f"{count} Bestellungen in den Postausgang: p50 {timings[len(timings) // 2]:.2f} ms   "
+              f"p99 {timings[int(len(timings) * 0.99)]:.2f} ms")
+
+        dispatcher = mailversand.MailDispatcher(start_thread=False)
+        start = time.perf_counter()
+        dispatcher.process_due()
+        elapsed = time.perf_counter() - start
+        dispatcher.close()
+        print(f"{'Versand, eine Verbindung':<45} {elapsed * 1000:9.0f} ms   {count / elapsed:6.0f} Mails/s")
+
+        enqueue_all()
+        send = dispatcher._send
+
+        # process_due hält die Sperre des Dispatchers, deshalb direkt schliessen
+        def send_and_close(message):
+            send(message)
+            dispatcher.connection.quit()
+            dispatcher.connection = None
+
+        dispatcher._send = send_and_close
+        start = time.perf_counter()
+        dispatcher.process_due()
+        elapsed = time.perf_counter() - start
+        print(f"{'Versand, neue Verbindung pro Mail':<45} {elapsed * 1000:9.0f} ms   {count / elapsed:6.0f} Mails/s")
+
+        # Sammelmails: dieselben Bestellungen an zwei Empfänger, ein Fenster
+        sent_messages = []
+
+        def count_and_send(message):
+            sent_messages.append(message)
+            send(message)
+
+        dispatcher._send = count_and_send
+        mailversand.digest_mode = True
+        enqueue_all()
+        from sqlalchemy import text
+        datenbank.run_write(lambda conn: conn.execute(text(
+            'UPDATE mail_ausgang SET "Empfaenger" = \'Retaildevelopment@example.ch\' WHERE id % 2 = 0'
+        )))
+        start = time.perf_counter()
+        sent, _ = dispatcher.process_due()
+        elapsed = time.perf_counter() - start
+        dispatcher.close()
+        print(f"{'Sammelmails pro Empfänger':<45} {elapsed * 1000:9.0f} ms   "
+              f"{len(sent_messages)} Mails für {sent} Bestellungen")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+# ---------------------------
+# Messung: Sammelbestellung mit 500 Zeilen prüfen und speichern
+# ---------------------------
+def benchmark_bulk(args):
+    import io
+    import datenbank
+    import protokoll
+    from katalog import build_order_lookup, format_number_column
+    from sammelbestellung import read_upload, validate_upload, save_upload
+
+    products = synthetic_products(args.rows)
+    products["actual Stock"] = 1000
+    lookup = build_order_lookup(products)
+    lines = products.sample(500, random_state=1)
+    upload_frame = pd.DataFrame({"SAP Nummer": lines["SAP Number"], "Anzahl": lines["Qty 1"]})
+    csv_data = upload_frame.to_csv(index=False, sep=";").encode("utf-8")
+    excel_buffer = io.BytesIO()
+    upload_frame.to_excel(excel_buffer, index=False)
+    excel_data = excel_buffer.getvalue()
+
+    # Zum Vergleich: jede Zeile einzeln im Katalog suchen
+    def per_row():
+        upload = read_upload(csv_data, "upload.csv")
+        sap_numbers = format_number_column(products["SAP Number"])
+        errors = []
+        for sap_number, quantity in zip(upload["SAP Nummer"], upload["Anzahl"]):
+            match = products[sap_numbers == sap_number]
+            if match.empty:
+                errors.append("unknown")
+            elif match["actual Stock"].iloc[0] == 0:
+                errors.append("out_of_stock")
+            elif float(quantity) not in match[["Qty 1", "Qty 2", "Qty 3", "Qty 4"]].iloc[0].tolist():
+                errors.append("not_orderable")
+            else:
+                errors.append("")
+        return errors
+
+    print(f"Katalog mit {args.rows} Produkten, Datei mit {len(upload_frame)} Zeilen")
+    print_result("  CSV lesen + Zeile für Zeile prüfen", *measure(per_row, max(args.runs // 4, 1)))
+    print_result("  CSV lesen + Join prüfen", *measure(lambda: validate_upload(read_upload(csv_data, "upload.csv"), lookup), args.runs))
+    print_result("  XLSX lesen + Join prüfen", *measure(lambda: validate_upload(read_upload(excel_data, "upload.xlsx"), lookup), args.runs))
+
+    folder = tempfile.mkdtemp(prefix="sammel-bench-")
+    try:
+        datenbank.db_path = os.path.join(folder, "bestellungen.db")
+        protokoll.log_db_path = os.path.join(folder, "merch_shop.db")
+        datenbank.get_writer()
+        preview = validate_upload(read_upload(csv_data, "upload.csv"), lookup)
+        stores = iter(range(1000, 100000))
+        print_result("  Speichern (eine Transaktion)", *measure(lambda: save_upload(preview, str(next(stores))), args.runs))
+        print_result("  Prüfen + Speichern", *measure(
+            lambda: save_upload(validate_upload(read_upload(csv_data, "upload.csv"), lookup), str(next(stores))), args.runs
+        ))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+BENCHMARKS = {
+    "katalog": benchmark_catalog,
+    "karten": benchmark_cards,
+    "suche": benchmark_search,
+    "engine": benchmark_engine,
+    "last": benchmark_load,
+    "puffer": benchmark_buffer,
+    "abfragen": benchmark_queries,
+    "monate": benchmark_partitions,
+    "export": benchmark_export,
+    "inkrementell": benchmark_incremental,
+    "matrix": benchmark_matrix,
+    "formate": benchmark_formats,
+    "summen": benchmark_totals,
+    "mails": benchmark_mails,
+    "sammel": benchmark_bulk,
+}
+
+# ---------------------------
+# Skript ausführen
+# ---------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance-Messungen für den Internal Shop")
+    parser.add_argument("messung", choices=sorted(BENCHMARKS))
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=5000, help="Anzahl Produkte für synthetische Kataloge")
+    parser.add_argument("--threads", type=int, default=110, help="Anzahl gleichzeitig bestellender Stores")
+    parser.add_argument("--orders", type=int, default=20, help="Bestellungen pro Store")
+    args = parser.parse_args()
+    BENCHMARKS[args.messung](args)
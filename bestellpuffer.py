@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy import select, insert
+from sqlalchemy.exc import OperationalError
+from datenbank import order_headers_table, run_write, insert_order_rows, utc_timestamp
+from protokoll import log_orders
+
+# ---------------------------
+# Bestellpuffer: Bestellungen sofort quittieren, gesammelt im Hintergrund speichern
+# ---------------------------
+# Die Oberfläche übergibt eine geprüfte Bestellung und erhält sofort eine Belegnummer.
+# Vor der Quittung wird die Bestellung an ein Journal angehängt (ohne fsync, übersteht also
+# einen Absturz des Prozesses). Ein Hintergrund-Thread sammelt die Bestellungen und schreibt
+# sie alle max_delay_ms bzw. alle max_batch Bestellungen in einer einzigen Transaktion
+# (Group Commit). Nach einem Neustart wird das Journal erneut eingespielt; über die
+# eindeutige Beleg_ID im Bestellkopf wird keine Bestellung doppelt gespeichert.
+#
+# Schlägt ein Block fehl, ohne dass die Datenbank gesperrt oder nicht erreichbar ist (z.B.
+# eine Journalzeile ohne Positionen), wird jede Bestellung des Blocks einzeln geschrieben.
+# Eine Bestellung, die auch allein nicht gespeichert werden kann, kommt mit der Fehlermeldung
+# in rejected_path und blockiert die übrigen nicht mehr.
+journal_path = "data/bestellungen.journal"
+rejected_path = "data/bestellungen.abgelehnt"
+
+# Sammelfenster für den Group Commit
+max_batch = int(os.environ.get("SHOP_PUFFER_MAX_BESTELLUNGEN", "200"))
+max_delay_ms = int(os.environ.get("SHOP_PUFFER_MAX_MS", "50"))
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+# ---------------------------
+# Funktion: Bestellung prüfen und in das Pufferformat bringen
+# ---------------------------
+# lines: Dictionary SAP-Nummer -> {"name": Produktname, "quantity": Anzahl} (wie im Warenkorb)
+def validate_order(store_number, lines):
+    if store_number is None or str(store_number).strip() == "":
+        raise ValueError("Storenummer fehlt")
+    if not lines:
+        raise ValueError("Bestellung ohne Positionen")
+
+    checked = []
+    for sap_number, line in lines.items():
+        quantity = line["quantity"]
+        if int(quantity) != quantity or quantity <= 0:
+            raise ValueError(f"Ungültige Anzahl für SAP Nummer {sap_number}: {quantity}")
+        checked.append({"sap_number": str(sap_number), "name": str(line["name"]), "quantity": int(quantity)})
+    return checked
+
+# ---------------------------
+# Funktion: Neue Bestellung mit Belegnummer im Pufferformat
+# ---------------------------
+def new_order(store_number, lines, store_name=None):
+    return {
+        "receipt": uuid.uuid4().hex[:12].upper(),
+        "date": datetime.now().strftime("%Y-%m-%d"),
+        "timestamp": utc_timestamp(),
+        "store_number": str(store_number),
+        "store_name": store_name,
+        "lines": validate_order(store_number, lines),
+    }
+
+# ---------------------------
+# Funktion: Gesammelte Bestellungen in einer Transaktion schreiben
+# ---------------------------
+def write_orders(conn, orders):
+    receipts = [order["receipt"] for order in orders]
+    existing = set(conn.execute(
+        select(order_headers_table.c.Beleg_ID).where(order_headers_table.c.Beleg_ID.in_(receipts))
+    ).scalars())
+
+    rows = []
+    written = []
+    for order in orders:
+        # Bereits gespeichert (z.B. Journal nach Absturz erneut eingespielt)
+        if order["receipt"] in existing:
+            continue
+        existing.add(order["receipt"])
+        # Journaleinträge von vor Schema-Version 5 haben noch keinen Zeitstempel
+        timestamp = order.get("timestamp") or utc_timestamp()
+        written.append({**order, "timestamp": timestamp})
+        result = conn.execute(insert(order_headers_table).values(
+            Datum=order["date"],
+            Storenummer=order["store_number"],
+            Positionen=len(order["lines"]),
+            Beleg_ID=order["receipt"],
+            Zeitstempel=timestamp
+        ))
+        header_id = result.inserted_primary_key[0]
+        rows.extend(
+            {
+                "Datum": order["date"],
+                "Storenummer": order["store_number"],
+                "Produktname": line["name"],
+                "SAP_Nummer": line["sap_number"],
+                "Anzahl": line["quantity"],
+                "Bestellkopf_ID": header_id,
+                "Zeitstempel": timestamp
+            }
+            for line in order["lines"]
+        )
+    insert_order_rows(conn, rows)
+    # Protokoll in derselben Transaktion, nur für neu gespeicherte Bestellungen
+    log_orders(conn, written)
+    return written
+
+# ---------------------------
+# Bestellpuffer mit Journal und Hintergrund-Schreiber
+# ---------------------------
+class OrderBuffer:
+    def __init__(self, path=journal_path, batch_size=max_batch, delay_ms=max_delay_ms, rejected=rejected_path):
+        self.path = path
+        self.rejected_path = rejected
+        self.batch_size = batch_size
+        self.delay = delay_ms / 1000
+        self.queue = queue.Queue()
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+        replayed = self._replay_journal()
+        self._journal = open(self.path, "a", encoding="utf-8")
+        if replayed:
+            print(f"Bestellpuffer: {replayed} Bestellungen aus dem Journal erneut eingespielt")
+
+        self.thread = threading.Thread(target=self._run, name="bestellpuffer", daemon=True)
+        self.thread.start()
+
+    def _replay_journal(self):
+        if not os.path.exists(self.path):
+            return 0
+        count = 0
+        complete = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Unvollständige letzte Zeile nach einem Absturz
+                    break
+                complete += len(line)
+                try:
+                    order = json.loads(line)
+                except ValueError:
+                    continue
+                self.queue.put(order)
+                count += 1
+        # Angefangene Zeile abschneiden, sonst hängt die nächste Bestellung daran an und wäre
+        # beim nächsten Einspielen ebenfalls unlesbar
+        if os.path.getsize(self.path) > complete:
+            with open(self.path, "r+b") as f:
+                f.truncate(complete)
+        self.pending = count
+        return count
+
+    # Nimmt eine Bestellung an und gibt sofort die Belegnummer zurück
+    def submit(self, store_number, lines, store_name=None):
+        order = new_order(store_number, lines, store_name)
+        with self._lock:
+            self._journal.write(json.dumps(order, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            self.pending += 1
+        self.queue.put(order)
+        return order["receipt"]
+
+    def _collect_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    # Datenbank gesperrt oder nicht erreichbar: orders bleiben im Journal und in der
+    # Warteschlange und werden später erneut versucht
+    def _retry_later(self, orders, error):
+        print(f"Bestellpuffer: Schreiben fehlgeschlagen ({error}), neuer Versuch in 1 s")
+        for order in orders:
+            self.queue.put(order)
+        time.sleep(1)
+
+    # Bestellung, die auch allein nicht gespeichert werden kann, beiseitelegen
+    def _reject(self, order, error):
+        receipt = order.get("receipt") if isinstance(order, dict) else None
+        print(f"Bestellpuffer: Bestellung {receipt} abgelehnt ({error!r}), abgelegt in {self.rejected_path}")
+        with open(self.rejected_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"zeitstempel": utc_timestamp(), "fehler": repr(error), "bestellung": order},
+                               ensure_ascii=False, default=str) + "\n")
+
+    # Nach einem fehlgeschlagenen Block jede Bestellung einzeln schreiben; gibt die Anzahl
+    # erledigter (gespeicherter oder abgelehnter) Bestellungen zurück
+    def _write_each(self, batch):
+        for position, order in enumerate(batch):
+            try:
+                run_write(lambda conn: write_orders(conn, [order]))
+            except OperationalError as e:
+                self._retry_later(batch[position:], e)
+                return position
+            except Exception as e:
+                self._reject(order, e)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                run_write(lambda conn: write_orders(conn, batch))
+                done = len(batch)
+            except OperationalError as e:
+                self._retry_later(batch, e)
+                continue
+            except Exception as e:
+                print(f"Bestellpuffer: Block mit {len(batch)} Bestellungen fehlgeschlagen ({e!r}), einzeln schreiben")
+                done = self._write_each(batch)
+
+            with self._lock:
+                self.pending -= done
+                if self.pending == 0:
+                    # Alles gespeichert: Journal leeren, damit es nicht unbegrenzt wächst
+                    self._journal.truncate(0)
+                    self._journal.seek(0)
+                    self._idle.notify_all()
+
+    # Wartet, bis alle angenommenen Bestellungen gespeichert sind
+    def flush(self, timeout=None):
+        with self._lock:
+            return self._idle.wait_for(lambda: self.pending == 0, timeout)
+
+# ---------------------------
+# Funktion: Bestellpuffer des Prozesses holen (beim ersten Aufruf starten)
+# ---------------------------
+def get_order_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = OrderBuffer()
+                # Beim regulären Beenden offene Bestellungen noch speichern
+                atexit.register(_buffer.flush, 5)
+    return _buffer
+
+# ---------------------------
+# Funktion: Bestellung sofort speichern (ohne Puffer)
+# ---------------------------
+# Für Sammelbestellungen: Bestellkopf und alle Positionen in einer Transaktion. Kehrt erst
+# zurück, wenn die Bestellung gespeichert ist; Fehler gehen an den Aufrufer.
+def save_order_now(store_number, lines, store_name=None):
+    order = new_order(store_number, lines, store_name)
+    run_write(lambda conn: write_orders(conn, [order]))
+    return order["receipt"]
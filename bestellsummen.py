@@ -0,0 +1,127 @@
+import argparse
+import sys
+from sqlalchemy import text
+from init_bestellungen_db import list_partitions, partition_name
+
+# ---------------------------
+# Vorberechnete Summen der Bestellungen
+# ---------------------------
+# Zwei Tabellen (angelegt von Migration 6 in init_bestellungen_db.py):
+#   summen_store_sap_tag: Menge und Anzahl Positionen pro Store, SAP-Nummer und Tag (UTC)
+#   summen_sap_monat:     Menge und Anzahl Positionen pro SAP-Nummer und Monat (UTC)
+# Sie werden von datenbank.insert_order_rows in derselben Transaktion nachgeführt wie die
+# Bestellpositionen selbst. Auswertungen lesen so ein paar hundert Summenzeilen statt aller
+# Bestellungen. Bestellungen werden nie geändert oder gelöscht; wer das doch tut (z.B. von
+# Hand in der Datenbank), muss danach "python bestellsummen.py --neu" ausführen.
+
+STORE_SAP_DAY_KEYS = ["Storenummer", "SAP_Nummer", "Tag"]
+SAP_MONTH_KEYS = ["SAP_Nummer", "Monat"]
+
+TOTALS_TABLES = {
+    "summen_store_sap_tag": STORE_SAP_DAY_KEYS,
+    "summen_sap_monat": SAP_MONTH_KEYS,
+}
+
+def upsert_sql(table, keys):
+    columns = ", ".join(f'"{key}"' for key in keys)
+    values = ", ".join(f":{key}" for key in keys)
+    return text(f'''
+        INSERT INTO {table} ({columns}, "Anzahl", "Positionen") VALUES ({values}, :Anzahl, :Positionen)
+        ON CONFLICT ({columns}) DO UPDATE SET
+            "Anzahl" = "Anzahl" + excluded."Anzahl",
+            "Positionen" = "Positionen" + excluded."Positionen"
+    ''')
+
+# ---------------------------
+# Funktion: Neue Bestellpositionen zu den Summen addieren
+# ---------------------------
+# records: Dictionaries wie in insert_order_rows (mit Tag und Monat). Die Positionen werden
+# zuerst in Python pro Schlüssel zusammengezählt, dann ein Upsert pro Schlüssel.
+def add_to_totals(conn, records):
+    for table, keys in TOTALS_TABLES.items():
+        totals = {}
+        for record in records:
+            key = tuple(record[name] or "" for name in keys)
+            quantity, positions = totals.get(key, (0, 0))
+            totals[key] = (quantity + (record["Anzahl"] or 0), positions + 1)
+        conn.execute(upsert_sql(table, keys), [
+            dict(zip(keys, key), Anzahl=quantity, Positionen=positions)
+            for key, (quantity, positions) in totals.items()
+        ])
+
+# ---------------------------
+# Summen direkt aus den Bestellungen (für Neuberechnung und Prüfung)
+# ---------------------------
+# Ohne Monat: alle Bestellungen und alle Summenzeilen. Mit Monat ("YYYY-MM"): nur die
+# Partition des Monats und die Summenzeilen dieses Monats.
+def month_filter(table, month):
+    if month is None:
+        return "1 = 1"
+    if "Monat" in TOTALS_TABLES[table]:
+        return '"Monat" = :month'
+    return 'substr("Tag", 1, 7) = :month'
+
+def totals_query(conn, table, month=None):
+    source = "bestellungen"
+    if month is not None:
+        source = f'"{partition_name(month)}"'
+        if partition_name(month) not in list_partitions(conn):
+            source = "(SELECT * FROM bestellungen WHERE 0)"
+    keys = TOTALS_TABLES[table]
+    key_columns = ", ".join(f'COALESCE("{key}", \'\')' for key in keys)
+    return (f'SELECT {key_columns}, COALESCE(SUM("Anzahl"), 0), COUNT(*) FROM {source} '
+            f'GROUP BY {", ".join(str(index) for index in range(1, len(keys) + 1))}')
+
+# ---------------------------
+# Funktion: Summen aus den Bestellungen neu berechnen
+# ---------------------------
+def rebuild_totals(conn, month=None):
+    params = {"month": month}
+    for table, keys in TOTALS_TABLES.items():
+        columns = ", ".join(f'"{key}"' for key in keys)
+        conn.execute(text(f'DELETE FROM {table} WHERE {month_filter(table, month)}'), params)
+        conn.execute(text(
+            f'INSERT INTO {table} ({columns}, "Anzahl", "Positionen") {totals_query(conn, table, month)}'
+        ))
+
+# ---------------------------
+# Funktion: Summen mit den Bestellungen vergleichen
+# ---------------------------
+# Gibt eine Liste (Tabelle, Schlüssel, erwartet, gespeichert) mit allen Abweichungen zurück;
+# erwartet/gespeichert sind (Menge, Positionen) oder None, wenn die Zeile fehlt.
+def check_totals(conn, month=None):
+    differences = []
+    for table, keys in TOTALS_TABLES.items():
+        columns = ", ".join(f'"{key}"' for key in keys)
+        stored_sql = f'SELECT {columns}, "Anzahl", "Positionen" FROM {table} WHERE {month_filter(table, month)}'
+        expected = {tuple(row[:-2]): tuple(row[-2:]) for row in conn.execute(text(totals_query(conn, table, month)))}
+        stored = {tuple(row[:-2]): tuple(row[-2:]) for row in conn.execute(text(stored_sql), {"month": month})}
+        for key in sorted(expected.keys() | stored.keys()):
+            if expected.get(key) != stored.get(key):
+                differences.append((table, key, expected.get(key), stored.get(key)))
+    return differences
+
+# ---------------------------
+# Skript ausführen
+# ---------------------------
+if __name__ == "__main__":
+    from datenbank import get_engine, get_read_engine, run_write
+
+    parser = argparse.ArgumentParser(description="Vorberechnete Bestellsummen prüfen und neu berechnen")
+    parser.add_argument("--monat", help="nur diesen Monat (YYYY-MM, UTC)")
+    parser.add_argument("--neu", action="store_true", help="Summen aus den Bestellungen neu berechnen")
+    args = parser.parse_args()
+
+    get_engine()  # Schema auf den neusten Stand bringen
+    if args.neu:
+        run_write(lambda conn: rebuild_totals(conn, args.monat))
+        print("Summen neu berechnet" + (f" für {args.monat}." if args.monat else "."))
+
+    with get_read_engine().connect() as conn:
+        differences = check_totals(conn, args.monat)
+    for table, key, expected, stored in differences[:50]:
+        print(f"{table} {key}: erwartet {expected}, gespeichert {stored}")
+    if differences:
+        print(f"{len(differences)} Abweichungen gefunden. Mit --neu neu berechnen.")
+        sys.exit(1)
+    print("Summen stimmen mit den Bestellungen überein.")
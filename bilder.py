@@ -0,0 +1,242 @@
+import os
+import hashlib
+import threading
+import time
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image, ImageOps, features
+
+# ---------------------------
+# Pfade und Grössen der Vorschaubilder
+# ---------------------------
+static_folder = "static"
+thumb_folder = "cache/bilder"
+
+# Anzeigegrösse im Shop (150px) und doppelte Auflösung für hochauflösende Bildschirme
+THUMB_SIZES = (150, 300)
+
+# WebP ist deutlich kleiner als PNG; falls Pillow ohne WebP gebaut wurde, PNG verwenden
+THUMB_FORMAT = "WEBP" if features.check("webp") else "PNG"
+THUMB_EXTENSION = ".webp" if THUMB_FORMAT == "WEBP" else ".png"
+
+# ---------------------------
+# Funktion: Inhalts-Hash einer Datei berechnen
+# ---------------------------
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+# ---------------------------
+# Funktion: Dateiname eines Vorschaubildes
+# ---------------------------
+# Der Inhalts-Hash steckt im Namen: ändert sich das Original, entsteht ein neuer Name,
+# unveränderte Bilder werden nie neu berechnet.
+def thumbnail_name(image_name, content_hash, size):
+    stem = os.path.splitext(image_name)[0]
+    return f"{stem}-{content_hash}-{size}{THUMB_EXTENSION}"
+
+# ---------------------------
+# Funktion: Vorschaubilder für ein Originalbild erzeugen
+# ---------------------------
+def render_thumbnails(source_path, targets):
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+        for size, target_path in targets.items():
+            # Wie "object-fit: cover" im CSS: quadratisch zuschneiden statt verzerren
+            thumb = ImageOps.fit(img, (size, size), Image.LANCZOS)
+            tmp_path = target_path + ".tmp"
+            if THUMB_FORMAT == "WEBP":
+                thumb.save(tmp_path, THUMB_FORMAT, quality=80)
+            else:
+                thumb.save(tmp_path, THUMB_FORMAT, optimize=True)
+            os.replace(tmp_path, target_path)
+
+# ---------------------------
+# Funktion: Bilder in static/ auflisten (nur Grösse und Änderungszeit, ohne Inhalt zu lesen)
+# ---------------------------
+def scan_images(source_folder=static_folder):
+    images = {}
+    for entry in os.scandir(source_folder):
+        if entry.is_file() and entry.name.lower().endswith(".png"):
+            stat = entry.stat()
+            images[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return images
+
+# ---------------------------
+# Funktion: Bild-Manifest aufbauen
+# ---------------------------
+# Gibt ein Dictionary Bildname -> Eintrag mit Grösse, Änderungszeit, Inhalts-Hash,
+# Abmessungen und Pfaden der Vorschaubilder zurück. Einträge aus einem früheren Manifest
+# werden übernommen, solange Grösse und Änderungszeit gleich sind; nur neue oder ersetzte
+# Bilder werden gehasht und neu berechnet.
+def build_manifest(source_folder=static_folder, cache_folder=thumb_folder, previous=None):
+    os.makedirs(cache_folder, exist_ok=True)
+    previous = previous or {}
+
+    manifest = {}
+    created = 0
+    for name, (size, mtime) in sorted(scan_images(source_folder).items()):
+        entry = previous.get(name)
+        if (entry and entry["size"] == size and entry["mtime"] == mtime
+                and all(os.path.exists(path) for path in entry["thumbnails"].values())):
+            manifest[name] = entry
+            continue
+
+        source_path = os.path.join(source_folder, name)
+        try:
+            content_hash = file_hash(source_path)
+            with Image.open(source_path) as img:
+                width, height = img.size
+            targets = {
+                thumb_size: os.path.join(cache_folder, thumbnail_name(name, content_hash, thumb_size))
+                for thumb_size in THUMB_SIZES
+            }
+            missing = {thumb_size: path for thumb_size, path in targets.items() if not os.path.exists(path)}
+            if missing:
+                render_thumbnails(source_path, missing)
+                created += len(missing)
+        except OSError as e:
+            print(f"Vorschaubild konnte nicht erstellt werden: {name} ({e})")
+            continue
+
+        manifest[name] = {
+            "size": size,
+            "mtime": mtime,
+            "hash": content_hash,
+            "width": width,
+            "height": height,
+            "thumbnails": targets,
+        }
+
+    # Veraltete Vorschaubilder (Original ersetzt oder gelöscht) entfernen
+    current = {os.path.basename(path) for entry in manifest.values() for path in entry["thumbnails"].values()}
+    for entry in os.scandir(cache_folder):
+        if entry.is_file() and entry.name not in current:
+            os.remove(entry.path)
+
+    if created:
+        print(f"{created} Vorschaubilder erstellt in {cache_folder}")
+    return manifest
+
+# ---------------------------
+# Bild-Manifest mit Verzeichnisüberwachung
+# ---------------------------
+# Wird einmal pro Prozess erstellt und von allen Sessions geteilt. Ein Hintergrund-Thread
+# prüft static/ in regelmässigen Abständen und ersetzt das Manifest als Ganzes, sobald
+# Bilder hinzukommen, ersetzt oder gelöscht werden. Leser sehen so immer ein vollständiges
+# Manifest (Zuweisung einer Referenz ist atomar).
+class ImageManifest:
+    def __init__(self, source_folder=static_folder, cache_folder=thumb_folder):
+        self.source_folder = source_folder
+        self.cache_folder = cache_folder
+        self.version = 0
+        self._lock = threading.Lock()
+        self._signature = None
+        self.images = {}
+        self.refresh()
+
+    def refresh(self):
+        with self._lock:
+            signature = scan_images(self.source_folder)
+            if signature == self._signature:
+                return False
+            self.images = build_manifest(self.source_folder, self.cache_folder, previous=self.images)
+            self._signature = signature
+            self.version += 1
+            return True
+
+    def get(self, image_name):
+        return self.images.get(image_name)
+
+    def missing(self, image_names):
+        images = self.images
+        return sorted({str(name) for name in image_names if str(name) not in images})
+
+    def start_watcher(self, interval=5.0):
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.refresh():
+                        print(f"Bild-Manifest aktualisiert ({len(self.images)} Bilder)")
+                except OSError as e:
+                    print(f"Bild-Manifest konnte nicht aktualisiert werden: {e}")
+
+        thread = threading.Thread(target=watch, name="bildmanifest", daemon=True)
+        thread.start()
+        return thread
+
+# ---------------------------
+# Bildserver: liefert die Vorschaubilder per URL mit HTTP-Caching aus
+# ---------------------------
+# Die Dateinamen enthalten den Inhalts-Hash und ändern sich nie, deshalb dürfen Browser
+# sie unbegrenzt cachen ("immutable"). Nach dem ersten Laden kommt bei jedem Rerun nur
+# noch das <img>-Tag über den Websocket.
+MIME_TYPES = {".webp": "image/webp", ".png": "image/png"}
+
+class ThumbnailRequestHandler(BaseHTTPRequestHandler):
+    cache_folder = thumb_folder
+
+    def do_GET(self):
+        self.send_thumbnail(with_body=True)
+
+    def do_HEAD(self):
+        self.send_thumbnail(with_body=False)
+
+    def send_thumbnail(self, with_body):
+        # Nur flache Dateinamen aus dem Cache-Ordner zulassen (kein "../")
+        file_name = os.path.basename(self.path.split("?", 1)[0])
+        extension = os.path.splitext(file_name)[1].lower()
+        file_path = os.path.join(self.cache_folder, file_name)
+        if extension not in MIME_TYPES or not os.path.isfile(file_path):
+            self.send_error(404, "Bild nicht gefunden")
+            return
+
+        etag = f'"{os.path.splitext(file_name)[0]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_cache_headers(etag)
+            self.end_headers()
+            return
+
+        with open(file_path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", MIME_TYPES[extension])
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Last-Modified", formatdate(os.path.getmtime(file_path), usegmt=True))
+        self.send_cache_headers(etag)
+        self.end_headers()
+        if with_body:
+            self.wfile.write(data)
+
+    def send_cache_headers(self, etag):
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+
+    def log_message(self, format, *args):
+        # Kein Log pro Bildabruf in der Streamlit-Konsole
+        pass
+
+# ---------------------------
+# Funktion: Bildserver im Hintergrund starten
+# ---------------------------
+def start_image_server(host="0.0.0.0", port=8502, cache_folder=thumb_folder):
+    handler = type("ShopThumbnailHandler", (ThumbnailRequestHandler,), {"cache_folder": cache_folder})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="bildserver", daemon=True)
+    thread.start()
+    return server
+
+# ---------------------------
+# Skript ausführen
+# ---------------------------
+if __name__ == "__main__":
+    result = build_manifest()
+    print(f"{len(result)} Bilder verarbeitet.")
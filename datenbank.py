@@ -0,0 +1,343 @@
+import os
+import time
+import queue
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import Future
+from sqlalchemy import create_engine, event, Table, Column, Integer, String, MetaData, insert, text
+from init_bestellungen_db import migrate, ensure_partition, list_partitions, partition_name, ORDER_COLUMNS
+from bestellsummen import add_to_totals
+
+# ---------------------------
+# Datenbank: eine Engine pro Prozess, Schema einmal beim Start
+# ---------------------------
+# Streamlit führt mein_app.py bei jeder Interaktion komplett neu aus, importierte Module
+# bleiben aber im Prozess geladen. Engine, Verbindungspool und Tabellen-Definitionen leben
+# deshalb hier und werden nur beim ersten Aufruf von get_engine() erstellt; alle Sessions
+# teilen sich danach denselben Pool.
+db_path = "data/bestellungen.db"
+
+# ---------------------------
+# Speicherprofile für data/bestellungen.db
+# ---------------------------
+# Auswahl über die Umgebungsvariable SHOP_DB_PROFIL.
+#  - "wal":       WAL-Journal (Leser blockieren den Schreiber nicht und umgekehrt),
+#                 synchronous=NORMAL (im WAL-Modus konsistent, bei Stromausfall gehen höchstens
+#                 die letzten Commits verloren)
+#  - "wal_full":  wie "wal", aber fsync bei jedem Commit
+#  - "klassisch": Rollback-Journal wie vor der Umstellung (zum Vergleich)
+STORAGE_PROFILES = {
+    "wal": {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000},
+    "wal_full": {"journal_mode": "WAL", "synchronous": "FULL", "busy_timeout": 5000},
+    "klassisch": {"journal_mode": "DELETE", "synchronous": "FULL", "busy_timeout": 5000},
+}
+storage_profile = os.environ.get("SHOP_DB_PROFIL", "wal")
+
+# Anzahl gleichzeitiger Nur-Lese-Verbindungen im Pool
+reader_pool_size = int(os.environ.get("SHOP_DB_LESER", "5"))
+
+# Datenbankstruktur definieren
+meta = MetaData()
+
+# View "bestellungen" über alle Monatspartitionen (nur lesen, geschrieben wird mit
+# insert_order_rows direkt in die Partition des Monats)
+orders_table = Table(
+    'bestellungen', meta,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('Datum', String),
+    Column('Storenummer', String),
+    Column('Produktname', String),
+    Column('SAP_Nummer', String),
+    Column('Anzahl', Integer),
+    Column('Bestellkopf_ID', Integer),
+    Column('Zeitstempel', Integer),
+    Column('Tag', String),
+    Column('Monat', String)
+)
+
+# Tabelle "bestellkoepfe" definieren (eine Zeile pro Warenkorb-Bestellung)
+order_headers_table = Table(
+    'bestellkoepfe', meta,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('Datum', String),
+    Column('Storenummer', String),
+    Column('Positionen', Integer),
+    Column('Beleg_ID', String),
+    Column('Zeitstempel', Integer)
+)
+
+_engine = None
+_read_engine = None
+_writer = None
+_engine_lock = threading.Lock()
+
+# ---------------------------
+# Funktion: PRAGMAs des Speicherprofils auf jede neue Verbindung anwenden
+# ---------------------------
+def apply_storage_profile(engine, profile=None, read_only=False):
+    settings = STORAGE_PROFILES[profile or storage_profile]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout={int(settings['busy_timeout'])}")
+        if not read_only:
+            # Der Journal-Modus wird in der Datei gespeichert und gilt danach für alle Verbindungen
+            cursor.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+            cursor.execute(f"PRAGMA synchronous={settings['synchronous']}")
+        cursor.close()
+
+    return engine
+
+# ---------------------------
+# Funktion: Schema auf den neusten Stand bringen
+# ---------------------------
+# Die Tabellen-Definitionen oben dienen nur für Abfragen; angelegt und geändert wird das
+# Schema ausschliesslich über die versionierten Migrationen in init_bestellungen_db.py.
+def bootstrap_schema(engine):
+    migrate(engine)
+
+# ---------------------------
+# Funktion: Bestellprotokoll (merch_shop.db) an jede Schreibverbindung anhängen
+# ---------------------------
+# Damit schreibt bestellpuffer.write_orders die Protokollzeilen in derselben Transaktion wie
+# die Bestellung. Im WAL-Modus ist der Commit pro Datei atomar, nicht über beide Dateien:
+# bei einem Absturz genau zwischen den beiden Commits kann die Protokollzeile fehlen.
+def attach_log_database(engine, profile=None):
+    settings = STORAGE_PROFILES[profile or storage_profile]
+
+    @event.listens_for(engine, "connect")
+    def attach(dbapi_connection, connection_record):
+        # Erst hier importieren: protokoll importiert selbst aus diesem Modul
+        from protokoll import log_db_path, LOG_SCHEMA
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"ATTACH DATABASE ? AS {LOG_SCHEMA}", (log_db_path,))
+        cursor.execute(f"PRAGMA {LOG_SCHEMA}.journal_mode={settings['journal_mode']}")
+        cursor.execute(f"PRAGMA {LOG_SCHEMA}.synchronous={settings['synchronous']}")
+        cursor.close()
+
+    return engine
+
+# ---------------------------
+# Funktion: Engine des Prozesses holen (beim ersten Aufruf erstellen)
+# ---------------------------
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = attach_log_database(apply_storage_profile(create_engine(f"sqlite:///{db_path}")))
+                bootstrap_schema(engine)
+                from protokoll import LOG_SCHEMA, ensure_log_table
+                with engine.begin() as conn:
+                    ensure_log_table(conn, LOG_SCHEMA)
+                _engine = engine
+    return _engine
+
+# ---------------------------
+# Funktion: Engine mit Nur-Lese-Verbindungen (Pool für Anzeigen und Exporte)
+# ---------------------------
+def get_read_engine():
+    global _read_engine
+    if _read_engine is None:
+        get_engine()  # Datei und Schema müssen existieren, bevor read-only geöffnet wird
+        with _engine_lock:
+            if _read_engine is None:
+                engine = create_engine(
+                    f"sqlite:///file:{db_path}?mode=ro&uri=true",
+                    pool_size=reader_pool_size,
+                    max_overflow=reader_pool_size
+                )
+                _read_engine = apply_storage_profile(engine, read_only=True)
+    return _read_engine
+
+# ---------------------------
+# Schreib-Thread: alle Schreibzugriffe nacheinander über eine einzige Verbindung
+# ---------------------------
+# SQLite erlaubt ohnehin nur einen Schreiber gleichzeitig. Statt dass viele Sessions um die
+# Schreibsperre konkurrieren (und nach Ablauf des busy_timeout "database is locked" melden),
+# stellen sie ihre Arbeit in eine Warteschlange. Der Thread führt jede Aufgabe in einer eigenen
+# Transaktion aus und liefert das Ergebnis über ein Future zurück.
+class SerializedWriter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="db-schreiber", daemon=True)
+        self.thread.start()
+
+    def submit(self, work):
+        future = Future()
+        self.queue.put((work, future))
+        return future
+
+    def _run(self):
+        while True:
+            try:
+                with self.engine.connect() as conn:
+                    while True:
+                        work, future = self.queue.get()
+                        if not future.set_running_or_notify_cancel():
+                            continue
+                        try:
+                            with conn.begin():
+                                result = work(conn)
+                        except Exception as e:
+                            future.set_exception(e)
+                        else:
+                            future.set_result(result)
+            except Exception as e:
+                # Verbindung verloren: nach einer Sekunde neu verbinden und weiterarbeiten
+                print(f"Schreib-Thread: Verbindung verloren ({e}), neuer Versuch in 1 s")
+                time.sleep(1)
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        engine = get_engine()
+        with _engine_lock:
+            if _writer is None:
+                _writer = SerializedWriter(engine)
+    return _writer
+
+# Führt work(conn) im Schreib-Thread aus und wartet auf das Ergebnis
+def run_write(work):
+    return get_writer().submit(work).result()
+
+# ---------------------------
+# Funktionen: Zeitstempel und Monate (UTC)
+# ---------------------------
+def utc_timestamp():
+    return int(time.time())
+
+def utc_month(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m")
+
+def utc_day(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+# Erster und letzter Zeitstempel (exklusiv) eines Monats "YYYY-MM"
+def month_bounds(month):
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+# ---------------------------
+# Funktion: Bestellpositionen in die Monatspartitionen schreiben
+# ---------------------------
+# rows: Dictionaries mit Datum, Storenummer, Produktname, SAP_Nummer, Anzahl und optional
+# Bestellkopf_ID und Zeitstempel (sonst jetzt). IDs kommen aus bestell_sequenz, damit sie
+# über alle Partitionen eindeutig und aufsteigend bleiben. Muss innerhalb einer
+# Schreibtransaktion aufgerufen werden; alle Schreibzugriffe auf Bestellpositionen laufen
+# hier durch, damit die Summen in bestellsummen.py stimmen.
+def insert_order_rows(conn, rows):
+    if not rows:
+        return []
+
+    now = utc_timestamp()
+    conn.execute(text("UPDATE bestell_sequenz SET wert = wert + :count WHERE name = 'bestellungen'"), {"count": len(rows)})
+    last_id = conn.execute(text("SELECT wert FROM bestell_sequenz WHERE name = 'bestellungen'")).scalar()
+    first_id = last_id - len(rows) + 1
+
+    by_month = {}
+    ids = []
+    for offset, row in enumerate(rows):
+        timestamp = row.get("Zeitstempel") or now
+        record = {
+            "id": first_id + offset,
+            "Datum": row.get("Datum"),
+            "Storenummer": row.get("Storenummer"),
+            "Produktname": row.get("Produktname"),
+            "SAP_Nummer": row.get("SAP_Nummer"),
+            "Anzahl": row.get("Anzahl"),
+            "Bestellkopf_ID": row.get("Bestellkopf_ID"),
+            "Zeitstempel": timestamp,
+            "Tag": utc_day(timestamp),
+            "Monat": utc_month(timestamp),
+        }
+        by_month.setdefault(record["Monat"], []).append(record)
+        ids.append(record["id"])
+
+    columns = [name for name, _ in ORDER_COLUMNS]
+    column_list = ", ".join(f'"{name}"' for name in columns)
+    value_list = ", ".join(f":{name}" for name in columns)
+    for month, records in by_month.items():
+        ensure_partition(conn, month)
+        conn.execute(text(f'INSERT INTO "{partition_name(month)}" ({column_list}) VALUES ({value_list})'), records)
+    # Vorberechnete Summen in derselben Transaktion nachführen
+    add_to_totals(conn, [record for records in by_month.values() for record in records])
+    return ids
+
+# ---------------------------
+# Funktion: Partitionen, die einen Zeitraum abdecken (ältester Monat zuerst)
+# ---------------------------
+def order_partitions(conn, start_timestamp=None, end_timestamp=None):
+    first_month = utc_month(start_timestamp) if start_timestamp is not None else None
+    last_month = utc_month(end_timestamp - 1) if end_timestamp is not None else None
+    return [
+        table for table in list_partitions(conn)
+        if (first_month is None or table >= partition_name(first_month))
+        and (last_month is None or table <= partition_name(last_month))
+    ]
+
+# ---------------------------
+# Funktion: Quelle für Abfragen über einen Zeitraum
+# ---------------------------
+# Gibt einen FROM-Ausdruck zurück, der nur die Partitionen der betroffenen Monate enthält,
+# z.B. für "diesen Monat" nur die aktuelle Partition. Ohne Zeitraum: die View über alles.
+# Der Zeitraum selbst muss in der WHERE-Bedingung der Abfrage zusätzlich stehen.
+def orders_source(conn, start_timestamp=None, end_timestamp=None):
+    if start_timestamp is None and end_timestamp is None:
+        return "bestellungen"
+
+    tables = order_partitions(conn, start_timestamp, end_timestamp)
+    if not tables:
+        # Leere Abfrage mit den richtigen Spalten
+        return "(SELECT * FROM bestellungen WHERE 0)"
+    if len(tables) == 1:
+        return f'"{tables[0]}"'
+    return "(" + " UNION ALL ".join(f'SELECT * FROM "{table}"' for table in tables) + ")"
+
+# ---------------------------
+# Funktion: Bestellung speichern
+# ---------------------------
+def save_order(store_number, sap_number, product_name, quantity):
+    row = {
+        "Datum": datetime.now().strftime("%Y-%m-%d"),
+        "Storenummer": store_number,
+        "Produktname": product_name,
+        "SAP_Nummer": sap_number,
+        "Anzahl": quantity
+    }
+    run_write(lambda conn: insert_order_rows(conn, [row]))
+
+# ---------------------------
+# Funktion: Warenkorb als eine Bestellung speichern
+# ---------------------------
+# Ein Bestellkopf und alle Positionen in einer einzigen Transaktion (executemany),
+# also ein Commit pro Bestellung statt einer pro Position.
+def save_cart_order(store_number, lines):
+    def write(conn):
+        order_date = datetime.now().strftime("%Y-%m-%d")
+        timestamp = utc_timestamp()
+        result = conn.execute(insert(order_headers_table).values(
+            Datum=order_date,
+            Storenummer=store_number,
+            Positionen=len(lines),
+            Zeitstempel=timestamp
+        ))
+        order_id = result.inserted_primary_key[0]
+        insert_order_rows(conn, [
+            {
+                "Datum": order_date,
+                "Storenummer": store_number,
+                "Produktname": line["name"],
+                "SAP_Nummer": sap_number,
+                "Anzahl": line["quantity"],
+                "Bestellkopf_ID": order_id,
+                "Zeitstempel": timestamp
+            }
+            for sap_number, line in lines.items()
+        ])
+        return order_id
+
+    return run_write(write)
@@ -1,39 +1,687 @@
-import pandas as pd
-from sqlalchemy import create_engine
+import argparse
+import csv
+import io
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from sqlalchemy import text, bindparam
+from datenbank import get_read_engine, order_partitions
+from init_bestellungen_db import ORDER_COLUMNS
 
-# Verbindet sich mit der SQLite-Datenbank
-db_path = "data/bestellungen.db"
-engine = create_engine(f"sqlite:///{db_path}")
+# ---------------------------
+# Export der Bestellungen als Excel und CSV
+# ---------------------------
+# Die Bestellungen werden nicht als Ganzes in ein DataFrame geladen, sondern in Blöcken von
+# BATCH_SIZE Zeilen gelesen (Keyset-Paginierung über die id, Partition für Partition) und
+# sofort in die Dateien geschrieben. Der Speicherbedarf hängt so nur von der Blockgrösse ab,
+# nicht von der Anzahl Bestellungen.
+
+csv_file = "export_bestellungen.csv"
+excel_file = "export_bestellungen.xlsx"
+
+# Spaltenformate für die Auswertung (BI): Parquet-Datei bzw. Arrow-IPC-Stream, und ein
+# inkrementell wachsender Parquet-Ordner mit einem Unterordner pro Monat
+parquet_file = "export_bestellungen.parquet"
+arrow_file = "export_bestellungen.arrows"
+parquet_folder = "export_bestellungen_parquet"
+FORMATS = ["xlsx", "csv", "parquet", "arrow"]
+
+# Bestellmatrix (Stores × SAP-Nummern) wie früher in data/bestellungen.xlsx
+matrix_csv_file = "export_bestellmatrix.csv"
+matrix_excel_file = "export_bestellmatrix.xlsx"
+
+# Inkrementeller Export: eine Excel-Datei pro Bestelltag (UTC) in diesem Ordner
+parts_folder = "export_bestellungen_teile"
+PARTS_KEEP_DAYS = 90
+
+BATCH_SIZE = 5000
+EXPORT_COLUMNS = [name for name, _ in ORDER_COLUMNS]
+
+ID_INDEX = EXPORT_COLUMNS.index("id")
+TIMESTAMP_INDEX = EXPORT_COLUMNS.index("Zeitstempel")
+DAY_INDEX = EXPORT_COLUMNS.index("Tag")
+MONTH_INDEX = EXPORT_COLUMNS.index("Monat")
+
+# Datentypen im Parquet/Arrow-Export. Texte mit wenigen verschiedenen Werten (Stores,
+# Produkte, SAP-Nummern, Monate) als Dictionary, damit BI-Werkzeuge sie als Kategorien lesen.
+ARROW_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("Datum", pa.date32()),
+    ("Storenummer", pa.dictionary(pa.int32(), pa.string())),
+    ("Produktname", pa.dictionary(pa.int32(), pa.string())),
+    ("SAP_Nummer", pa.dictionary(pa.int32(), pa.string())),
+    ("Anzahl", pa.int32()),
+    ("Bestellkopf_ID", pa.int64()),
+    ("Zeitstempel", pa.timestamp("s", tz="UTC")),
+    ("Tag", pa.date32()),
+    ("Monat", pa.dictionary(pa.int32(), pa.string())),
+])
+PARQUET_ROW_GROUP_ROWS = 250000
+
+# Mehr Zeilen passen nicht auf ein Excel-Blatt (inklusive Kopfzeile)
+EXCEL_MAX_ROWS = 1048576
+
+# ---------------------------
+# Funktion: Datum "YYYY-MM-DD" in UTC-Zeitstempel umrechnen
+# ---------------------------
+# end_date ist inklusive: gibt den Beginn des Folgetags zurück
+def date_to_timestamp(value, end_of_day=False):
+    day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    if end_of_day:
+        day += timedelta(days=1)
+    return int(day.timestamp())
+
+# ---------------------------
+# Funktion: WHERE-Bedingungen für Zeitraum und Stores
+# ---------------------------
+# Gibt die Bedingungen, ihre Parameter und den Zeitraum als UTC-Zeitstempel zurück
+def order_filters(start_date=None, end_date=None, stores=None):
+    start_timestamp = date_to_timestamp(start_date) if start_date else None
+    end_timestamp = date_to_timestamp(end_date, end_of_day=True) if end_date else None
+
+    conditions = []
+    params = {}
+    if start_timestamp is not None:
+        conditions.append('"Zeitstempel" >= :start')
+        params["start"] = start_timestamp
+    if end_timestamp is not None:
+        conditions.append('"Zeitstempel" < :end')
+        params["end"] = end_timestamp
+    if stores:
+        conditions.append('"Storenummer" IN :stores')
+        params["stores"] = [str(store) for store in stores]
+    return conditions, params, start_timestamp, end_timestamp
+
+def filtered_query(sql, stores):
+    query = text(sql)
+    if stores:
+        query = query.bindparams(bindparam("stores", expanding=True))
+    return query
+
+# ---------------------------
+# Funktion: Alle Abfragen eines Exports aus demselben Datenbankstand lesen
+# ---------------------------
+# Ohne Transaktion liest jede Abfrage den jeweils neusten Stand. Schreibt der Shop während
+# des Exports eine Bestellung in eine schon gelesene Partition (z.B. Import oder Journal mit
+# altem Zeitstempel) und danach eine in eine spätere, läge die kleinere id unter dem neuen
+# Stand und würde nie exportiert. In einer Lesetransaktion sieht der Export einen Snapshot.
+@contextmanager
+def read_snapshot(engine):
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.exec_driver_sql("COMMIT")
+
+# ---------------------------
+# Funktion: Bestellungen blockweise lesen
+# ---------------------------
+# Liefert Listen von Zeilen (Tupel in der Reihenfolge von EXPORT_COLUMNS). Jeder Block ist
+# eine eigene kurze Abfrage "id > letzte id ORDER BY id LIMIT n" über den Primärschlüssel,
+# unabhängig davon, wie weit der Export schon ist.
+def iter_order_batches(conn, start_date=None, end_date=None, stores=None, after_id=0, batch_size=BATCH_SIZE):
+    conditions, params, start_timestamp, end_timestamp = order_filters(start_date, end_date, stores)
+    conditions = ['id > :last_id'] + conditions
+    params["limit"] = batch_size
 
+    column_list = ", ".join(f'"{name}"' for name in EXPORT_COLUMNS)
+    for table in order_partitions(conn, start_timestamp, end_timestamp):
+        query = filtered_query(
+            f'SELECT {column_list} FROM "{table}" WHERE {" AND ".join(conditions)} ORDER BY id LIMIT :limit',
+            stores
+        )
+
+        last_id = after_id
+        while True:
+            rows = conn.execute(query, dict(params, last_id=last_id)).fetchall()
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1][ID_INDEX]
+            if len(rows) < batch_size:
+                break
+
+# ---------------------------
+# Excel-Datei im Write-only-Modus von openpyxl
+# ---------------------------
+# Zeilen werden direkt in eine temporäre Datei geschrieben statt als Zellobjekte im Speicher
+# gehalten. Wird ein Blatt voll, geht es auf einem neuen Blatt weiter.
+class ExcelStream:
+    def __init__(self, file_path, header=EXPORT_COLUMNS, sheet_title="Bestellungen"):
+        self.file_path = file_path
+        self.header = header
+        self.sheet_title = sheet_title
+        self.workbook = Workbook(write_only=True)
+        self.sheets = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self.sheets += 1
+        title = self.sheet_title if self.sheets == 1 else f"{self.sheet_title} {self.sheets}"
+        self.sheet = self.workbook.create_sheet(title)
+        self.sheet.append(self.header)
+        self.sheet_rows = 1
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self.sheet_rows >= EXCEL_MAX_ROWS:
+                self._new_sheet()
+            self.sheet.append(list(row))
+            self.sheet_rows += 1
+
+    def save(self):
+        self.workbook.save(self.file_path)
+
+# ---------------------------
+# Funktion: Block von Bestellungen in einen Arrow-RecordBatch umwandeln
+# ---------------------------
+def record_batch(rows):
+    columns = list(zip(*rows))
+    arrays = []
+    for index, field in enumerate(ARROW_SCHEMA):
+        values = columns[index]
+        if pa.types.is_date32(field.type):
+            # Ungültige Datumstexte werden zu null statt den Export abzubrechen
+            parsed = pc.strptime(pa.array(values, pa.string()), format="%Y-%m-%d", unit="s", error_is_null=True)
+            arrays.append(parsed.cast(pa.date32()))
+        elif pa.types.is_timestamp(field.type):
+            arrays.append(pa.array(values, pa.int64()).cast(field.type))
+        elif pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=ARROW_SCHEMA)
+
+# ---------------------------
+# Parquet-Datei mit einer Row Group pro Monat
 # ---------------------------
-# Funktion: Daten aus der Tabelle "bestellungen" laden
+# Die Blöcke aus iter_order_batches stammen immer aus einer Partition, also aus einem Monat.
+# Blöcke werden gesammelt, bis der Monat wechselt (oder PARQUET_ROW_GROUP_ROWS erreicht ist),
+# und dann als eine Row Group geschrieben. Abfragen auf einen Monat lesen so nur dessen
+# Row Groups (Min/Max-Statistik der Spalte Zeitstempel).
+class ParquetStream:
+    def __init__(self, sink, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+        self.writer = pq.ParquetWriter(sink, ARROW_SCHEMA, compression="zstd")
+        self.row_group_rows = row_group_rows
+        self.pending = []
+        self.pending_rows = 0
+        self.month = None
+
+    def write_rows(self, rows):
+        month = rows[0][MONTH_INDEX]
+        if self.pending and (month != self.month or self.pending_rows >= self.row_group_rows):
+            self._flush()
+        self.month = month
+        self.pending.append(record_batch(rows))
+        self.pending_rows += len(rows)
+
+    def _flush(self):
+        table = pa.Table.from_batches(self.pending, schema=ARROW_SCHEMA)
+        self.writer.write_table(table, row_group_size=len(table))
+        self.pending = []
+        self.pending_rows = 0
+
+    def close(self):
+        if self.pending:
+            self._flush()
+        self.writer.close()
+
+# ---------------------------
+# Arrow-IPC-Stream (für Programme, die die Daten direkt als Arrow-Tabelle einlesen)
 # ---------------------------
-def load_orders():
-    query = "SELECT * FROM bestellungen"
-    df = pd.read_sql_query(query, engine)
-    return df
+# Stream- statt Dateiformat, weil sich die Dictionaries von Block zu Block unterscheiden
+class ArrowStream:
+    def __init__(self, sink):
+        self.writer = pa.ipc.new_stream(sink, ARROW_SCHEMA)
+
+    def write_rows(self, rows):
+        self.writer.write_batch(record_batch(rows))
+
+    def close(self):
+        self.writer.close()
 
 # ---------------------------
-# Funktion: Export als Excel und CSV
+# Funktion: Export als Excel, CSV, Parquet und Arrow
 # ---------------------------
-def export_orders():
-    orders_df = load_orders()
+# Geschrieben wird zuerst in .tmp-Dateien, die erst am Schluss die alten Exporte ersetzen;
+# ein abgebrochener Export hinterlässt so nie eine halbe Datei.
+def export_orders(start_date=None, end_date=None, stores=None, formats=("xlsx", "csv"),
+                  csv_path=csv_file, excel_path=excel_file, parquet_path=parquet_file, arrow_path=arrow_file,
+                  batch_size=BATCH_SIZE, engine=None):
+    engine = engine or get_read_engine()
+    csv_tmp = csv_path + ".tmp"
+    excel_tmp = excel_path + ".tmp"
+    parquet_tmp = parquet_path + ".tmp"
+    arrow_tmp = arrow_path + ".tmp"
+
+    total = 0
+    last_row = None
+    csv_handle = None
+    excel = None
+    streams = []
+    try:
+        if "csv" in formats:
+            csv_handle = open(csv_tmp, "w", newline="", encoding="utf-8")
+            csv_writer = csv.writer(csv_handle)
+            csv_writer.writerow(EXPORT_COLUMNS)
+        if "xlsx" in formats:
+            excel = ExcelStream(excel_tmp)
+        if "parquet" in formats:
+            streams.append(ParquetStream(parquet_tmp))
+        if "arrow" in formats:
+            streams.append(ArrowStream(arrow_tmp))
+
+        with read_snapshot(engine) as conn:
+            for rows in iter_order_batches(conn, start_date, end_date, stores, batch_size=batch_size):
+                if csv_handle:
+                    csv_writer.writerows(rows)
+                if excel:
+                    excel.write_rows(rows)
+                for stream in streams:
+                    stream.write_rows(rows)
+                total += len(rows)
+                if last_row is None or rows[-1][ID_INDEX] > last_row[ID_INDEX]:
+                    last_row = rows[-1]
 
-    if orders_df.empty:
+        if csv_handle:
+            csv_handle.close()
+        if excel:
+            excel.save()
+    finally:
+        if csv_handle and not csv_handle.closed:
+            csv_handle.close()
+        for stream in streams:
+            stream.close()
+
+    if not total:
+        for path in (csv_tmp, excel_tmp, parquet_tmp, arrow_tmp):
+            if os.path.exists(path):
+                os.remove(path)
         print("Keine Bestellungen in der Datenbank.")
+        return 0
+
+    if excel:
+        os.replace(excel_tmp, excel_path)
+        print(f"Excel-Datei gespeichert: {excel_path}")
+    if csv_handle:
+        os.replace(csv_tmp, csv_path)
+        print(f"CSV-Datei gespeichert: {csv_path}")
+        # Eine vollständige CSV ist der Startpunkt für den inkrementellen Export,
+        # eine gefilterte nicht
+        if start_date or end_date or stores:
+            if os.path.exists(state_file(csv_path)):
+                os.remove(state_file(csv_path))
+        else:
+            save_state(csv_path, {
+                "last_id": last_row[ID_INDEX],
+                "last_timestamp": last_row[TIMESTAMP_INDEX],
+                "csv_bytes": os.path.getsize(csv_path),
+            })
+    if "parquet" in formats:
+        os.replace(parquet_tmp, parquet_path)
+        print(f"Parquet-Datei gespeichert: {parquet_path}")
+    if "arrow" in formats:
+        os.replace(arrow_tmp, arrow_path)
+        print(f"Arrow-Datei gespeichert: {arrow_path}")
+    print(f"{total} Bestellpositionen exportiert.")
+    return total
+
+# ---------------------------
+# Funktion: Alle Bestellungen als Datei im Speicher (Download im Shop)
+# ---------------------------
+# format: "parquet", "arrow", "xlsx" oder "csv"; gelesen wird blockweise wie beim Export.
+def orders_as_bytes(format="parquet", engine=None):
+    engine = engine or get_read_engine()
+    if format in ("xlsx", "csv"):
+        buffer = io.BytesIO() if format == "xlsx" else io.StringIO()
+        excel = ExcelStream(buffer) if format == "xlsx" else None
+        csv_writer = csv.writer(buffer) if format == "csv" else None
+        if csv_writer:
+            csv_writer.writerow(EXPORT_COLUMNS)
+        with read_snapshot(engine) as conn:
+            for rows in iter_order_batches(conn):
+                if excel:
+                    excel.write_rows(rows)
+                else:
+                    csv_writer.writerows(rows)
+        if excel:
+            excel.save()
+            return buffer.getvalue()
+        return buffer.getvalue().encode("utf-8")
+
+    sink = pa.BufferOutputStream()
+    stream = ParquetStream(sink) if format == "parquet" else ArrowStream(sink)
+    try:
+        with read_snapshot(engine) as conn:
+            for rows in iter_order_batches(conn):
+                stream.write_rows(rows)
+    finally:
+        stream.close()
+    return sink.getvalue().to_pybytes()
+
+# ---------------------------
+# Stand des inkrementellen Exports
+# ---------------------------
+# Pro Ziel (CSV-Datei oder Parquet-Ordner) eine JSON-Datei daneben mit der höchsten
+# exportierten id (die IDs werden in Schreibreihenfolge vergeben, neue Bestellungen haben also
+# immer eine grössere id), deren Zeitstempel und bei der CSV der Dateigrösse nach dem letzten
+# vollständigen Lauf.
+def state_file(target_path):
+    return target_path + ".stand.json"
+
+def load_state(target_path):
+    try:
+        with open(state_file(target_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_state(target_path, state):
+    state = dict(state, exported_at=datetime.now().isoformat(timespec="seconds"))
+    tmp_path = state_file(target_path) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_file(target_path))
+
+# ---------------------------
+# Funktion: Excel-Datei eines Bestelltags neu schreiben
+# ---------------------------
+def part_path(folder, day):
+    return os.path.join(folder, f"bestellungen_{day}.xlsx")
+
+def write_day_part(conn, folder, day, batch_size=BATCH_SIZE):
+    target = part_path(folder, day)
+    excel = ExcelStream(target + ".tmp")
+    for rows in iter_order_batches(conn, day, day, batch_size=batch_size):
+        excel.write_rows(rows)
+    excel.save()
+    os.replace(target + ".tmp", target)
+    return target
+
+def oldest_kept_day(keep_days):
+    return (datetime.now(timezone.utc) - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+
+# Teile, deren Bestelltag älter als keep_days ist, löschen
+def prune_parts(folder, keep_days=PARTS_KEEP_DAYS):
+    oldest = oldest_kept_day(keep_days)
+    for entry in os.scandir(folder):
+        if entry.name.startswith("bestellungen_") and entry.name.endswith(".xlsx"):
+            if entry.name[len("bestellungen_"):-len(".xlsx")] < oldest:
+                os.remove(entry.path)
+
+# ---------------------------
+# Funktion: Inkrementeller Export
+# ---------------------------
+# Hängt nur Bestellungen mit id über dem gespeicherten Stand an die CSV an und schreibt die
+# Excel-Teile der betroffenen Bestelltage neu. Ohne neue Bestellungen kostet ein Lauf eine
+# Primärschlüssel-Abfrage pro Monatspartition. Der Stand wird erst gespeichert, wenn CSV und
+# Teile geschrieben sind; bricht ein Lauf ab, schneidet der nächste die CSV auf die letzte
+# bekannte Grösse zurück und exportiert dieselben Zeilen noch einmal.
+def export_incremental(csv_path=csv_file, parts_path=parts_folder, keep_days=PARTS_KEEP_DAYS,
+                       batch_size=BATCH_SIZE, engine=None):
+    engine = engine or get_read_engine()
+    os.makedirs(parts_path, exist_ok=True)
+
+    state = load_state(csv_path)
+    csv_size = os.path.getsize(csv_path) if os.path.exists(csv_path) else None
+    if state is None or csv_size is None or csv_size < state["csv_bytes"]:
+        if state is not None:
+            print(f"{csv_path} passt nicht zum gespeicherten Stand, Export beginnt von vorne.")
+        state = {"last_id": 0, "last_timestamp": None, "csv_bytes": 0}
+    elif csv_size > state["csv_bytes"]:
+        # Rest eines abgebrochenen Laufs entfernen
+        with open(csv_path, "r+b") as f:
+            f.truncate(state["csv_bytes"])
+
+    total = 0
+    days = set()
+    with open(csv_path, "a" if state["csv_bytes"] else "w", newline="", encoding="utf-8") as csv_handle:
+        csv_writer = csv.writer(csv_handle)
+        if not state["csv_bytes"]:
+            csv_writer.writerow(EXPORT_COLUMNS)
+
+        with read_snapshot(engine) as conn:
+            # Partitionen kommen nach Monat, nicht nach id: höchste id separat merken
+            last_row = None
+            for rows in iter_order_batches(conn, after_id=state["last_id"], batch_size=batch_size):
+                csv_writer.writerows(rows)
+                days.update(row[DAY_INDEX] for row in rows)
+                total += len(rows)
+                if last_row is None or rows[-1][ID_INDEX] > last_row[ID_INDEX]:
+                    last_row = rows[-1]
+            csv_handle.flush()
+            os.fsync(csv_handle.fileno())
+
+            oldest = oldest_kept_day(keep_days)
+            for day in sorted(days):
+                if day >= oldest:
+                    write_day_part(conn, parts_path, day, batch_size)
+
+    if last_row is not None:
+        state["last_id"] = last_row[ID_INDEX]
+        state["last_timestamp"] = last_row[TIMESTAMP_INDEX]
+    state["csv_bytes"] = os.path.getsize(csv_path)
+    save_state(csv_path, state)
+    prune_parts(parts_path, keep_days)
+
+    if total:
+        print(f"{total} neue Bestellpositionen an {csv_path} angehängt, Excel-Teile in {parts_path} aktualisiert.")
     else:
-        # Export als Excel
-        excel_file = "export_bestellungen.xlsx"
-        orders_df.to_excel(excel_file, index=False)
-        print(f"Excel-Datei gespeichert: {excel_file}")
+        print("Keine neuen Bestellungen.")
+    return total
 
-        # Export als CSV
-        csv_file = "export_bestellungen.csv"
-        orders_df.to_csv(csv_file, index=False)
-        print(f"CSV-Datei gespeichert: {csv_file}")
+# ---------------------------
+# Funktion: Inkrementeller Parquet-Export in einen Ordner
+# ---------------------------
+# Jeder Lauf schreibt die neuen Bestellungen als eine Datei pro Monat in den Unterordner des
+# Monats (z.B. 2025-06/teil-000000012001-000000012007.parquet, erste und letzte id im Namen).
+# BI-Werkzeuge lesen den ganzen Ordner als ein Dataset. Dateien, die nach dem gespeicherten
+# Stand beginnen, stammen aus einem abgebrochenen Lauf und werden vorher gelöscht.
+def export_parquet_incremental(folder=parquet_folder, batch_size=BATCH_SIZE, engine=None):
+    engine = engine or get_read_engine()
+    os.makedirs(folder, exist_ok=True)
+    state = load_state(folder) or {"last_id": 0, "last_timestamp": None}
+
+    for month_entry in os.scandir(folder):
+        if not month_entry.is_dir():
+            continue
+        for entry in os.scandir(month_entry.path):
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+            elif entry.name.startswith("teil-") and int(entry.name.split("-")[1]) > state["last_id"]:
+                os.remove(entry.path)
+
+    total = 0
+    files = 0
+    current = None  # [Monat, ParquetStream, temporärer Pfad, erste id, letzte id]
+    last_row = None
+
+    def finish(current):
+        month, stream, tmp_path, first_id, last_id = current
+        stream.close()
+        os.replace(tmp_path, os.path.join(folder, month, f"teil-{first_id:012d}-{last_id:012d}.parquet"))
+
+    try:
+        with read_snapshot(engine) as conn:
+            for rows in iter_order_batches(conn, after_id=state["last_id"], batch_size=batch_size):
+                month = rows[0][MONTH_INDEX]
+                if current is None or current[0] != month:
+                    if current is not None:
+                        finish(current)
+                    os.makedirs(os.path.join(folder, month), exist_ok=True)
+                    tmp_path = os.path.join(folder, month, f"teil-{rows[0][ID_INDEX]:012d}.parquet.tmp")
+                    current = [month, ParquetStream(tmp_path), tmp_path, rows[0][ID_INDEX], rows[0][ID_INDEX]]
+                    files += 1
+                current[1].write_rows(rows)
+                current[4] = rows[-1][ID_INDEX]
+                total += len(rows)
+                if last_row is None or rows[-1][ID_INDEX] > last_row[ID_INDEX]:
+                    last_row = rows[-1]
+        if current is not None:
+            finish(current)
+            current = None
+    finally:
+        if current is not None:
+            current[1].close()
+
+    if last_row is not None:
+        save_state(folder, {"last_id": last_row[ID_INDEX], "last_timestamp": last_row[TIMESTAMP_INDEX]})
+        print(f"{total} neue Bestellpositionen in {files} Parquet-Dateien in {folder} geschrieben.")
+    else:
+        print("Keine neuen Bestellungen.")
+    return total
+
+# ---------------------------
+# Funktion: Bestellmatrix Store × SAP-Nummer in SQLite berechnen
+# ---------------------------
+# Gibt die SAP-Nummern (Spalten) und einen Generator mit einer Zeile pro Store zurück:
+# [Storenummer, Menge SAP 1, Menge SAP 2, ...], None wenn der Store das Produkt nicht bestellt
+# hat. Summiert wird mit GROUP BY in SQLite über die Tagessummen pro Store und SAP-Nummer
+# (bestellsummen.py), nach Python kommt nur das Ergebnis (höchstens Stores × Produkte
+# Zeilen), nie die einzelnen Bestellungen. conn aus read_snapshot, damit beide Abfragen
+# denselben Stand sehen.
+def order_matrix(conn, start_date=None, end_date=None, stores=None):
+    source = "summen_store_sap_tag"
+    conditions = []
+    params = {}
+    if start_date:
+        conditions.append('"Tag" >= :start_day')
+        params["start_day"] = start_date
+    if end_date:
+        conditions.append('"Tag" <= :end_day')
+        params["end_day"] = end_date
+    if stores:
+        conditions.append('"Storenummer" IN :stores')
+        params["stores"] = [str(store) for store in stores]
+    where = " AND ".join(conditions) or "1 = 1"
+
+    sap_numbers = [row[0] for row in conn.execute(filtered_query(
+        f'SELECT DISTINCT "SAP_Nummer" FROM {source} WHERE {where} '
+        f'ORDER BY CAST("SAP_Nummer" AS INTEGER), "SAP_Nummer"',
+        stores
+    ), params)]
+    positions = {sap_number: index for index, sap_number in enumerate(sap_numbers, start=1)}
+
+    def rows():
+        result = conn.execute(filtered_query(
+            f'SELECT "Storenummer", "SAP_Nummer", SUM("Anzahl") FROM {source} WHERE {where} '
+            f'GROUP BY "Storenummer", "SAP_Nummer" '
+            f'ORDER BY CAST("Storenummer" AS INTEGER), "Storenummer"',
+            stores
+        ), params)
+        row = None
+        for store_number, sap_number, quantity in result:
+            if row is None or row[0] != store_number:
+                if row is not None:
+                    yield row
+                row = [store_number] + [None] * len(sap_numbers)
+            row[positions[sap_number]] = quantity
+        if row is not None:
+            yield row
+
+    return sap_numbers, rows()
+
+# Store- und SAP-Nummern in Excel als Zahl statt als Text (wie in der alten Matrix)
+def as_number(value):
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+# ---------------------------
+# Funktion: Bestellmatrix als Excel und CSV exportieren
+# ---------------------------
+def export_matrix(start_date=None, end_date=None, stores=None, formats=("xlsx", "csv"),
+                  csv_path=matrix_csv_file, excel_path=matrix_excel_file, engine=None):
+    engine = engine or get_read_engine()
+
+    # Spalten und Zeilen aus demselben Stand, sonst fehlt eine neu bestellte SAP-Nummer im Kopf
+    with read_snapshot(engine) as conn:
+        sap_numbers, rows = order_matrix(conn, start_date, end_date, stores)
+        if not sap_numbers:
+            print("Keine Bestellungen im gewählten Zeitraum.")
+            return 0
+
+        header = ["Storenummer"] + sap_numbers
+        csv_handle = None
+        excel = None
+        if "xlsx" in formats:
+            excel = ExcelStream(excel_path + ".tmp", [as_number(value) for value in header], "Bestellmatrix")
+        store_count = 0
+        try:
+            if "csv" in formats:
+                csv_handle = open(csv_path + ".tmp", "w", newline="", encoding="utf-8")
+                csv_writer = csv.writer(csv_handle)
+                csv_writer.writerow(header)
+            for row in rows:
+                if csv_handle:
+                    csv_writer.writerow(row)
+                if excel:
+                    excel.write_rows([[as_number(row[0])] + row[1:]])
+                store_count += 1
+        finally:
+            if csv_handle:
+                csv_handle.close()
+
+    if excel:
+        excel.save()
+        os.replace(excel_path + ".tmp", excel_path)
+        print(f"Excel-Datei gespeichert: {excel_path}")
+    if csv_handle:
+        os.replace(csv_path + ".tmp", csv_path)
+        print(f"CSV-Datei gespeichert: {csv_path}")
+    print(f"Bestellmatrix: {store_count} Stores × {len(sap_numbers)} SAP-Nummern.")
+    return store_count
 
 # ---------------------------
 # Skript ausführen
 # ---------------------------
 if __name__ == "__main__":
-    export_orders()
+    parser = argparse.ArgumentParser(description="Bestellungen als Excel und CSV exportieren")
+    parser.add_argument("--von", help="erster Tag (YYYY-MM-DD, UTC)")
+    parser.add_argument("--bis", help="letzter Tag (YYYY-MM-DD, UTC, inklusive)")
+    parser.add_argument("--store", action="append", help="nur diese Storenummer (mehrfach möglich)")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=["xlsx", "csv"])
+    parser.add_argument("--csv", help=f"Pfad der CSV-Datei (Standard: {csv_file} bzw. {matrix_csv_file})")
+    parser.add_argument("--excel", help=f"Pfad der Excel-Datei (Standard: {excel_file} bzw. {matrix_excel_file})")
+    parser.add_argument("--parquet", default=parquet_file, help="Pfad der Parquet-Datei")
+    parser.add_argument("--arrow", default=arrow_file, help="Pfad der Arrow-IPC-Datei")
+    parser.add_argument("--parquet-ordner", default=parquet_folder, help="Parquet-Ordner (inkrementell)")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="Zeilen pro Abfrage")
+    parser.add_argument("--matrix", action="store_true",
+                        help="Bestellmatrix Stores × SAP-Nummern (Summe der Mengen) statt einzelner Bestellungen")
+    parser.add_argument("--inkrementell", action="store_true",
+                        help="nur neue Bestellungen an die CSV anhängen und Excel-Teile pro Tag schreiben")
+    parser.add_argument("--teile", default=parts_folder, help="Ordner der Excel-Teile (inkrementell)")
+    parser.add_argument("--teile-tage", type=int, default=PARTS_KEEP_DAYS,
+                        help="Excel-Teile so viele Tage behalten (inkrementell)")
+    args = parser.parse_args()
+
+    try:
+        for value in (args.von, args.bis):
+            if value:
+                date_to_timestamp(value)
+    except ValueError:
+        parser.error("Datum im Format YYYY-MM-DD angeben")
+
+    if args.matrix:
+        if set(args.format) - {"xlsx", "csv"}:
+            parser.error("--matrix gibt es nur als xlsx und csv")
+        export_matrix(args.von, args.bis, args.store, args.format,
+                      args.csv or matrix_csv_file, args.excel or matrix_excel_file)
+    elif args.inkrementell:
+        if args.von or args.bis or args.store:
+            parser.error("--inkrementell exportiert immer alle Bestellungen (ohne --von/--bis/--store)")
+        if "arrow" in args.format:
+            parser.error("--inkrementell gibt es nur für csv/xlsx und parquet")
+        if "csv" in args.format or "xlsx" in args.format:
+            export_incremental(args.csv or csv_file, args.teile, args.teile_tage, args.batch)
+        if "parquet" in args.format:
+            export_parquet_incremental(args.parquet_ordner, args.batch)
+    else:
+        export_orders(args.von, args.bis, args.store, args.format,
+                      csv_path=args.csv or csv_file, excel_path=args.excel or excel_file,
+                      parquet_path=args.parquet, arrow_path=args.arrow, batch_size=args.batch)
@@ -0,0 +1,273 @@
+import os
+import argparse
+import sqlite3
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from datenbank import get_engine, run_write, insert_order_rows, orders_source
+from katalog import format_number_column
+from protokoll import local_timezone
+
+# ---------------------------
+# Import der alten Bestelldaten in die Bestelldatenbank
+# ---------------------------
+# Quellen (alle optional, fehlende Dateien werden übersprungen):
+#   data/bestellungen.xlsx   Matrix Store × SAP-Nummer (erste Spalte Store, Zelle = Menge, ohne Datum)
+#   data/order_logs.xlsx     Datum, Zeit, Storenummer, Storename, SAP Nummer, Produktname, Anzahl
+#   merch_shop.db "orders"   store_number, sap_number, product_name, quantity, timestamp
+#   merch_shop.db "logs"     wie "orders", zusätzlich store_name; Zeilen mit Beleg_ID (receipt)
+#                            hat der Shop selbst geschrieben, sie werden übersprungen (auch in
+#                            einer daraus erzeugten order_logs.xlsx)
+# Die Tabelle "bestellungen" in data/bestellungen.db selbst bringen die Migrationen beim
+# Öffnen ins aktuelle Schema; ihre Zeilen dienen hier nur zum Erkennen von Duplikaten.
+#
+# Jede Bestellung erhält einen Schlüssel aus Store, SAP-Nummer, Menge und Zeitpunkt (Sekunde).
+# Derselbe Vorgang in mehreren Quellen (z.B. "orders" und "logs") wird nur einmal importiert.
+# Bereits importierte Schlüssel stehen in der Tabelle "importe", ein zweiter Lauf fügt also
+# nichts doppelt ein. Alles wird in einer einzigen Transaktion geschrieben.
+
+matrix_path = "data/bestellungen.xlsx"
+order_logs_path = "data/order_logs.xlsx"
+legacy_db_path = "merch_shop.db"
+products_path = "data/produkte.xlsx"
+special_products_path = "data/produkte_special.xlsx"
+
+CANONICAL_COLUMNS = ["Quelle", "Storenummer", "SAP_Nummer", "Produktname", "Anzahl", "Zeitstempel"]
+CHUNK_SIZE = 5000
+
+# ---------------------------
+# Funktion: Ortszeit-Texte in UTC-Zeitstempel umrechnen (ganze Spalte)
+# ---------------------------
+def local_to_timestamp(values):
+    parsed = pd.to_datetime(values, errors="coerce")
+    # Zweideutige Stunde bei der Zeitumstellung im Herbst: Winterzeit annehmen
+    localized = parsed.dt.tz_localize(local_timezone, ambiguous=np.zeros(len(parsed), dtype=bool),
+                                      nonexistent="shift_forward")
+    # Unabhängig von der Auflösung (ns/us/s), die pandas für die Spalte gewählt hat
+    return ((localized - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).where(parsed.notna())
+
+# ---------------------------
+# Funktionen: Quellen lesen und auf gemeinsame Spalten bringen
+# ---------------------------
+def normalize(df, source, store, sap, name, quantity, timestamp):
+    result = pd.DataFrame({
+        "Quelle": source,
+        "Storenummer": format_number_column(store),
+        "SAP_Nummer": format_number_column(sap),
+        "Produktname": name.astype(object).where(name.notna(), None) if name is not None else None,
+        "Anzahl": pd.to_numeric(quantity, errors="coerce"),
+        "Zeitstempel": timestamp,
+    }, index=df.index)
+    return result[CANONICAL_COLUMNS]
+
+# shop_keys: vom Shop geschriebene Protokollzeilen (shop_log_keys); eine aus dem Protokoll
+# erzeugte order_logs.xlsx enthält sie ebenfalls, sie stehen aber schon in der Bestelldatenbank
+def read_order_logs(path, shop_keys=frozenset()):
+    df = pd.read_excel(path)
+    df = df[~text_keys(df["Storenummer"], df["SAP Nummer"], df["Anzahl"],
+                       df["Datum"].astype(str) + " " + df["Zeit"].astype(str)).isin(shop_keys)]
+    timestamp = local_to_timestamp(df["Datum"].astype(str) + " " + df["Zeit"].astype(str))
+    return normalize(df, "order_logs.xlsx", df["Storenummer"], df["SAP Nummer"], df["Produktname"],
+                     df["Anzahl"], timestamp)
+
+def read_legacy_table(path, table):
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        if not exists:
+            return pd.DataFrame(columns=CANONICAL_COLUMNS)
+        df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+    if "receipt" in df.columns:
+        # Vom Shop selbst geschrieben (protokoll.log_orders): steht schon in der Bestelldatenbank
+        df = df[df["receipt"].isna()]
+    return normalize(df, f"merch_shop.db/{table}", df["store_number"], df["sap_number"], df["product_name"],
+                     df["quantity"], local_to_timestamp(df["timestamp"]))
+
+# Schlüssel Store|SAP|Menge|"Datum Zeit" der vom Shop geschriebenen Protokollzeilen
+def shop_log_keys(path):
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(logs)")}
+        if "receipt" not in columns:
+            return set()
+        df = pd.read_sql_query(
+            "SELECT store_number, sap_number, quantity, timestamp FROM logs WHERE receipt IS NOT NULL", conn)
+    return set(text_keys(df["store_number"], df["sap_number"], df["quantity"], df["timestamp"]))
+
+def text_keys(store, sap, quantity, timestamp):
+    return (format_number_column(store) + "|" + format_number_column(sap) + "|"
+            + pd.to_numeric(quantity, errors="coerce").astype("Int64").astype(str) + "|"
+            + timestamp.astype(str).str.strip())
+
+# Matrix ohne Datum: Zeitpunkt ist die letzte Änderung der Datei
+def read_matrix(path):
+    df = pd.read_excel(path)
+    store_column = df.columns[0]
+    long = df.melt(id_vars=store_column, var_name="SAP_Nummer", value_name="Anzahl")
+    long = long[long["Anzahl"].notna()]
+    timestamp = pd.Series(int(os.path.getmtime(path)), index=long.index)
+    return normalize(long, "bestellungen.xlsx", long[store_column], long["SAP_Nummer"], None,
+                     long["Anzahl"], timestamp)
+
+# SAP-Nummer -> Produktname aus dem aktuellen Katalog (für die Matrix, die keine Namen hat)
+def catalog_names():
+    names = {}
+    for path in (special_products_path, products_path):
+        if os.path.exists(path):
+            df = pd.read_excel(path)
+            names.update(zip(format_number_column(df["SAP Number"]), df["Name"]))
+    return names
+
+def event_keys(df):
+    return (df["Storenummer"] + "|" + df["SAP_Nummer"] + "|" + df["Anzahl"].astype("int64").astype(str)
+            + "|" + df["Zeitstempel"].astype("int64").astype(str))
+
+def cell_keys(df):
+    return df["Storenummer"] + "|" + df["SAP_Nummer"] + "|" + df["Anzahl"].astype("int64").astype(str)
+
+# ---------------------------
+# Funktion: Alle Quellen lesen, bereinigen und Duplikate entfernen
+# ---------------------------
+def collect_orders(paths):
+    events = []
+    matrix = None
+    legacy_db = paths["legacy_db"]
+    shop_keys = shop_log_keys(legacy_db) if legacy_db and os.path.exists(legacy_db) else set()
+    for source, reader, path in (
+        ("merch_shop.db/logs", lambda path: read_legacy_table(path, "logs"), legacy_db),
+        ("merch_shop.db/orders", lambda path: read_legacy_table(path, "orders"), legacy_db),
+        ("order_logs.xlsx", lambda path: read_order_logs(path, shop_keys), paths["order_logs"]),
+        ("bestellungen.xlsx", read_matrix, paths["matrix"]),
+    ):
+        if not path or not os.path.exists(path):
+            print(f"  {source:<24} übersprungen (nicht gefunden)")
+            continue
+        df = reader(path)
+        print(f"  {source:<24} {len(df):>8} Zeilen gelesen")
+        if source == "bestellungen.xlsx":
+            matrix = df
+        else:
+            events.append(df)
+
+    events = pd.concat(events, ignore_index=True) if events else pd.DataFrame(columns=CANONICAL_COLUMNS)
+    invalid = (events["Storenummer"].eq("") | events["SAP_Nummer"].eq("") | events["Anzahl"].isna()
+               | (events["Anzahl"] <= 0) | events["Zeitstempel"].isna())
+    if invalid.any():
+        print(f"  {int(invalid.sum())} Zeilen ohne Store, SAP-Nummer, Menge oder Zeitpunkt verworfen")
+    events = events[~invalid].copy()
+    events["Schluessel"] = event_keys(events)
+    before = len(events)
+    events = events.drop_duplicates("Schluessel")
+    print(f"  {before - len(events)} Duplikate zwischen den Quellen entfernt")
+
+    if matrix is not None:
+        matrix = matrix[matrix["Storenummer"].ne("") & (matrix["Anzahl"] > 0)].copy()
+        # Eine Matrixzelle ist die zuletzt bestellte Menge; steht dieselbe Bestellung (Store,
+        # SAP-Nummer, Menge) schon in einem Protokoll, ist es derselbe Vorgang
+        known = set(cell_keys(events))
+        cells = cell_keys(matrix)
+        duplicate = cells.isin(known)
+        print(f"  {int(duplicate.sum())} Matrixzellen bereits in den Protokollen enthalten")
+        matrix = matrix[~duplicate]
+        matrix["Schluessel"] = "matrix|" + cells[~duplicate]
+        events = pd.concat([events, matrix], ignore_index=True)
+
+    # Fehlende Produktnamen: zuerst aus den anderen Quellen, sonst aus dem Katalog
+    names = events.dropna(subset=["Produktname"]).drop_duplicates("SAP_Nummer", keep="last")
+    names = dict(zip(names["SAP_Nummer"], names["Produktname"]))
+    for sap_number, name in catalog_names().items():
+        names.setdefault(sap_number, name)
+    missing = events["Produktname"].isna()
+    events.loc[missing, "Produktname"] = events.loc[missing, "SAP_Nummer"].map(names)
+
+    events["Anzahl"] = events["Anzahl"].astype("int64")
+    events["Zeitstempel"] = events["Zeitstempel"].astype("int64")
+    return events.sort_values(["Zeitstempel", "Storenummer", "SAP_Nummer"]).reset_index(drop=True)
+
+# ---------------------------
+# Funktion: Bereits vorhandene Bestellungen aussortieren
+# ---------------------------
+def filter_existing(conn, events):
+    if events.empty:
+        return events
+    imported = {row[0] for row in conn.execute(text('SELECT "Schluessel" FROM importe'))}
+    events = events[~events["Schluessel"].isin(imported)]
+    print(f"  {len(imported)} Schlüssel aus früheren Importen, {len(events)} Bestellungen neu")
+    if events.empty:
+        return events
+
+    # Bestellungen, die schon über den Shop gespeichert wurden (gleicher Schlüssel)
+    start, end = int(events["Zeitstempel"].min()), int(events["Zeitstempel"].max()) + 1
+    source = orders_source(conn, start, end)
+    existing = pd.DataFrame(conn.execute(text(
+        f'SELECT "Storenummer", "SAP_Nummer", "Anzahl", "Zeitstempel" FROM {source} '
+        f'WHERE "Zeitstempel" >= :start AND "Zeitstempel" < :end AND "Anzahl" IS NOT NULL'
+    ), {"start": start, "end": end}).fetchall(), columns=["Storenummer", "SAP_Nummer", "Anzahl", "Zeitstempel"])
+    if not existing.empty:
+        existing = existing.astype({"Storenummer": str, "SAP_Nummer": str})
+        in_shop = events["Schluessel"].isin(set(event_keys(existing)))
+        print(f"  {int(in_shop.sum())} Bestellungen sind bereits in der Bestelldatenbank")
+        events = events[~in_shop]
+    return events
+
+# ---------------------------
+# Funktion: Import in einer Transaktion
+# ---------------------------
+def import_orders(conn, events):
+    events = filter_existing(conn, events)
+    total = len(events)
+    if not total:
+        return 0
+
+    now = datetime.now().isoformat(timespec="seconds")
+    for start in range(0, total, CHUNK_SIZE):
+        chunk = events.iloc[start:start + CHUNK_SIZE]
+        dates = pd.to_datetime(chunk["Zeitstempel"], unit="s", utc=True).dt.tz_convert(local_timezone)
+        rows = [
+            {
+                "Datum": date,
+                "Storenummer": store_number,
+                "Produktname": name,
+                "SAP_Nummer": sap_number,
+                "Anzahl": quantity,
+                "Zeitstempel": timestamp,
+            }
+            for date, store_number, name, sap_number, quantity, timestamp in zip(
+                dates.dt.strftime("%Y-%m-%d"), chunk["Storenummer"], chunk["Produktname"],
+                chunk["SAP_Nummer"], chunk["Anzahl"].tolist(), chunk["Zeitstempel"].tolist()
+            )
+        ]
+        ids = insert_order_rows(conn, rows)
+        conn.execute(text(
+            'INSERT INTO importe ("Schluessel", "Quelle", "Bestellung_ID", "Importiert_am") '
+            'VALUES (:key, :source, :id, :now)'
+        ), [
+            {"key": key, "source": source, "id": order_id, "now": now}
+            for key, source, order_id in zip(chunk["Schluessel"], chunk["Quelle"], ids)
+        ])
+        print(f"  {min(start + CHUNK_SIZE, total)}/{total} Bestellungen importiert")
+    return total
+
+# ---------------------------
+# Skript ausführen
+# ---------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Alte Bestelldaten in die Bestelldatenbank importieren")
+    parser.add_argument("--matrix", default=matrix_path, help="Bestellmatrix (Excel)")
+    parser.add_argument("--order-logs", default=order_logs_path, help="Bestellprotokoll (Excel)")
+    parser.add_argument("--merch-shop-db", default=legacy_db_path, help="alte Datenbank mit orders/logs")
+    parser.add_argument("--probelauf", action="store_true", help="nur anzeigen, nichts schreiben")
+    args = parser.parse_args()
+
+    get_engine()  # Schema auf den neusten Stand bringen (u.a. Tabelle "importe")
+    print("Quellen lesen:")
+    events = collect_orders({"matrix": args.matrix, "order_logs": args.order_logs, "legacy_db": args.merch_shop_db})
+    print(f"{len(events)} eindeutige Bestellungen in den Quellen.")
+
+    if args.probelauf:
+        with get_engine().connect() as conn:
+            events = filter_existing(conn, events)
+        print(f"Probelauf: {len(events)} Bestellungen würden importiert.")
+    else:
+        print("Importieren:")
+        count = run_write(lambda conn: import_orders(conn, events))
+        print(f"{count} Bestellungen importiert." if count else "Nichts zu importieren, alles ist bereits vorhanden.")
@@ -1,24 +1,338 @@
-from sqlalchemy import create_engine, Table, Column, Integer, String, MetaData
-
-# Verbindet sich mit der SQLite-Datenbank (oder erstellt sie, wenn sie nicht existiert)
-db_path = "data/bestellungen.db"
-engine = create_engine(f"sqlite:///{db_path}")
-
-# Datenbankstruktur definieren
-meta = MetaData()
-
-# Tabelle "bestellungen" definieren
-orders_table = Table(
-    'bestellungen', meta,
-    Column('id', Integer, primary_key=True, autoincrement=True),
-    Column('Datum', String),
-    Column('Storenummer', String),
-    Column('Produktname', String),
-    Column('SAP_Nummer', String),
-    Column('Anzahl', Integer)
-)
-
-# Tabelle erstellen (nur wenn sie nicht existiert)
-meta.create_all(engine)
-
-print("Tabelle 'bestellungen' wurde erfolgreich erstellt (falls sie noch nicht existierte).")
+import argparse
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, text
+
+# ---------------------------
+# Versionierte Migrationen für data/bestellungen.db
+# ---------------------------
+# Jede Migration hat eine fortlaufende Versionsnummer und wird genau einmal angewendet;
+# die angewendeten Versionen stehen in der Tabelle "schema_version". Die Schritte sind so
+# geschrieben, dass sie auch auf Datenbanken laufen, die vor Einführung der Versionierung
+# schon Teile davon hatten (IF NOT EXISTS, Spalten nur ergänzen, wenn sie fehlen).
+# Neue Schemaänderungen immer als neue Migration hinten anfügen, nie bestehende ändern.
+
+def column_names(conn, table_name):
+    return [row[1] for row in conn.execute(text(f'PRAGMA table_info("{table_name}")'))]
+
+def add_column(conn, table_name, column_name, column_type):
+    if column_name not in column_names(conn, table_name):
+        conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN "{column_name}" {column_type}'))
+
+# ---------------------------
+# Migration 1: Tabelle "bestellungen"
+# ---------------------------
+def migration_1(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS bestellungen (
+            id INTEGER NOT NULL,
+            "Datum" VARCHAR,
+            "Storenummer" VARCHAR,
+            "Produktname" VARCHAR,
+            "SAP_Nummer" VARCHAR,
+            "Anzahl" INTEGER,
+            PRIMARY KEY (id)
+        )
+    '''))
+
+# ---------------------------
+# Migration 2: Bestellköpfe für Warenkorb-Bestellungen
+# ---------------------------
+def migration_2(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS bestellkoepfe (
+            id INTEGER NOT NULL,
+            "Datum" VARCHAR,
+            "Storenummer" VARCHAR,
+            "Positionen" INTEGER,
+            PRIMARY KEY (id)
+        )
+    '''))
+    add_column(conn, 'bestellungen', 'Bestellkopf_ID', 'INTEGER')
+
+# ---------------------------
+# Migration 3: Eindeutige Belegnummer (Bestellpuffer)
+# ---------------------------
+def migration_3(conn):
+    add_column(conn, 'bestellkoepfe', 'Beleg_ID', 'VARCHAR')
+    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_bestellkoepfe_beleg ON bestellkoepfe ("Beleg_ID")'))
+
+# ---------------------------
+# Migration 4: Indizes für Auswertungen pro Store, SAP-Nummer und Zeitraum
+# ---------------------------
+def migration_4(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_bestellungen_store_datum ON bestellungen ("Storenummer", "Datum")'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_bestellungen_sap_datum ON bestellungen ("SAP_Nummer", "Datum")'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_bestellungen_kopf ON bestellungen ("Bestellkopf_ID")'))
+    # Statistiken für den Query-Planer (welcher Index ist selektiver)
+    conn.execute(text('ANALYZE'))
+
+# ---------------------------
+# Monatspartitionen der Bestellungen
+# ---------------------------
+# Ab Schema-Version 5 liegen die Bestellpositionen in einer Tabelle pro Monat
+# ("bestellungen_2025_02", Monat nach UTC-Zeitstempel). "bestellungen" ist eine View, die alle
+# Partitionen mit UNION ALL zusammenfasst, damit bestehende Abfragen unverändert funktionieren.
+# Abfragen für einen Zeitraum lesen über datenbank.orders_source() nur die betroffenen Monate.
+ORDER_COLUMNS = [
+    ('id', 'INTEGER PRIMARY KEY'),
+    ('Datum', 'VARCHAR'),
+    ('Storenummer', 'VARCHAR'),
+    ('Produktname', 'VARCHAR'),
+    ('SAP_Nummer', 'VARCHAR'),
+    ('Anzahl', 'INTEGER'),
+    ('Bestellkopf_ID', 'INTEGER'),
+    ('Zeitstempel', 'INTEGER NOT NULL'),   # Sekunden seit 1970, UTC
+    ('Tag', 'VARCHAR NOT NULL'),           # YYYY-MM-DD (UTC)
+    ('Monat', 'VARCHAR NOT NULL'),         # YYYY-MM (UTC), bestimmt die Partition
+]
+PARTITION_PATTERN = 'bestellungen_[0-9][0-9][0-9][0-9]_[0-9][0-9]'
+
+def partition_name(month):
+    return f"bestellungen_{month.replace('-', '_')}"
+
+def list_partitions(conn):
+    return [row[0] for row in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB :pattern ORDER BY name"
+    ), {"pattern": PARTITION_PATTERN})]
+
+# ---------------------------
+# Funktion: View "bestellungen" über alle Partitionen neu aufbauen
+# ---------------------------
+def rebuild_orders_view(conn):
+    column_list = ", ".join(f'"{name}"' for name, _ in ORDER_COLUMNS)
+    selects = [f'SELECT {column_list} FROM "{table}"' for table in list_partitions(conn)]
+    conn.execute(text('DROP VIEW IF EXISTS bestellungen'))
+    conn.execute(text(f'CREATE VIEW bestellungen AS {" UNION ALL ".join(selects)}'))
+
+# ---------------------------
+# Funktion: Partition für einen Monat anlegen (gibt True zurück, wenn sie neu ist)
+# ---------------------------
+def ensure_partition(conn, month, update_view=True):
+    table = partition_name(month)
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {"name": table}).first()
+    if exists:
+        return False
+
+    columns = ", ".join(f'"{name}" {column_type}' for name, column_type in ORDER_COLUMNS)
+    conn.execute(text(f'CREATE TABLE "{table}" ({columns})'))
+    conn.execute(text(f'CREATE INDEX "ix_{table}_zeit" ON "{table}" ("Zeitstempel")'))
+    conn.execute(text(f'CREATE INDEX "ix_{table}_store" ON "{table}" ("Storenummer", "Zeitstempel")'))
+    conn.execute(text(f'CREATE INDEX "ix_{table}_sap" ON "{table}" ("SAP_Nummer", "Zeitstempel")'))
+    conn.execute(text(f'CREATE INDEX "ix_{table}_kopf" ON "{table}" ("Bestellkopf_ID")'))
+    if update_view:
+        rebuild_orders_view(conn)
+    return True
+
+# ---------------------------
+# Migration 5: UTC-Zeitstempel und Monatspartitionen
+# ---------------------------
+def migration_5(conn):
+    # Fortlaufende IDs über alle Partitionen hinweg
+    conn.execute(text('CREATE TABLE IF NOT EXISTS bestell_sequenz (name VARCHAR PRIMARY KEY, wert INTEGER NOT NULL)'))
+    conn.execute(text('''
+        INSERT OR IGNORE INTO bestell_sequenz (name, wert)
+        SELECT 'bestellungen', COALESCE(MAX(id), 0) FROM bestellungen
+    '''))
+
+    # Bestehende Bestellungen: nur das Datum ist bekannt, Zeitstempel = Mitternacht UTC
+    timestamp_sql = 'COALESCE(CAST(strftime(\'%s\', "Datum") AS INTEGER), 0)'
+    conn.execute(text('ALTER TABLE bestellungen RENAME TO bestellungen_vor_partitionen'))
+    months = [row[0] for row in conn.execute(text(
+        f"SELECT DISTINCT strftime('%Y-%m', {timestamp_sql}, 'unixepoch') FROM bestellungen_vor_partitionen"
+    ))]
+    for month in months:
+        ensure_partition(conn, month, update_view=False)
+        conn.execute(text(f'''
+            INSERT INTO "{partition_name(month)}"
+                (id, "Datum", "Storenummer", "Produktname", "SAP_Nummer", "Anzahl", "Bestellkopf_ID",
+                 "Zeitstempel", "Tag", "Monat")
+            SELECT id, "Datum", "Storenummer", "Produktname", "SAP_Nummer", "Anzahl", "Bestellkopf_ID",
+                   {timestamp_sql},
+                   strftime('%Y-%m-%d', {timestamp_sql}, 'unixepoch'),
+                   strftime('%Y-%m', {timestamp_sql}, 'unixepoch')
+            FROM bestellungen_vor_partitionen
+            WHERE strftime('%Y-%m', {timestamp_sql}, 'unixepoch') = :month
+        '''), {"month": month})
+    conn.execute(text('DROP TABLE bestellungen_vor_partitionen'))
+
+    # Mindestens die Partition des laufenden Monats, damit die View nie leer definiert ist
+    ensure_partition(conn, datetime.now(timezone.utc).strftime('%Y-%m'), update_view=False)
+    rebuild_orders_view(conn)
+
+    add_column(conn, 'bestellkoepfe', 'Zeitstempel', 'INTEGER')
+    conn.execute(text('''
+        UPDATE bestellkoepfe SET "Zeitstempel" = COALESCE(CAST(strftime('%s', "Datum") AS INTEGER), 0)
+        WHERE "Zeitstempel" IS NULL
+    '''))
+    conn.execute(text('ANALYZE'))
+
+# ---------------------------
+# Migration 6: Vorberechnete Summen pro Store/SAP/Tag und SAP/Monat
+# ---------------------------
+def migration_6(conn):
+    from bestellsummen import rebuild_totals
+
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS summen_store_sap_tag (
+            "Storenummer" VARCHAR NOT NULL,
+            "SAP_Nummer" VARCHAR NOT NULL,
+            "Tag" VARCHAR NOT NULL,
+            "Anzahl" INTEGER NOT NULL,
+            "Positionen" INTEGER NOT NULL,
+            PRIMARY KEY ("Storenummer", "SAP_Nummer", "Tag")
+        ) WITHOUT ROWID
+    '''))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_summen_store_sap_tag_tag ON summen_store_sap_tag ("Tag")'))
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS summen_sap_monat (
+            "SAP_Nummer" VARCHAR NOT NULL,
+            "Monat" VARCHAR NOT NULL,
+            "Anzahl" INTEGER NOT NULL,
+            "Positionen" INTEGER NOT NULL,
+            PRIMARY KEY ("SAP_Nummer", "Monat")
+        ) WITHOUT ROWID
+    '''))
+    rebuild_totals(conn)
+
+# ---------------------------
+# Migration 7: Herkunft importierter Altdaten (import_bestellungen.py)
+# ---------------------------
+def migration_7(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS importe (
+            "Schluessel" VARCHAR NOT NULL PRIMARY KEY,
+            "Quelle" VARCHAR NOT NULL,
+            "Bestellung_ID" INTEGER,
+            "Importiert_am" VARCHAR
+        )
+    '''))
+
+# ---------------------------
+# Migration 8: Postausgang für Bestellungen von Spezialprodukten
+# ---------------------------
+# Jede Bestellung eines Spezialprodukts wird hier abgelegt und von mailversand.py im
+# Hintergrund per SMTP verschickt. Status: "offen", "gesendet" oder "fehlgeschlagen".
+def migration_8(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS mail_ausgang (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            "Erstellt_am" INTEGER NOT NULL,
+            "Empfaenger" VARCHAR NOT NULL,
+            "Storenummer" VARCHAR,
+            "Storename" VARCHAR,
+            "SAP_Nummer" VARCHAR,
+            "Produktname" VARCHAR,
+            "Anzahl" INTEGER,
+            "Status" VARCHAR NOT NULL DEFAULT 'offen',
+            "Versuche" INTEGER NOT NULL DEFAULT 0,
+            "Naechster_Versuch" INTEGER NOT NULL,
+            "Letzter_Fehler" VARCHAR,
+            "Gesendet_am" INTEGER
+        )
+    '''))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS idx_mail_ausgang_status ON mail_ausgang ("Status", "Naechster_Versuch")'
+    ))
+
+# ---------------------------
+# Migration 9: Reservierung im Postausgang kennzeichnen
+# ---------------------------
+# Ein Versand-Durchgang reserviert Einträge bis "Reserviert_bis" (zusätzlich zum
+# verschobenen "Naechster_Versuch"); nach dem Versand wird die Spalte wieder geleert.
+# So erkennt "mailversand.py --jetzt" Einträge, die gerade verschickt werden.
+def migration_9(conn):
+    add_column(conn, 'mail_ausgang', 'Reserviert_bis', 'INTEGER')
+
+# ---------------------------
+# Migration 10: Sammelmail-Fenster pro Eintrag im Postausgang
+# ---------------------------
+# "Sammeln_bis": Ende des Sammelfensters, in das der Shop den Eintrag gelegt hat (leer =
+# einzelne Mail). Gruppiert wird danach, nicht nach den Einstellungen des versendenden Prozesses.
+def migration_10(conn):
+    add_column(conn, 'mail_ausgang', 'Sammeln_bis', 'INTEGER')
+
+MIGRATIONS = [
+    (1, "Tabelle bestellungen", migration_1),
+    (2, "Bestellköpfe", migration_2),
+    (3, "Belegnummer", migration_3),
+    (4, "Indizes für Auswertungen", migration_4),
+    (5, "Zeitstempel und Monatspartitionen", migration_5),
+    (6, "Vorberechnete Summen", migration_6),
+    (7, "Importierte Altdaten", migration_7),
+    (8, "Postausgang Spezialprodukte", migration_8),
+    (9, "Reservierung im Postausgang", migration_9),
+    (10, "Sammelmails im Postausgang", migration_10),
+]
+
+# ---------------------------
+# Funktion: Angewendete Schema-Versionen lesen
+# ---------------------------
+def applied_versions(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR,
+            angewendet_am VARCHAR
+        )
+    '''))
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_version'))}
+
+# ---------------------------
+# Funktion: Fehlende Migrationen anwenden (bis zur angegebenen Version)
+# ---------------------------
+def migrate(engine, target_version=None, verbose=False):
+    applied = []
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    for version, name, step in MIGRATIONS:
+        if target_version is not None and version > target_version:
+            break
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            # Ein anderer Prozess könnte die Migration inzwischen angewendet haben
+            if version in applied_versions(conn):
+                continue
+            step(conn)
+            conn.execute(
+                text('INSERT INTO schema_version (version, name, angewendet_am) VALUES (:version, :name, :now)'),
+                {"version": version, "name": name, "now": datetime.now().isoformat(timespec="seconds")}
+            )
+        applied.append(version)
+        if verbose:
+            print(f"Migration {version} angewendet: {name}")
+    return applied
+
+# ---------------------------
+# Funktion: Aktuelle Schema-Version
+# ---------------------------
+def current_version(engine):
+    with engine.connect() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")).first()
+        if not exists:
+            return 0
+        return conn.execute(text('SELECT COALESCE(MAX(version), 0) FROM schema_version')).scalar()
+
+# ---------------------------
+# Skript ausführen
+# ---------------------------
+if __name__ == "__main__":
+    from datenbank import db_path
+
+    parser = argparse.ArgumentParser(description="Schema-Migrationen für die Bestelldatenbank")
+    parser.add_argument("--status", action="store_true", help="nur aktuelle Version anzeigen")
+    parser.add_argument("--analyze", action="store_true", help="Statistiken für den Query-Planer neu berechnen")
+    args = parser.parse_args()
+
+    # Verbindet sich mit der SQLite-Datenbank (oder erstellt sie, wenn sie nicht existiert)
+    engine = create_engine(f"sqlite:///{db_path}")
+    if not args.status:
+        if not migrate(engine, verbose=True):
+            print("Schema ist bereits aktuell.")
+    if args.analyze:
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        print("ANALYZE ausgeführt.")
+    print(f"{db_path}: Schema-Version {current_version(engine)} von {MIGRATIONS[-1][0]}")
@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import threading
+import unicodedata
+from functools import lru_cache
+from collections import namedtuple, defaultdict
+import numpy as np
+import pandas as pd
+from bilder import file_hash
+
+# ---------------------------
+# Kompilierter Katalog: Excel-Dateien einmal parsen, danach als Parquet laden
+# ---------------------------
+# pd.read_excel (openpyxl) braucht pro Datei ein Vielfaches der Zeit eines Parquet-Ladevorgangs.
+# Die geparsten Tabellen werden deshalb mit ihren Datentypen in cache/katalog/ abgelegt,
+# verschlüsselt über Pfad, Änderungszeit und Inhalts-Hash der Excel-Datei. Excel wird nur
+# neu gelesen, wenn sich der Inhalt tatsächlich geändert hat.
+catalog_cache_folder = "cache/katalog"
+index_file_name = "index.json"
+
+# ---------------------------
+# Funktionen: Index des Katalog-Caches lesen und schreiben
+# ---------------------------
+def read_index(cache_folder=catalog_cache_folder):
+    try:
+        with open(os.path.join(cache_folder, index_file_name), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_index(index, cache_folder=catalog_cache_folder):
+    index_path = os.path.join(cache_folder, index_file_name)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, index_path)
+
+# ---------------------------
+# Funktion: Katalogtabelle laden (Parquet-Cache, sonst Excel)
+# ---------------------------
+def load_catalog_frame(file_path, cache_folder=catalog_cache_folder):
+    os.makedirs(cache_folder, exist_ok=True)
+    key = os.path.normpath(file_path)
+    stat = os.stat(file_path)
+    index = read_index(cache_folder)
+    entry = index.get(key)
+
+    # Schneller Weg: Grösse und Änderungszeit unverändert, Datei muss nicht gehasht werden
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+        compiled_path = os.path.join(cache_folder, entry["compiled"])
+        if os.path.exists(compiled_path):
+            return pd.read_parquet(compiled_path)
+
+    content_hash = file_hash(file_path)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    compiled_name = f"{stem}-{content_hash}.parquet"
+    compiled_path = os.path.join(cache_folder, compiled_name)
+
+    if os.path.exists(compiled_path):
+        # Nur der Zeitstempel hat sich geändert (z.B. Datei kopiert), Inhalt identisch
+        df = pd.read_parquet(compiled_path)
+    else:
+        df = pd.read_excel(file_path)
+        tmp_path = compiled_path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, compiled_path)
+        print(f"Katalog kompiliert: {file_path} -> {compiled_path}")
+
+    # Veraltete kompilierte Stände dieser Datei entfernen
+    if entry and entry["compiled"] != compiled_name:
+        old_path = os.path.join(cache_folder, entry["compiled"])
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+    index = read_index(cache_folder)
+    index[key] = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": content_hash,
+        "compiled": compiled_name,
+    }
+    write_index(index, cache_folder)
+    return df
+
+# ---------------------------
+# Funktion: Zahlen formatieren (keine Dezimalstelle, wenn nicht nötig)
+# ---------------------------
+def format_number(num):
+    try:
+        if isinstance(num, float) and num.is_integer():
+            return str(int(num))
+        elif isinstance(num, int):
+            return str(num)
+        else:
+            return str(num)
+    except Exception:
+        return str(num)
+
+# Gleiche Formatierung für eine ganze Spalte auf einmal (NaN -> "")
+def format_number_column(series):
+    numeric = pd.to_numeric(series, errors="coerce")
+    whole = numeric.notna() & (numeric % 1 == 0)
+    text = series.astype(object).where(series.notna(), "").astype(str)
+    text[whole] = numeric[whole].astype("int64").astype(str)
+    return text
+
+# ---------------------------
+# Produktkarten: vorberechnetes Anzeigemodell pro Katalogzeile
+# ---------------------------
+# Wird einmal pro Katalogstand spaltenweise aus dem DataFrame berechnet. display_products
+# liest beim Rendern nur noch diese Tupel, ohne iterrows, row.get oder pd.isna pro Zeile.
+ProductCard = namedtuple("ProductCard", [
+    "key",            # stabiler Schlüssel für Widget-Keys (Zeilenindex im Excel)
+    "name",
+    "remark",         # Bemerkungen, "" falls leer
+    "sap_number",     # formatierte SAP-Nummer, "" falls leer
+    "stock_text",     # formatierter Lagerbestand
+    "available",      # False bei Lagerbestand 0
+    "qty_options",    # Tupel der bestellbaren Mengen aus Qty 1-4
+    "image_name",
+    "mail",           # Empfänger bei Spezialprodukten, sonst ""
+])
+
+QTY_COLUMNS = ["Qty 1", "Qty 2", "Qty 3", "Qty 4"]
+
+def text_column(df, column):
+    if column not in df:
+        return pd.Series("", index=df.index)
+    return df[column].astype(object).where(df[column].notna(), "").astype(str).str.strip()
+
+def build_cards(df):
+    if df.empty:
+        return ()
+
+    names = text_column(df, "Name")
+    remarks = text_column(df, "Bemerkungen")
+    sap_numbers = format_number_column(df["SAP Number"]) if "SAP Number" in df else pd.Series("", index=df.index)
+    stock = df["actual Stock"] if "actual Stock" in df else pd.Series(np.nan, index=df.index)
+    stock_texts = format_number_column(stock)
+    available = (stock != 0).to_numpy()
+    image_names = df["Bildname"].astype(str) if "Bildname" in df else pd.Series("", index=df.index)
+    mails = text_column(df, "Mail")
+
+    # Mengen als Matrix: NaN-Zellen fallen weg, ganze Zahlen werden zu int
+    qty_columns = [column for column in QTY_COLUMNS if column in df]
+    qty_matrix = df[qty_columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    qty_options = [
+        tuple(int(qty) if qty.is_integer() else float(qty) for qty in row[~np.isnan(row)])
+        for row in qty_matrix
+    ]
+
+    return tuple(
+        ProductCard(*values)
+        for values in zip(
+            df.index.tolist(), names, remarks, sap_numbers, stock_texts,
+            available.tolist(), qty_options, image_names, mails,
+        )
+    )
+
+# ---------------------------
+# Bestelltabelle: Katalog nach SAP-Nummer für die Prüfung von Sammelbestellungen
+# ---------------------------
+# Index: formatierte SAP-Nummer (wie auf den Karten). Spalten: Produktname, Lagerbestand,
+# bestellbar und die Mengen aus Qty 1-4 als Zahlen (NaN, falls leer).
+def build_order_lookup(df):
+    if df.empty or "SAP Number" not in df:
+        return pd.DataFrame(columns=["name", "stock", "available"] + QTY_COLUMNS, index=pd.Index([], name="sap_number"))
+
+    stock = pd.to_numeric(df["actual Stock"], errors="coerce") if "actual Stock" in df else pd.Series(np.nan, index=df.index)
+    lookup = pd.DataFrame({
+        "sap_number": format_number_column(df["SAP Number"]),
+        "name": text_column(df, "Name"),
+        "stock": stock,
+        "available": stock != 0,
+    })
+    for column in QTY_COLUMNS:
+        lookup[column] = pd.to_numeric(df[column], errors="coerce") if column in df else np.nan
+    lookup = lookup[lookup["sap_number"] != ""].drop_duplicates("sap_number")
+    return lookup.set_index("sap_number")
+
+# ---------------------------
+# Produktsuche: In-Memory-Index über Name, SAP-Nummer und Bemerkungen
+# ---------------------------
+# Texte werden ohne Akzente und Gross-/Kleinschreibung verglichen ("Écran" findet "ecran",
+# "Grösse" findet "grosse"). Der Index enthält für jede Zeichenfolge mit 1-3 Zeichen die
+# Menge der Karten, in denen sie vorkommt. Kurze Suchbegriffe sind damit ein einziger
+# Nachschlag; längere werden über die Schnittmenge ihrer Trigramme eingegrenzt und nur noch
+# auf diesen wenigen Kandidaten mit "in" geprüft. Mehrere Wörter müssen alle vorkommen.
+SEARCH_GRAM_SIZE = 3
+
+def normalize_search_text(text):
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+class SearchIndex:
+    def __init__(self, cards):
+        self.cards = cards
+        self.texts = [
+            normalize_search_text(" ".join(part for part in (card.name, card.sap_number, card.remark) if part))
+            for card in cards
+        ]
+        grams = defaultdict(set)
+        for position, text in enumerate(self.texts):
+            for size in range(1, SEARCH_GRAM_SIZE + 1):
+                for start in range(len(text) - size + 1):
+                    grams[text[start:start + size]].add(position)
+        self.grams = dict(grams)
+        # Ergebnisse pro Suchbegriff zwischenspeichern (gilt nur für diesen Katalogstand)
+        self.search = lru_cache(maxsize=1024)(self._search)
+
+    def _candidates(self, term):
+        if len(term) <= SEARCH_GRAM_SIZE:
+            return self.grams.get(term, set())
+        postings = []
+        for start in range(len(term) - SEARCH_GRAM_SIZE + 1):
+            posting = self.grams.get(term[start:start + SEARCH_GRAM_SIZE])
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {position for position in candidates if term in self.texts[position]}
+
+    def _search(self, query):
+        terms = normalize_search_text(query).split()
+        if not terms:
+            return self.cards
+        result = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            candidates = self._candidates(term)
+            result = set(candidates) if result is None else result & candidates
+            if not result:
+                return ()
+        return tuple(self.cards[position] for position in sorted(result))
+
+# ---------------------------
+# Katalog-Snapshot: ein vollständig geladener, unveränderlicher Stand aller Katalogdateien
+# ---------------------------
+# Die DataFrames werden nach dem Laden nicht mehr verändert. Jeder Skriptlauf holt sich
+# zu Beginn genau einen Snapshot und arbeitet bis zum Ende damit; ein neuer Stand ersetzt
+# nur die Referenz im Service. Sobald kein Lauf den alten Snapshot mehr hält, gibt Python
+# ihn frei.
+CatalogSnapshot = namedtuple("CatalogSnapshot", [
+    "version",
+    "loaded_at",
+    "storelist",
+    "products",
+    "special_products",
+    "store_mapping",
+    "store_lang_mapping",
+    "product_cards",
+    "special_product_cards",
+    "product_search",
+    "special_product_search",
+    "product_lookup",
+    "errors",
+])
+
+# ---------------------------
+# Funktion: Katalogtabelle laden, Fehler sammeln statt abbrechen
+# ---------------------------
+def load_catalog_frame_safe(file_path, errors):
+    try:
+        return load_catalog_frame(file_path)
+    except FileNotFoundError:
+        errors.append(f"Datei nicht gefunden: {file_path}")
+    except Exception as e:
+        errors.append(f"Fehler beim Laden der Datei: {file_path} ({e})")
+    return pd.DataFrame()
+
+# ---------------------------
+# Funktion: Snapshot aus den Katalogdateien aufbauen
+# ---------------------------
+def build_snapshot(version, storelist_path, products_path, special_products_path):
+    errors = []
+    storelist = load_catalog_frame_safe(storelist_path, errors)
+    products = load_catalog_frame_safe(products_path, errors)
+    special_products = load_catalog_frame_safe(special_products_path, errors)
+
+    store_mapping = dict(zip(storelist.get("Storenummer", []), storelist.get("Storename", [])))
+    store_lang_mapping = dict(zip(storelist.get("Storenummer", []), storelist.get("Lang", [])))
+    product_cards = build_cards(products)
+    special_product_cards = build_cards(special_products)
+
+    return CatalogSnapshot(
+        version=version,
+        loaded_at=time.time(),
+        storelist=storelist,
+        products=products,
+        special_products=special_products,
+        store_mapping=store_mapping,
+        store_lang_mapping=store_lang_mapping,
+        product_cards=product_cards,
+        special_product_cards=special_product_cards,
+        product_search=SearchIndex(product_cards),
+        special_product_search=SearchIndex(special_product_cards),
+        product_lookup=build_order_lookup(products),
+        errors=tuple(errors),
+    )
+
+# ---------------------------
+# Katalog-Service mit Dateiüberwachung (Hot Reload)
+# ---------------------------
+# Ein Hintergrund-Thread prüft die Katalogdateien in data/ auf Änderungen (Grösse und
+# Änderungszeit). Bei einer Änderung wird ein neuer Snapshot vollständig im Hintergrund
+# geladen und erst danach mit einer einzigen Zuweisung veröffentlicht. Sessions sehen
+# damit entweder den alten oder den neuen Stand, nie einen halb geladenen.
+class CatalogService:
+    def __init__(self, storelist_path, products_path, special_products_path):
+        self.paths = (storelist_path, products_path, special_products_path)
+        self._lock = threading.Lock()
+        self._signature = self.file_signature()
+        self._snapshot = build_snapshot(1, *self.paths)
+
+    def current(self):
+        return self._snapshot
+
+    def file_signature(self):
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def reload_if_changed(self):
+        with self._lock:
+            signature = self.file_signature()
+            if signature == self._signature:
+                return False
+
+            snapshot = build_snapshot(self._snapshot.version + 1, *self.paths)
+            if snapshot.errors:
+                # Datei wird evtl. gerade noch gespeichert: alten Stand behalten, später erneut versuchen
+                for error in snapshot.errors:
+                    print(f"Katalog nicht neu geladen: {error}")
+                return False
+
+            self._snapshot = snapshot
+            self._signature = signature
+            print(f"Katalog neu geladen (Version {snapshot.version})")
+            return True
+
+    def start_watcher(self, interval=5.0):
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    print(f"Katalog-Überwachung: {e}")
+
+        thread = threading.Thread(target=watch, name="katalogservice", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,454 @@
+import io
+import os
+import csv
+import html
+import time
+import atexit
+import smtplib
+import argparse
+import threading
+from itertools import groupby
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from sqlalchemy import text
+from datenbank import get_read_engine, run_write, utc_timestamp
+
+# ---------------------------
+# Postausgang: Bestellungen von Spezialprodukten per SMTP verschicken
+# ---------------------------
+# Früher öffnete der Shop für jede Bestellung eines Spezialprodukts einen mailto:-Link mit
+# webbrowser.open - auf dem Server, nicht beim Benutzer. Jetzt legt die Oberfläche die
+# Bestellung nur in der Tabelle mail_ausgang ab (Migration 8) und kehrt sofort zurück. Ein
+# Hintergrund-Thread verschickt offene Einträge über eine SMTP-Verbindung, die zwischen den
+# Mails offen bleibt. Schlägt der Versand fehl, wird er mit wachsender Wartezeit wiederholt
+# (30 s, 1 min, 2 min, ... höchstens 1 h); nach max_attempts Versuchen oder bei einer
+# endgültigen Ablehnung durch den Server (5xx) bleibt der Eintrag als "fehlgeschlagen" stehen.
+#
+# Sammelmails: Mit SHOP_MAIL_SAMMELN_MIN (z.B. 30) oder SHOP_MAIL_SAMMELN_UM (z.B. 17:30,
+# Ortszeit des Servers) wird nicht jede Bestellung sofort verschickt. Sie wird bis zum Ende
+# des Fensters zurückgestellt; dann geht pro Empfänger eine einzige Mail mit allen Positionen
+# (Tabelle nach Store gruppiert, dazu eine CSV-Datei im Anhang). Ob ein Eintrag in eine
+# Sammelmail gehört, steht pro Eintrag in "Sammeln_bis" (Migration 10); --jetzt und
+# --dauerbetrieb verschicken zurückgestellte Einträge also auch ohne diese Variablen gesammelt.
+#
+# Zum Testen ohne echten Mailserver:
+#   pip install aiosmtpd
+#   python -m aiosmtpd -n -l localhost:1025
+#   SHOP_SMTP_PORT=1025 python mailversand.py
+smtp_host = os.environ.get("SHOP_SMTP_HOST", "localhost")
+smtp_port = int(os.environ.get("SHOP_SMTP_PORT", "25"))
+smtp_user = os.environ.get("SHOP_SMTP_BENUTZER", "")
+smtp_password = os.environ.get("SHOP_SMTP_PASSWORT", "")
+# "" = unverschlüsselt, "starttls" oder "ssl"
+smtp_security = os.environ.get("SHOP_SMTP_SICHERHEIT", "")
+smtp_timeout = int(os.environ.get("SHOP_SMTP_TIMEOUT_S", "30"))
+mail_sender = os.environ.get("SHOP_MAIL_ABSENDER", "shop@localhost")
+
+# Wiederholungen und Verbindung
+max_attempts = int(os.environ.get("SHOP_MAIL_MAX_VERSUCHE", "8"))
+retry_base_s = int(os.environ.get("SHOP_MAIL_WARTEZEIT_S", "30"))
+retry_max_s = 3600
+idle_timeout_s = int(os.environ.get("SHOP_SMTP_LEERLAUF_S", "60"))
+# Versand im Shop-Prozess ("0": nur ablegen, Versand mit python mailversand.py --dauerbetrieb)
+dispatch_in_app = os.environ.get("SHOP_MAILVERSAND", "1") != "0"
+
+# Sammelmails: Fenster in Minuten oder feste Uhrzeit "HH:MM" (hat Vorrang)
+digest_minutes = int(os.environ.get("SHOP_MAIL_SAMMELN_MIN", "0"))
+digest_time = os.environ.get("SHOP_MAIL_SAMMELN_UM", "")
+digest_mode = bool(digest_minutes or digest_time)
+
+# Einträge pro Durchgang (bei Sammelmails alle fälligen, damit ein Fenster nicht auf
+# mehrere Mails verteilt wird); reserviert werden sie für lease_s Sekunden, damit ein zweiter
+# Prozess (z.B. das Skript neben dem Shop) dieselbe Mail nicht auch verschickt
+batch_size = 50
+digest_batch_size = 10000
+lease_s = 300
+# Spätestens so oft nachsehen, ob andere Prozesse Einträge abgelegt haben
+poll_interval_s = 30
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+# ---------------------------
+# Funktion: Bestellung eines Spezialprodukts in den Postausgang legen
+# ---------------------------
+# Gibt die ID des Eintrags zurück. Der Versand läuft im Hintergrund.
+def enqueue_special_order(recipient, store_number, store_name, sap_number, product_name, quantity):
+    if not recipient or "@" not in str(recipient):
+        raise ValueError(f"Ungültige Empfängeradresse: {recipient!r}")
+    if int(quantity) != quantity or quantity <= 0:
+        raise ValueError(f"Ungültige Anzahl für SAP Nummer {sap_number}: {quantity}")
+
+    now = utc_timestamp()
+    send_at = digest_send_time(now)
+    mail_id = run_write(lambda conn: conn.execute(text('''
+        INSERT INTO mail_ausgang ("Erstellt_am", "Empfaenger", "Storenummer", "Storename",
+                                  "SAP_Nummer", "Produktname", "Anzahl", "Naechster_Versuch", "Sammeln_bis")
+        VALUES (:now, :recipient, :store_number, :store_name, :sap_number, :product_name, :quantity,
+                :send_at, :digest_until)
+    '''), {
+        "now": now,
+        "send_at": send_at,
+        "digest_until": send_at if digest_mode else None,
+        "recipient": str(recipient).strip(),
+        "store_number": str(store_number),
+        "store_name": store_name,
+        "sap_number": str(sap_number),
+        "product_name": product_name,
+        "quantity": int(quantity),
+    }).lastrowid)
+
+    if dispatch_in_app:
+        get_mail_dispatcher().wake()
+    return mail_id
+
+# ---------------------------
+# Funktion: Mail zu einem Eintrag erstellen (Text wie beim früheren mailto:-Link)
+# ---------------------------
+def build_message(row):
+    message = EmailMessage()
+    message["From"] = mail_sender
+    message["To"] = row.Empfaenger
+    message["Subject"] = f"Order: {row.Produktname} - {row.SAP_Nummer}"
+    message.set_content(
+        "Hello Team\n\n"
+        "We order the following item:\n\n"
+        f"Productname: {row.Produktname}\n"
+        f"SAP Number: {row.SAP_Nummer}\n"
+        f"Storename: {row.Storename}\n"
+        f"Storenumber: {row.Storenummer}\n"
+        f"Amount: {row.Anzahl}\n\n"
+        "Thanks and regards"
+    )
+    return message
+
+# ---------------------------
+# Funktion: Versandzeitpunkt einer neuen Bestellung (Ende des Sammelfensters)
+# ---------------------------
+def digest_send_time(now):
+    if digest_time:
+        hours, minutes = (int(part) for part in digest_time.split(":"))
+        send_at = datetime.fromtimestamp(now).replace(hour=hours, minute=minutes, second=0, microsecond=0)
+        if send_at.timestamp() <= now:
+            send_at += timedelta(days=1)
+        return int(send_at.timestamp())
+    if digest_minutes:
+        window = digest_minutes * 60
+        return (now // window + 1) * window
+    return now
+
+# ---------------------------
+# Funktion: Sammelmail für einen Empfänger
+# ---------------------------
+DIGEST_COLUMNS = ["Storenummer", "Storename", "SAP Nummer", "Produktname", "Anzahl", "Bestellt am"]
+
+def ordered_at(row):
+    return datetime.fromtimestamp(row.Erstellt_am).strftime("%Y-%m-%d %H:%M")
+
+def digest_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(DIGEST_COLUMNS)
+    for row in rows:
+        writer.writerow([row.Storenummer, row.Storename, row.SAP_Nummer, row.Produktname, row.Anzahl, ordered_at(row)])
+    return buffer.getvalue()
+
+def build_digest(recipient, rows):
+    rows = sorted(rows, key=lambda row: (row.Storenummer or "", row.Erstellt_am, row.id))
+    stores = [(store_number, list(store_rows)) for store_number, store_rows in groupby(rows, key=lambda row: row.Storenummer)]
+    units = sum(row.Anzahl or 0 for row in rows)
+    first, last = min(row.Erstellt_am for row in rows), max(row.Erstellt_am for row in rows)
+    period = f"{datetime.fromtimestamp(first):%Y-%m-%d %H:%M} - {datetime.fromtimestamp(last):%H:%M}"
+
+    message = EmailMessage()
+    message["From"] = mail_sender
+    message["To"] = recipient
+    message["Subject"] = f"Orders: {len(rows)} items from {len(stores)} stores ({period})"
+
+    lines = ["Hello Team", "", "We order the following items:", ""]
+    html_rows = []
+    for store_number, store_rows in stores:
+        store_name = store_rows[0].Storename or ""
+        lines.append(f"Store {store_number} {store_name}")
+        html_rows.append(f"<tr><th colspan='4' align='left'>Store {html.escape(str(store_number))} "
+                         f"{html.escape(store_name)}</th></tr>")
+        for row in store_rows:
+            lines.append(f"  {row.SAP_Nummer:<10} {row.Produktname or '':<40} {row.Anzahl:>6}   {ordered_at(row)}")
+            html_rows.append(
+                f"<tr><td>{html.escape(str(row.SAP_Nummer))}</td><td>{html.escape(row.Produktname or '')}</td>"
+                f"<td align='right'>{row.Anzahl}</td><td>{ordered_at(row)}</td></tr>"
+            )
+        lines.append("")
+    lines += [f"Total: {len(rows)} items, {units} pieces. All lines are attached as CSV.", "", "Thanks and regards"]
+
+    message.set_content("\n".join(lines))
+    message.add_alternative(
+        "<p>Hello Team</p><p>We order the following items:</p>"
+        "<table border='1' cellspacing='0' cellpadding='4'>"
+        "<tr><th>SAP Number</th><th>Productname</th><th>Amount</th><th>Ordered at</th></tr>"
+        + "".join(html_rows) +
+        f"</table><p>Total: {len(rows)} items, {units} pieces. All lines are attached as CSV.</p>"
+        "<p>Thanks and regards</p>",
+        subtype="html"
+    )
+    message.add_attachment(
+        digest_csv(rows).encode("utf-8"), maintype="text", subtype="csv",
+        filename=f"orders_{datetime.fromtimestamp(last):%Y%m%d_%H%M}.csv"
+    )
+    return message
+
+# Mails zu reservierten Einträgen: Liste (Einträge, Mail). Einträge mit Sammelfenster gehen
+# als eine Sammelmail pro Empfänger, die übrigen einzeln.
+def build_messages(rows):
+    messages = [([row], build_message(row)) for row in rows if row.Sammeln_bis is None]
+    recipients = {}
+    for row in rows:
+        if row.Sammeln_bis is not None:
+            recipients.setdefault(row.Empfaenger, []).append(row)
+    return messages + [(group, build_digest(recipient, group)) for recipient, group in recipients.items()]
+
+# Wartezeit vor dem nächsten Versuch (attempts = bisherige Versuche inkl. des fehlgeschlagenen)
+def retry_delay(attempts):
+    return min(retry_base_s * 2 ** (attempts - 1), retry_max_s)
+
+# Endgültige Ablehnung durch den Server: erneut senden bringt nichts
+def is_permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+# Server nicht erreichbar oder Anmeldung abgelehnt: betrifft alle weiteren Mails auch
+def is_connection_error(error):
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return True
+    return not isinstance(error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused))
+
+# ---------------------------
+# Funktionen: Einträge reservieren und Ergebnisse speichern (im Schreib-Thread)
+# ---------------------------
+# Einzelne Einträge höchstens limit, Einträge für Sammelmails höchstens digest_limit
+def claim_due_mails(conn, now, limit=batch_size, digest_limit=digest_batch_size):
+    rows = conn.execute(text('''
+        SELECT * FROM mail_ausgang
+        WHERE "Status" = 'offen' AND "Naechster_Versuch" <= :now AND "Sammeln_bis" IS NULL
+        ORDER BY id LIMIT :limit
+    '''), {"now": now, "limit": limit}).fetchall()
+    rows += conn.execute(text('''
+        SELECT * FROM mail_ausgang
+        WHERE "Status" = 'offen' AND "Naechster_Versuch" <= :now AND "Sammeln_bis" IS NOT NULL
+        ORDER BY id LIMIT :limit
+    '''), {"now": now, "limit": digest_limit}).fetchall()
+    if rows:
+        conn.execute(
+            text('UPDATE mail_ausgang SET "Naechster_Versuch" = :lease, "Reserviert_bis" = :lease WHERE id = :id'),
+            [{"lease": now + lease_s, "id": row.id} for row in rows]
+        )
+    return rows
+
+# results: Liste (Eintrag, Fehler oder None)
+def save_results(conn, results, now):
+    sent = [{"id": row.id, "now": now} for row, error in results if error is None]
+    if sent:
+        conn.execute(text('''
+            UPDATE mail_ausgang SET "Status" = 'gesendet', "Versuche" = "Versuche" + 1,
+                                    "Gesendet_am" = :now, "Letzter_Fehler" = NULL, "Reserviert_bis" = NULL
+            WHERE id = :id
+        '''), sent)
+
+    failed = []
+    for row, error in results:
+        if error is None:
+            continue
+        attempts = row.Versuche + 1
+        final = is_permanent(error) or attempts >= max_attempts
+        failed.append({
+            "id": row.id,
+            "status": "fehlgeschlagen" if final else "offen",
+            "next": now + retry_delay(attempts),
+            "error": str(error)[:500],
+        })
+    if failed:
+        conn.execute(text('''
+            UPDATE mail_ausgang SET "Status" = :status, "Versuche" = "Versuche" + 1,
+                                    "Naechster_Versuch" = :next, "Letzter_Fehler" = :error,
+                                    "Reserviert_bis" = NULL
+            WHERE id = :id
+        '''), failed)
+    return len(sent), len(failed)
+
+def next_due(conn):
+    return conn.execute(text(
+        'SELECT MIN("Naechster_Versuch") FROM mail_ausgang WHERE "Status" = \'offen\''
+    )).scalar()
+
+# ---------------------------
+# Versand-Thread mit wiederverwendeter SMTP-Verbindung
+# ---------------------------
+class MailDispatcher:
+    def __init__(self, start_thread=True):
+        self.connection = None
+        self.last_used = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self.thread = None
+        if start_thread:
+            self.thread = threading.Thread(target=self._run, name="mailversand", daemon=True)
+            self.thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _connect(self):
+        if smtp_security == "ssl":
+            connection = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=smtp_timeout)
+        else:
+            connection = smtplib.SMTP(smtp_host, smtp_port, timeout=smtp_timeout)
+            if smtp_security == "starttls":
+                connection.starttls()
+        if smtp_user:
+            connection.login(smtp_user, smtp_password)
+        return connection
+
+    def close(self):
+        with self._lock:
+            if self.connection is not None:
+                try:
+                    self.connection.quit()
+                except Exception:
+                    pass
+                self.connection = None
+
+    def _send(self, message):
+        # Eine Verbindung, die der Server inzwischen geschlossen hat, wird einmal neu aufgebaut
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self._connect()
+            try:
+                self.connection.send_message(message)
+                self.last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.connection = None
+                if attempt:
+                    raise
+
+    # Verschickt alle fälligen Einträge; gibt (gesendet, fehlgeschlagen) zurück
+    def process_due(self):
+        sent_total = failed_total = 0
+        while True:
+            rows = run_write(lambda conn: claim_due_mails(conn, utc_timestamp()))
+            if not rows:
+                return sent_total, failed_total
+
+            messages = build_messages(rows)
+            results = []
+            unreachable = False
+            with self._lock:
+                for position, (group, message) in enumerate(messages):
+                    try:
+                        self._send(message)
+                    except (smtplib.SMTPException, OSError) as e:
+                        results.extend((row, e) for row in group)
+                        if is_connection_error(e):
+                            # Server nicht erreichbar: die übrigen Mails gar nicht erst versuchen
+                            self.connection = None
+                            unreachable = True
+                            results.extend((row, e) for other, _ in messages[position + 1:] for row in other)
+                            break
+                    else:
+                        results.extend((row, None) for row in group)
+
+            sent, failed = run_write(lambda conn: save_results(conn, results, utc_timestamp()))
+            sent_total += sent
+            failed_total += failed
+            if failed:
+                print(f"Mailversand: {failed} Bestellungen nicht verschickt ({results[-1][1]})")
+            digest_rows = sum(row.Sammeln_bis is not None for row in rows)
+            if unreachable or (len(rows) - digest_rows < batch_size and digest_rows < digest_batch_size):
+                return sent_total, failed_total
+
+    def _wait_time(self):
+        with get_read_engine().connect() as conn:
+            due = next_due(conn)
+        wait = poll_interval_s
+        if due is not None:
+            wait = min(wait, max(due - utc_timestamp(), 0))
+        if self.connection is not None:
+            wait = min(wait, max(idle_timeout_s - (time.monotonic() - self.last_used), 0))
+        return wait
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                self.process_due()
+                if self.connection is not None and time.monotonic() - self.last_used >= idle_timeout_s:
+                    self.close()
+                wait = self._wait_time()
+            except Exception as e:
+                print(f"Mailversand: Fehler im Versand-Thread ({e}), neuer Versuch in {poll_interval_s} s")
+                wait = poll_interval_s
+            self._wake.wait(wait)
+
+# ---------------------------
+# Funktion: Versand-Thread des Prozesses holen (beim ersten Aufruf starten)
+# ---------------------------
+def get_mail_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = MailDispatcher()
+                atexit.register(_dispatcher.close)
+    return _dispatcher
+
+# ---------------------------
+# Funktion: Anzahl Einträge pro Status
+# ---------------------------
+def outbox_status():
+    with get_read_engine().connect() as conn:
+        return dict(conn.execute(text('SELECT "Status", COUNT(*) FROM mail_ausgang GROUP BY "Status"')).fetchall())
+
+# ---------------------------
+# Skript ausführen
+# ---------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Postausgang der Spezialprodukte verschicken")
+    parser.add_argument("--status", action="store_true", help="nur Anzahl Einträge pro Status anzeigen")
+    parser.add_argument("--erneut", action="store_true", help="fehlgeschlagene Einträge wieder freigeben")
+    parser.add_argument("--jetzt", action="store_true", help="zurückgestellte Sammelmails sofort verschicken")
+    parser.add_argument("--dauerbetrieb", action="store_true", help="laufend verschicken (Shop mit SHOP_MAILVERSAND=0)")
+    args = parser.parse_args()
+
+    if args.erneut:
+        count = run_write(lambda conn: conn.execute(text('''
+            UPDATE mail_ausgang SET "Status" = 'offen', "Versuche" = 0, "Naechster_Versuch" = :now
+            WHERE "Status" = 'fehlgeschlagen'
+        '''), {"now": utc_timestamp()}).rowcount)
+        print(f"{count} fehlgeschlagene Einträge wieder freigegeben.")
+
+    if args.jetzt:
+        # Nicht die Einträge, die ein laufender Versand gerade reserviert hat (sonst doppelt)
+        run_write(lambda conn: conn.execute(text('''
+            UPDATE mail_ausgang SET "Naechster_Versuch" = :now
+            WHERE "Status" = 'offen' AND "Versuche" = 0 AND "Naechster_Versuch" > :now
+              AND ("Reserviert_bis" IS NULL OR "Reserviert_bis" <= :now)
+        '''), {"now": utc_timestamp()}))
+
+    if args.dauerbetrieb:
+        print(f"Mailversand über {smtp_host}:{smtp_port} läuft (Abbrechen mit Ctrl+C).")
+        dispatcher = get_mail_dispatcher()
+        try:
+            dispatcher.thread.join()
+        except KeyboardInterrupt:
+            pass
+    elif not args.status:
+        dispatcher = MailDispatcher(start_thread=False)
+        sent, failed = dispatcher.process_due()
+        dispatcher.close()
+        print(f"{sent} Bestellungen verschickt, {failed} nicht verschickt.")
+
+    status = outbox_status()
+    print("Postausgang: " + (", ".join(f"{count} {name}" for name, count in sorted(status.items())) or "leer"))
@@ -1,10 +1,17 @@
 import streamlit as st
 import pandas as pd
 import os
+import hmac
 import base64
-import webbrowser
-from datetime import datetime
-from sqlalchemy import create_engine, Table, Column, Integer, String, MetaData, select, insert
+from sqlalchemy import select
+from datenbank import get_read_engine, orders_table
+from bestellpuffer import get_order_buffer
+from export_bestellungen import orders_as_bytes
+from protokoll import log_workbook_bytes
+from sammelbestellung import ERRORS, read_upload, ordered_today, validate_upload, save_upload
+from mailversand import enqueue_special_order, get_mail_dispatcher, dispatch_in_app
+from katalog import CatalogService, format_number
+from bilder import ImageManifest, start_image_server, THUMB_SIZES
 
 # ---------------------------
 # Mehrsprachigkeit: Sprachoptionen und Übersetzungen definieren
@@ -64,6 +71,168 @@ TRANSLATIONS = {
         "en": "Not available",
         "fr": "Non disponible",
         "it": "Non disponibile"
+    },
+    "previous_page": {
+        "de": "Zurück",
+        "en": "Previous",
+        "fr": "Précédent",
+        "it": "Indietro"
+    },
+    "next_page": {
+        "de": "Weiter",
+        "en": "Next",
+        "fr": "Suivant",
+        "it": "Avanti"
+    },
+    "page_info": {
+        "de": "Seite {page} von {pages} · {total} Produkte",
+        "en": "Page {page} of {pages} · {total} products",
+        "fr": "Page {page} sur {pages} · {total} produits",
+        "it": "Pagina {page} di {pages} · {total} prodotti"
+    },
+    "search": {
+        "de": "Suche (Name, SAP Nummer, Bemerkung)",
+        "en": "Search (name, SAP number, remark)",
+        "fr": "Recherche (nom, numéro SAP, remarque)",
+        "it": "Cerca (nome, numero SAP, osservazione)"
+    },
+    "no_results": {
+        "de": "Keine Produkte gefunden.",
+        "en": "No products found.",
+        "fr": "Aucun produit trouvé.",
+        "it": "Nessun prodotto trovato."
+    },
+    "page_size": {
+        "de": "Produkte pro Seite",
+        "en": "Products per page",
+        "fr": "Produits par page",
+        "it": "Prodotti per pagina"
+    },
+    "cart": {
+        "de": "Warenkorb",
+        "en": "Shopping cart",
+        "fr": "Panier",
+        "it": "Carrello"
+    },
+    "add_to_cart": {
+        "de": "In den Warenkorb",
+        "en": "Add to cart",
+        "fr": "Ajouter au panier",
+        "it": "Aggiungi al carrello"
+    },
+    "in_cart": {
+        "de": "Im Warenkorb",
+        "en": "In cart",
+        "fr": "Dans le panier",
+        "it": "Nel carrello"
+    },
+    "cart_empty": {
+        "de": "Der Warenkorb ist leer.",
+        "en": "Your cart is empty.",
+        "fr": "Votre panier est vide.",
+        "it": "Il carrello è vuoto."
+    },
+    "quantity": {
+        "de": "Anzahl",
+        "en": "Quantity",
+        "fr": "Quantité",
+        "it": "Quantità"
+    },
+    "remove": {
+        "de": "Entfernen",
+        "en": "Remove",
+        "fr": "Retirer",
+        "it": "Rimuovi"
+    },
+    "cart_total": {
+        "de": "Total: {lines} Positionen, {units} Stück",
+        "en": "Total: {lines} lines, {units} units",
+        "fr": "Total: {lines} positions, {units} pièces",
+        "it": "Totale: {lines} posizioni, {units} pezzi"
+    },
+    "checkout": {
+        "de": "Bestellung abschicken",
+        "en": "Place order",
+        "fr": "Envoyer la commande",
+        "it": "Invia l'ordine"
+    },
+    "checkout_success": {
+        "de": "Bestellung Nr. {order_id} wurde erfolgreich gespeichert!",
+        "en": "Order no. {order_id} successfully saved!",
+        "fr": "Commande n° {order_id} enregistrée avec succès!",
+        "it": "Ordine n. {order_id} salvato con successo!"
+    },
+    "email_queued": {
+        "de": "Bestellung wird an {recipient} gesendet.",
+        "en": "Order will be sent to {recipient}.",
+        "fr": "La commande sera envoyée à {recipient}.",
+        "it": "L'ordine sarà inviato a {recipient}."
+    },
+    "bulk_order": {
+        "de": "Sammelbestellung",
+        "en": "Bulk order",
+        "fr": "Commande groupée",
+        "it": "Ordine multiplo"
+    },
+    "bulk_upload": {
+        "de": "CSV- oder Excel-Datei mit SAP Nummer und Anzahl",
+        "en": "CSV or Excel file with SAP number and quantity",
+        "fr": "Fichier CSV ou Excel avec numéro SAP et quantité",
+        "it": "File CSV o Excel con numero SAP e quantità"
+    },
+    "bulk_help": {
+        "de": "Eine Zeile pro Produkt: erste Spalte SAP Nummer, zweite Spalte Anzahl.",
+        "en": "One line per product: first column SAP number, second column quantity.",
+        "fr": "Une ligne par produit : première colonne numéro SAP, deuxième colonne quantité.",
+        "it": "Una riga per prodotto: prima colonna numero SAP, seconda colonna quantità."
+    },
+    "bulk_summary": {
+        "de": "{lines} Zeilen, davon {errors} mit Fehlern",
+        "en": "{lines} lines, {errors} with errors",
+        "fr": "{lines} lignes, dont {errors} avec erreurs",
+        "it": "{lines} righe, di cui {errors} con errori"
+    },
+    "bulk_fix_errors": {
+        "de": "Bitte die fehlerhaften Zeilen in der Datei korrigieren und erneut hochladen.",
+        "en": "Please correct the lines with errors in the file and upload it again.",
+        "fr": "Veuillez corriger les lignes erronées dans le fichier et le téléverser à nouveau.",
+        "it": "Correggere le righe con errori nel file e caricarlo di nuovo."
+    },
+    "bulk_error_missing_sap": {
+        "de": "SAP Nummer fehlt",
+        "en": "SAP number missing",
+        "fr": "Numéro SAP manquant",
+        "it": "Numero SAP mancante"
+    },
+    "bulk_error_unknown": {
+        "de": "Unbekannte SAP Nummer",
+        "en": "Unknown SAP number",
+        "fr": "Numéro SAP inconnu",
+        "it": "Numero SAP sconosciuto"
+    },
+    "bulk_error_duplicate": {
+        "de": "Mehrfach in der Datei",
+        "en": "Listed more than once",
+        "fr": "Plusieurs fois dans le fichier",
+        "it": "Più volte nel file"
+    },
+    "bulk_error_quantity": {
+        "de": "Ungültige Anzahl",
+        "en": "Invalid quantity",
+        "fr": "Quantité invalide",
+        "it": "Quantità non valida"
+    },
+    "bulk_error_out_of_stock": {
+        "de": "Nicht an Lager",
+        "en": "Out of stock",
+        "fr": "Pas en stock",
+        "it": "Non disponibile"
+    },
+    "bulk_error_not_orderable": {
+        "de": "Menge nicht bestellbar",
+        "en": "Quantity not orderable",
+        "fr": "Quantité non commandable",
+        "it": "Quantità non ordinabile"
     }
 }
 
@@ -77,42 +246,16 @@ def _(key):
 st.set_page_config(page_title="Interner Store Shop", layout="wide")
 
 # ---------------------------
-# Datenbank-Verbindung und Tabellen-Definition
+# Datenbank-Verbindung (eine Engine pro Prozess, Schema beim ersten Zugriff)
 # ---------------------------
-db_path = "data/bestellungen.db"
-engine = create_engine(f"sqlite:///{db_path}")
-
-# Datenbankstruktur definieren
-meta = MetaData()
-
-orders_table = Table(
-    'bestellungen', meta,
-    Column('id', Integer, primary_key=True),
-    Column('Datum', String),
-    Column('Storenummer', String),
-    Column('Produktname', String),
-    Column('SAP_Nummer', String),
-    Column('Anzahl', Integer)
-)
+# Lesen über den Pool mit Nur-Lese-Verbindungen; Bestellungen nimmt der Bestellpuffer
+# (bestellpuffer.py) an und schreibt sie gesammelt über den Schreib-Thread.
+engine = get_read_engine()
 
-# Tabelle erstellen (nur einmalig nötig)
-meta.create_all(engine)
-
-# ---------------------------
-# Funktion zum Laden von Daten
-# ---------------------------
-@st.cache_data
-def load_data(file_path):
-    try:
-        df = pd.read_excel(file_path)
-        return df
-    except FileNotFoundError:
-        st.error(f"Datei nicht gefunden: {file_path}")
-        return pd.DataFrame()
-    except Exception as e:
-        st.error(f"Fehler beim Laden der Datei: {file_path}")
-        st.error(str(e))
-        return pd.DataFrame()
+# Versand-Thread für den Postausgang der Spezialprodukte (verschickt auch Mails, die vor
+# einem Neustart noch offen waren)
+if dispatch_in_app:
+    get_mail_dispatcher()
 
 # ---------------------------
 # Excel-Dateipfade und Static-Folder
@@ -122,16 +265,40 @@ products_path = "data/produkte.xlsx"
 special_products_path = "data/produkte_special.xlsx"
 static_folder = "static"
 
+# ---------------------------
+# Bildauslieferung: "url" = Bildserver mit Browser-Cache, "inline" = Base64 im HTML
+# ---------------------------
+# Standard ist "inline": funktioniert auch hinter HTTPS und Proxys (z.B. Codespaces), wo ein
+# zweiter Port nicht erreichbar ist oder http-Bilder als Mixed Content blockiert werden.
+# Der Bildserver wird nur verwendet, wenn SHOP_BILDER_URL gesetzt ist, also die Adresse, unter
+# der die Browser ihn erreichen (z.B. https://shop.example.ch/bilder).
+image_server_port = int(os.environ.get("SHOP_BILDER_PORT", "8502"))
+image_server_url = os.environ.get("SHOP_BILDER_URL", "").rstrip("/")
+image_mode = os.environ.get("SHOP_BILDER_MODUS", "url" if image_server_url else "inline")
+
+# ---------------------------
+# Katalog-Service: einmal pro Prozess, lädt geänderte Excel-Dateien im Hintergrund neu
+# ---------------------------
+@st.cache_resource
+def load_catalog_service():
+    service = CatalogService(storelist_path, products_path, special_products_path)
+    service.start_watcher()
+    return service
+
 # ---------------------------
 # Lade die Daten
 # ---------------------------
-storelist = load_data(storelist_path)
-products = load_data(products_path)
-special_products = load_data(special_products_path)
+# Ein Snapshot pro Skriptlauf: alle Tabellen und Mappings stammen garantiert vom selben Stand.
+catalog = load_catalog_service().current()
+for error in catalog.errors:
+    st.error(error)
 
-# Erstelle Mappings:
-store_mapping = dict(zip(storelist["Storenummer"], storelist["Storename"]))
-store_lang_mapping = dict(zip(storelist["Storenummer"], storelist["Lang"]))
+storelist = catalog.storelist
+products = catalog.products
+special_products = catalog.special_products
+
+store_mapping = catalog.store_mapping
+store_lang_mapping = catalog.store_lang_mapping
 
 # ---------------------------
 # Sidebar: Navigation und Store-Auswahl
@@ -170,7 +337,13 @@ st.session_state.language = selected_language
 selected_store_name = store_mapping[selected_store_number]
 st.sidebar.write(f"{_('current_store')}: {selected_store_name} ({selected_store_number})")
 
-selected_tab = st.sidebar.radio("Seiten", [_("products"), _("special_products")])
+# Seite "Alle Bestellungen" nur, wenn ein Admin-Passwort gesetzt ist
+admin_password = os.environ.get("SHOP_ADMIN_PASSWORT", "")
+admin_tab = "Alle Bestellungen"
+tabs = [_("products"), _("special_products"), _("cart"), _("bulk_order")]
+if admin_password:
+    tabs.append(admin_tab)
+selected_tab = st.sidebar.radio("Seiten", tabs)
 
 # ---------------------------
 # CSS-Stil für die Bilder
@@ -192,6 +365,10 @@ st.markdown(f"""
             margin-bottom: 10px;
             border: 1px solid #ddd;
         }}
+        .image-placeholder {{
+            border-radius: 10px;
+            border: 1px dashed #ddd;
+        }}
         .not-available-text {{
             color: red;
         }}
@@ -199,173 +376,392 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 # ---------------------------
-# Funktion: Bild als Base64 kodieren
+# Bild-Manifest: einmal pro Prozess aufbauen und für alle Sessions teilen
 # ---------------------------
+# Der Hintergrund-Thread übernimmt neue oder ersetzte Bilder in static/ ohne Neustart.
+@st.cache_resource
+def load_image_manifest():
+    manifest = ImageManifest(static_folder)
+    manifest.start_watcher()
+    return manifest
+
+image_manifest = load_image_manifest()
+
+# Fehlende Bilder nur einmal pro Katalog- bzw. Manifest-Stand melden (Server-Konsole),
+# statt bei jedem Rendern eine Warnung pro Produkt anzuzeigen.
+@st.cache_resource
+def report_missing_images(manifest_version, image_names):
+    missing = image_manifest.missing(image_names)
+    for image_name in missing:
+        print(f"Bild nicht gefunden: {image_name}")
+    return missing
+
+report_missing_images(
+    image_manifest.version,
+    tuple(products.get("Bildname", [])) + tuple(special_products.get("Bildname", []))
+)
+
+# ---------------------------
+# Bildserver einmal pro Prozess starten (nur im URL-Modus)
+# ---------------------------
+@st.cache_resource
+def load_image_server():
+    try:
+        return start_image_server(port=image_server_port)
+    except OSError as e:
+        print(f"Bildserver konnte nicht gestartet werden (Port {image_server_port}): {e}")
+        return None
+
+def get_image_base_url():
+    # Ohne SHOP_BILDER_URL ist nicht bekannt, wie Browser den Bildserver erreichen
+    if image_mode != "url" or not image_server_url or load_image_server() is None:
+        return None
+    return image_server_url
+
+image_base_url = get_image_base_url()
+
+# ---------------------------
+# Funktion: Vorschaubild als Base64 kodieren (Inline-Modus)
+# ---------------------------
+# Es wird die 2x-Variante (300px) ausgeliefert, damit das Bild bei 150px auch auf
+# hochauflösenden Bildschirmen scharf bleibt - und trotzdem nur wenige KB statt ~400 KB.
 @st.cache_data
 def get_image_base64(image_path):
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode()
-    # ---------------------------
-# Funktion: Bestellung speichern
+
 # ---------------------------
-def save_order(store_number, sap_number, product_name, quantity):
-    with engine.connect() as conn:
-        stmt = insert(orders_table).values(
-            Datum=datetime.now().strftime("%Y-%m-%d"),
-            Storenummer=store_number,
-            Produktname=product_name,
-            SAP_Nummer=sap_number,
-            Anzahl=quantity
-        )
-        conn.execute(stmt)
-        conn.commit()
-    st.success(_("order_success"))
+# Funktion: src-/srcset-Attribute für ein Produktbild
+# ---------------------------
+def get_image_attributes(image_name):
+    entry = image_manifest.get(image_name)
+    if entry is None:
+        return None
+    targets = entry["thumbnails"]
+
+    if image_base_url:
+        urls = {size: f"{image_base_url}/{os.path.basename(path)}" for size, path in targets.items()}
+        srcset = ", ".join(f"{urls[size]} {size // min(THUMB_SIZES)}x" for size in THUMB_SIZES)
+        return f'src="{urls[min(THUMB_SIZES)]}" srcset="{srcset}" loading="lazy"'
+
+    thumb_path = targets[max(THUMB_SIZES)]
+    mime = "image/webp" if thumb_path.endswith(".webp") else "image/png"
+    return f'src="data:{mime};base64,{get_image_base64(thumb_path)}"'
 
 # ---------------------------
 # Funktion: Alle Bestellungen anzeigen
 # ---------------------------
 def get_orders():
     with engine.connect() as conn:
-        stmt = select([orders_table])
+        c = orders_table.c
+        stmt = select(c.id, c.Datum, c.Storenummer, c.Produktname, c.SAP_Nummer, c.Anzahl).order_by(c.id)
         result = conn.execute(stmt)
         orders = result.fetchall()
     return orders
 
 # ---------------------------
-# Funktion: Bestellungen als DataFrame herunterladen
+# Blätterfunktion: nur die sichtbare Seite erzeugt Widgets und Bilder
 # ---------------------------
-def download_orders():
-    df = pd.read_sql_table('bestellungen', engine)
-    return df
+PAGE_SIZES = [12, 24, 48, 96]
+PAGE_STATE_KEYS = ["products_page", "special_products_page"]
+
+def change_page(state_key, step):
+    st.session_state[state_key] = st.session_state.get(state_key, 0) + step
+
+def reset_pages():
+    for key in PAGE_STATE_KEYS:
+        st.session_state[key] = 0
+
+def display_page_controls(state_key, page, pages, total, position):
+    prev_col, info_col, next_col = st.columns([1, 3, 1])
+    with prev_col:
+        st.button(f"‹ {_('previous_page')}", key=f"{state_key}_prev_{position}", disabled=page == 0,
+                  on_click=change_page, args=(state_key, -1), use_container_width=True)
+    with info_col:
+        st.markdown(
+            f"<p style='text-align: center;'>{_('page_info').format(page=page + 1, pages=pages, total=total)}</p>",
+            unsafe_allow_html=True
+        )
+    with next_col:
+        st.button(f"{_('next_page')} ›", key=f"{state_key}_next_{position}", disabled=page >= pages - 1,
+                  on_click=change_page, args=(state_key, 1), use_container_width=True)
+
+def paginate(cards, state_key):
+    page_size = st.sidebar.selectbox(
+        _("page_size"),
+        options=PAGE_SIZES,
+        index=1,
+        key="page_size",
+        on_change=reset_pages
+    )
+    total = len(cards)
+    pages = max(1, -(-total // page_size))
+    page = min(max(st.session_state.get(state_key, 0), 0), pages - 1)
+    st.session_state[state_key] = page
+    return cards[page * page_size:(page + 1) * page_size], page, pages, total
 
 # ---------------------------
-# Funktion: Produkte anzeigen
+# Funktionen: Bestell-Buttons (Callbacks, laufen vor dem Neuzeichnen der Karte)
 # ---------------------------
+def add_to_cart(card):
+    cart = st.session_state.setdefault("cart", {})
+    line = cart.setdefault(card.sap_number, {"name": card.name, "quantity": 0})
+    line["quantity"] += st.session_state[f"qty_{card.key}"]
+    # Mengenfeld im Warenkorb mit dem neuen Total neu aufbauen
+    st.session_state.pop(f"cart_qty_{card.sap_number}", None)
+
+# Spezialprodukte: Bestellung nur in den Postausgang legen, verschickt wird im Hintergrund
+def email_product(card, store_number, store_name):
+    enqueue_special_order(
+        card.mail, store_number, store_name, card.sap_number, card.name,
+        st.session_state[f"qty_{card.key}"]
+    )
+    st.session_state[f"email_sent_{card.key}"] = True
+
 # ---------------------------
-# Funktion: Zahlen formatieren (keine Dezimalstelle, wenn nicht nötig)
+# Funktion: Eine Produktkarte anzeigen
 # ---------------------------
-def format_number(num):
-    try:
-        if isinstance(num, float) and num.is_integer():
-            return str(int(num))
-        elif isinstance(num, int):
-            return str(num)
+# Jede Karte ist ein eigenes Fragment: Mengenauswahl und Bestellung zeichnen nur diese
+# Karte neu, nicht die ganze Seite mit allen anderen Karten.
+@st.fragment
+def display_product_card(card, email_mode, store_number, store_name):
+    index = card.key
+    st.markdown("<div class='product-container'>", unsafe_allow_html=True)
+
+    st.markdown(f"<h5>{card.name}</h5>", unsafe_allow_html=True)
+
+    if card.remark:
+        st.markdown(f"<p style='font-size: small; color: gray;'>{card.remark}</p>", unsafe_allow_html=True)
+    else:
+        st.markdown("<p style='font-size: small;'>&nbsp;</p>", unsafe_allow_html=True)
+
+    # Layout mit Bild und Benachrichtigungen in einer Zeile
+    img_col, msg_col = st.columns([1, 2])
+    with img_col:
+        image_attributes = get_image_attributes(card.image_name)
+        if image_attributes:
+            st.markdown(f"""
+                <div>
+                    <img {image_attributes} 
+                         alt="{card.name}" 
+                         style="width: {image_width}; height: {image_height}; object-fit: cover;">
+                </div>
+            """, unsafe_allow_html=True)
         else:
-            return str(num)
-    except Exception:
-        return str(num)
+            st.markdown(f"<div class='image-placeholder' style='width: {image_width}; height: {image_height};'></div>", unsafe_allow_html=True)
+
+    with msg_col:
+        if email_mode and st.session_state.get(f"email_sent_{index}", False):
+            st.info(_("email_queued").format(recipient=card.mail))
+        elif not email_mode and card.sap_number in st.session_state.get("cart", {}):
+            in_cart = st.session_state["cart"][card.sap_number]["quantity"]
+            st.success(f"{_('in_cart')}: {format_number(in_cart)}")
+
+    # SAP-Nummer anzeigen, falls vorhanden
+    if card.sap_number:
+        st.markdown(f"**SAP Nummer:** {card.sap_number}", unsafe_allow_html=True)
+
+    stock_text = f"**Stock:** {card.stock_text}"
+    if not card.available:
+        stock_text += f" <span class='not-available-text'>({_('not_available')})</span>"
+    st.markdown(stock_text, unsafe_allow_html=True)
+
+    if card.qty_options:
+        st.selectbox(
+            _("order"),
+            options=card.qty_options,
+            format_func=format_number,
+            key=f"qty_{index}",
+            disabled=not card.available
+        )
 
+        if email_mode:
+            st.button(f"{_('order')}: {card.name}", key=f"email_{index}", disabled=not card.available,
+                      on_click=email_product, args=(card, store_number, store_name))
+        else:
+            st.button(f"{_('add_to_cart')}: {card.name}", key=f"save_{index}", disabled=not card.available,
+                      on_click=add_to_cart, args=(card,))
+
+    st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown("<hr style='border: 1px solid #ddd; margin: 20px 0;'>", unsafe_allow_html=True)
+
+# ---------------------------
+# Funktion: Produkte anzeigen
+# ---------------------------
+# Rendert die vorberechneten Produktkarten (katalog.ProductCard) der aktuellen Seite.
+def display_products(cards, email_mode=False):
+    state_key = "special_products_page" if email_mode else "products_page"
+    page_cards, page, pages, total = paginate(cards, state_key)
+    if not total:
+        st.info(_("no_results"))
+        return
+    display_page_controls(state_key, page, pages, total, "top")
 
-def display_products(product_data, email_mode=False):
     cols = st.columns(3)
-    
-    for index, row in product_data.iterrows():
-        col = cols[index % 3]
-        with col:
-            st.markdown("<div class='product-container'>", unsafe_allow_html=True)
-
-            st.markdown(f"<h5>{row['Name']}</h5>", unsafe_allow_html=True)
-
-            if not pd.isna(row.get("Bemerkungen", "")) and str(row["Bemerkungen"]).strip():
-                st.markdown(f"<p style='font-size: small; color: gray;'>{row['Bemerkungen']}</p>", unsafe_allow_html=True)
-            else:
-                st.markdown("<p style='font-size: small;'>&nbsp;</p>", unsafe_allow_html=True)
-
-            # Layout mit Bild und Benachrichtigungen in einer Zeile
-            img_col, msg_col = st.columns([1, 2])
-            with img_col:
-                image_name = str(row["Bildname"])
-                image_path = os.path.join(static_folder, image_name)
-                #st.write(f"Image path: {image_path}")  # Debugging-Hilfe
-                if os.path.exists(image_path):
-                    image_base64 = get_image_base64(image_path)
-                    st.markdown(f"""
-                        <div>
-                            <img src="data:image/png;base64,{image_base64}" 
-                                 alt="{row['Name']}" 
-                                 style="width: {image_width}; height: {image_height}; object-fit: cover;">
-                        </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.warning(f"Bild nicht gefunden: {image_name}")
-
-            with msg_col:
-                if email_mode and st.session_state.get(f"email_sent_{index}", False):
-                    st.info("Email window opened.")
-                elif not email_mode and st.session_state.get(f"order_saved_{index}", False):
-                    st.success(_("order_success"))
-
-            # SAP-Nummer anzeigen, falls vorhanden
-            if 'SAP Number' in row and not pd.isna(row['SAP Number']):
-                sap_number = format_number(row['SAP Number'])
-                sap_text = f"**SAP Nummer:** {sap_number}"
-                st.markdown(sap_text, unsafe_allow_html=True)
-
-            # Stock-Wert formatieren
-            stock_val = format_number(row['actual Stock'])
-            stock_text = f"**Stock:** {stock_val}"
-            if row['actual Stock'] == 0:
-                stock_text += f" <span class='not-available-text'>({_('not_available')})</span>"
-            st.markdown(stock_text, unsafe_allow_html=True)
-
-            qty_options = [qty for qty in [row.get("Qty 1"), row.get("Qty 2"), row.get("Qty 3"), row.get("Qty 4")] if not pd.isna(qty)]
-            
-            if qty_options:
-                qty_selected = st.selectbox(
-                    _("order"),
-                    options=qty_options,
-                    format_func=format_number,
-                    key=f"qty_{index}",
-                    disabled=(row['actual Stock'] == 0)
-                )
-
-                if email_mode:
-                    if st.button(f"{_('order')}: {row['Name']}", key=f"email_{index}", disabled=(row['actual Stock'] == 0)):
-                        send_email_with_outlook(
-                            row['Mail'], row['Name'], row['SAP Number'],
-                            qty_selected, selected_store_name, selected_store_number
-                        )
-                        st.session_state[f"email_sent_{index}"] = True
-                        st.rerun()
-                else:
-                    if st.button(f"{_('order')}: {row['Name']}", key=f"save_{index}", disabled=(row['actual Stock'] == 0)):
-                        save_order(selected_store_number, row["SAP Number"], row["Name"], qty_selected)
-                        st.session_state[f"order_saved_{index}"] = True
-                        st.rerun()
-
-            st.markdown("</div>", unsafe_allow_html=True)
-            st.markdown("<hr style='border: 1px solid #ddd; margin: 20px 0;'>", unsafe_allow_html=True)
+    for position, card in enumerate(page_cards):
+        with cols[position % 3]:
+            display_product_card(card, email_mode, selected_store_number, selected_store_name)
+
+    if pages > 1:
+        display_page_controls(state_key, page, pages, total, "bottom")
+
+# ---------------------------
+# Funktionen: Warenkorb bearbeiten und abschicken
+# ---------------------------
+def update_cart_quantity(sap_number):
+    st.session_state["cart"][sap_number]["quantity"] = st.session_state[f"cart_qty_{sap_number}"]
+
+def remove_from_cart(sap_number):
+    st.session_state["cart"].pop(sap_number, None)
+    st.session_state.pop(f"cart_qty_{sap_number}", None)
+
+def checkout_cart(store_number, store_name):
+    cart = st.session_state.get("cart", {})
+    if not cart:
+        return
+    # Bestellung geht in den Bestellpuffer, die Belegnummer kommt sofort zurück
+    st.session_state["last_order_id"] = get_order_buffer().submit(store_number, cart, store_name)
+    for sap_number in list(cart):
+        st.session_state.pop(f"cart_qty_{sap_number}", None)
+    st.session_state["cart"] = {}
+
+# ---------------------------
+# Funktion: Warenkorb anzeigen
+# ---------------------------
+def display_cart():
+    if "last_order_id" in st.session_state:
+        st.success(_("checkout_success").format(order_id=st.session_state.pop("last_order_id")))
+
+    cart = st.session_state.get("cart", {})
+    if not cart:
+        st.info(_("cart_empty"))
+        return
+
+    for sap_number, line in cart.items():
+        name_col, qty_col, remove_col = st.columns([3, 1, 1])
+        with name_col:
+            st.markdown(f"**{line['name']}**  \nSAP Nummer: {sap_number}")
+        with qty_col:
+            st.number_input(
+                _("quantity"),
+                min_value=1,
+                step=1,
+                value=int(line["quantity"]),
+                key=f"cart_qty_{sap_number}",
+                on_change=update_cart_quantity,
+                args=(sap_number,)
+            )
+        with remove_col:
+            st.button(_("remove"), key=f"cart_remove_{sap_number}", on_click=remove_from_cart, args=(sap_number,))
+
+    units = sum(line["quantity"] for line in cart.values())
+    st.markdown(f"**{_('cart_total').format(lines=len(cart), units=format_number(units))}**")
+    st.button(_("checkout"), type="primary", on_click=checkout_cart, args=(selected_store_number, selected_store_name))
+
+# ---------------------------
+# Funktionen: Sammelbestellung aus einer Datei
+# ---------------------------
+def checkout_bulk(preview, store_number, store_name):
+    st.session_state["last_bulk_order_id"] = save_upload(preview, store_number, store_name)
+    # Neuer Schlüssel leert das Upload-Feld
+    st.session_state["bulk_upload_run"] = st.session_state.get("bulk_upload_run", 0) + 1
+
+def display_bulk_order():
+    if "last_bulk_order_id" in st.session_state:
+        st.success(_("checkout_success").format(order_id=st.session_state.pop("last_bulk_order_id")))
+
+    uploaded = st.file_uploader(
+        _("bulk_upload"), type=["csv", "xlsx"], key=f"bulk_upload_{st.session_state.get('bulk_upload_run', 0)}"
+    )
+    if uploaded is None:
+        st.info(_("bulk_help"))
+        return
+
+    try:
+        upload = read_upload(uploaded.getvalue(), uploaded.name)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    with engine.connect() as conn:
+        today = ordered_today(conn, selected_store_number)
+    preview = validate_upload(upload, catalog.product_lookup, today)
+
+    errors = preview["Fehler"] != ""
+    st.markdown(f"**{_('bulk_summary').format(lines=len(preview), errors=int(errors.sum()))}**")
+    shown = preview.assign(Fehler=preview["Fehler"].map({code: _(f"bulk_error_{code}") for code in ERRORS}).fillna(""))
+    st.dataframe(shown, hide_index=True, width="stretch")
+
+    if errors.any():
+        st.error(_("bulk_fix_errors"))
+    units = pd.to_numeric(preview["Anzahl"], errors="coerce").sum()
+    st.markdown(f"**{_('cart_total').format(lines=len(preview), units=format_number(units))}**")
+    st.button(_("checkout"), type="primary", disabled=bool(errors.any() or preview.empty),
+              on_click=checkout_bulk, args=(preview, selected_store_number, selected_store_name))
 
 # ---------------------------
 # Seiteninhalt anzeigen
 # ---------------------------
 if selected_tab == _("products"):
     st.header(_("products"))
-    display_products(products)
+    query = st.text_input(_("search"), key="products_search", on_change=reset_pages)
+    display_products(catalog.product_search.search(query))
 elif selected_tab == _("special_products"):
     st.header(_("special_products"))
-    display_products(special_products, email_mode=True)
-else:
-    st.header("Alle Bestellungen")
+    query = st.text_input(_("search"), key="special_products_search", on_change=reset_pages)
+    display_products(catalog.special_product_search.search(query), email_mode=True)
+elif selected_tab == _("cart"):
+    st.header(_("cart"))
+    display_cart()
+elif selected_tab == _("bulk_order"):
+    st.header(_("bulk_order"))
+    display_bulk_order()
+elif selected_tab == admin_tab:
+    st.header(admin_tab)
+    entered = st.text_input("Admin-Passwort", type="password", key="admin_password")
+    if not hmac.compare_digest(entered.encode(), admin_password.encode()):
+        if entered:
+            st.error("Falsches Passwort.")
+        st.stop()
+
     orders = get_orders()
     orders_df = pd.DataFrame(orders, columns=['ID', 'Datum', 'Storenummer', 'Produktname', 'SAP Nummer', 'Anzahl'])
     st.dataframe(orders_df)
 
     st.subheader("Bestellungen herunterladen")
-    orders_df = download_orders()
 
-    # Download als Excel
+    # Download als Excel und CSV; die Dateien werden erst beim Klick blockweise erzeugt
     st.download_button(
         label="Bestellungen als Excel herunterladen",
-        data=orders_df.to_excel(index=False),
-        file_name="bestellungen.xlsx"
+        data=lambda: orders_as_bytes("xlsx", engine),
+        file_name="bestellungen.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
-
-    # Download als CSV
     st.download_button(
         label="Bestellungen als CSV herunterladen",
-        data=orders_df.to_csv(index=False),
-        file_name="bestellungen.csv"
+        data=lambda: orders_as_bytes("csv", engine),
+        file_name="bestellungen.csv",
+        mime="text/csv"
+    )
+
+    # Download als Parquet und Arrow (für BI-Werkzeuge); erzeugt erst beim Klick
+    st.download_button(
+        label="Bestellungen als Parquet herunterladen",
+        data=lambda: orders_as_bytes("parquet", engine),
+        file_name="bestellungen.parquet",
+        mime="application/vnd.apache.parquet"
+    )
+    st.download_button(
+        label="Bestellungen als Arrow herunterladen",
+        data=lambda: orders_as_bytes("arrow", engine),
+        file_name="bestellungen.arrows",
+        mime="application/vnd.apache.arrow.stream"
+    )
+
+    # Bestellprotokoll (wird aus der Tabelle "logs" erzeugt)
+    st.download_button(
+        label="Bestellprotokoll als Excel herunterladen",
+        data=log_workbook_bytes,
+        file_name="order_logs.xlsx"
     )
 
 
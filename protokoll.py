@@ -0,0 +1,163 @@
+import io
+import os
+import argparse
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import create_engine, text
+from datenbank import apply_storage_profile, utc_timestamp
+from export_bestellungen import ExcelStream, as_number
+
+# ---------------------------
+# Bestellprotokoll: nur anhängen, nie umschreiben
+# ---------------------------
+# Früher wurde data/order_logs.xlsx bei jeder Bestellung ganz gelesen, um eine Zeile ergänzt
+# und neu geschrieben. Jetzt landet jede gespeicherte Bestellposition als Zeile in der
+# Tabelle "logs" von merch_shop.db (INSERT, nie UPDATE oder DELETE). Die Datei wird an jede
+# Schreibverbindung der Bestelldatenbank angehängt (datenbank.get_engine), damit
+# bestellpuffer.write_orders die Protokollzeilen in derselben Transaktion wie die Bestellung
+# schreibt: ohne gespeicherte Bestellung kein Eintrag und umgekehrt, auch nach einem Absturz
+# und beim erneuten Einspielen des Journals. Die Excel-Datei wird nur noch auf Wunsch aus der
+# Tabelle erzeugt (python protokoll.py oder Download im Shop).
+log_db_path = os.environ.get("SHOP_LOG_DB", "merch_shop.db")
+logfile_path = "data/order_logs.xlsx"
+
+# Name der angehängten Datenbank in den Schreibverbindungen
+LOG_SCHEMA = "protokoll"
+
+# Zeitzone der Spalten Datum/Zeit (auch für alte Einträge ohne UTC-Zeitstempel)
+local_timezone = os.environ.get("SHOP_ZEITZONE", "Europe/Zurich")
+
+# Spalten wie in der bisherigen order_logs.xlsx
+LOG_COLUMNS = ["Datum", "Zeit", "Storenummer", "Storename", "SAP Nummer", "Produktname", "Anzahl"]
+
+_log_engine = None
+_log_lock = threading.Lock()
+
+# ---------------------------
+# Funktion: Tabelle "logs" anlegen bzw. ergänzen
+# ---------------------------
+# timestamp: Ortszeit als Text (für Datum/Zeit); timestamp_utc: Unix-Sekunden (UTC);
+# receipt: Beleg_ID der Bestellung, nur bei Einträgen, die der Shop selbst geschrieben hat.
+# Alte Tabellen (nur aus order_logs.xlsx übernommen) bekommen die neuen Spalten leer.
+def ensure_log_table(conn, schema="main"):
+    conn.execute(text(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            store_number TEXT,
+            store_name TEXT,
+            sap_number TEXT,
+            product_name TEXT,
+            quantity INTEGER,
+            timestamp TEXT,
+            timestamp_utc INTEGER,
+            receipt TEXT
+        )
+    '''))
+    columns = {row[1] for row in conn.execute(text(f"PRAGMA {schema}.table_info(logs)"))}
+    for column, column_type in (("timestamp_utc", "INTEGER"), ("receipt", "TEXT")):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE {schema}.logs ADD COLUMN {column} {column_type}"))
+
+# ---------------------------
+# Funktion: Engine für merch_shop.db (legt die Tabelle "logs" an, falls sie fehlt)
+# ---------------------------
+def get_log_engine():
+    global _log_engine
+    if _log_engine is None:
+        with _log_lock:
+            if _log_engine is None:
+                engine = apply_storage_profile(create_engine(f"sqlite:///{log_db_path}"))
+                with engine.begin() as conn:
+                    ensure_log_table(conn)
+                _log_engine = engine
+    return _log_engine
+
+# ---------------------------
+# Funktion: Protokolleinträge aus gespeicherten Bestellungen (Format des Bestellpuffers)
+# ---------------------------
+def entries_from_orders(orders):
+    zone = ZoneInfo(local_timezone)
+    entries = []
+    for order in orders:
+        timestamp_utc = order.get("timestamp") or utc_timestamp()
+        timestamp = datetime.fromtimestamp(timestamp_utc, timezone.utc).astimezone(zone).strftime("%Y-%m-%d %H:%M:%S")
+        for line in order["lines"]:
+            entries.append({
+                "store_number": order["store_number"],
+                "store_name": order.get("store_name"),
+                "sap_number": line["sap_number"],
+                "product_name": line["name"],
+                "quantity": line["quantity"],
+                "timestamp": timestamp,
+                "timestamp_utc": timestamp_utc,
+                "receipt": order["receipt"],
+            })
+    return entries
+
+# ---------------------------
+# Funktion: Protokolleinträge in der Transaktion der Bestellung schreiben
+# ---------------------------
+# conn: Schreibverbindung der Bestelldatenbank (merch_shop.db ist als LOG_SCHEMA angehängt)
+def log_orders(conn, orders):
+    entries = entries_from_orders(orders)
+    if entries:
+        conn.execute(text(f'''
+            INSERT INTO {LOG_SCHEMA}.logs (store_number, store_name, sap_number, product_name,
+                                           quantity, timestamp, timestamp_utc, receipt)
+            VALUES (:store_number, :store_name, :sap_number, :product_name,
+                    :quantity, :timestamp, :timestamp_utc, :receipt)
+        '''), entries)
+
+# ---------------------------
+# Funktion: Protokoll blockweise lesen (älteste Einträge zuerst)
+# ---------------------------
+def iter_log_rows(conn, batch_size=5000):
+    last_id = 0
+    while True:
+        rows = conn.execute(text('''
+            SELECT id, timestamp, store_number, store_name, sap_number, product_name, quantity
+            FROM logs WHERE id > :last_id ORDER BY id LIMIT :limit
+        '''), {"last_id": last_id, "limit": batch_size}).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            date_str, _, time_str = (row.timestamp or "").partition(" ")
+            yield [date_str, time_str, as_number(row.store_number), row.store_name,
+                   as_number(row.sap_number), row.product_name, row.quantity]
+        last_id = rows[-1].id
+
+# ---------------------------
+# Funktion: order_logs.xlsx aus dem Protokoll erzeugen
+# ---------------------------
+# target: Dateipfad (wird erst am Schluss ersetzt) oder ein file-ähnliches Objekt
+def write_log_workbook(target=logfile_path, engine=None):
+    engine = engine or get_log_engine()
+    to_file = isinstance(target, str)
+    excel = ExcelStream(target + ".tmp" if to_file else target, LOG_COLUMNS, "Protokoll")
+    count = 0
+    with engine.connect() as conn:
+        for row in iter_log_rows(conn):
+            excel.write_rows([row])
+            count += 1
+    excel.save()
+    if to_file:
+        os.replace(target + ".tmp", target)
+    return count
+
+# Für den Download im Shop
+def log_workbook_bytes():
+    buffer = io.BytesIO()
+    write_log_workbook(buffer)
+    return buffer.getvalue()
+
+# ---------------------------
+# Skript ausführen
+# ---------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bestellprotokoll als Excel-Datei erzeugen")
+    parser.add_argument("--excel", default=logfile_path, help="Pfad der Excel-Datei")
+    args = parser.parse_args()
+
+    count = write_log_workbook(args.excel)
+    print(f"{count} Protokolleinträge nach {args.excel} geschrieben.")
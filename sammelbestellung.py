@@ -0,0 +1,197 @@
+import io
+import csv
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from katalog import QTY_COLUMNS, format_number, format_number_column
+from bestellpuffer import save_order_now
+from datenbank import utc_day, utc_timestamp
+
+# ---------------------------
+# Sammelbestellung: ganze Bestellung als CSV- oder Excel-Datei hochladen
+# ---------------------------
+# Die Datei enthält pro Zeile eine SAP-Nummer und eine Anzahl. Alle Zeilen werden in einem
+# einzigen Join gegen die Bestelltabelle des Katalogs (katalog.build_order_lookup) geprüft,
+# ohne Schleife über die Zeilen. Die Vorschau zeigt pro Zeile, was heute für den Store schon
+# bestellt ist und was nach der Bestellung dazukommt. Gespeichert wird nur, wenn keine Zeile
+# einen Fehler hat, und dann alles in einer Transaktion (bestellpuffer.save_order_now).
+
+# Erkannte Spaltenüberschriften (ohne Gross-/Kleinschreibung); ohne passende Überschrift
+# gelten die ersten beiden Spalten als SAP-Nummer und Anzahl
+SAP_HEADERS = {"sap nummer", "sap number", "sap_nummer", "sap-nummer", "sap", "sap nr", "sap nr."}
+QUANTITY_HEADERS = {"anzahl", "menge", "quantity", "qty", "quantité", "quantita", "quantità"}
+
+# Fehlercodes in der Spalte "Fehler" (Texte für die Oberfläche in mein_app.py)
+ERRORS = {
+    "missing_sap": "SAP Nummer fehlt",
+    "unknown": "Unbekannte SAP Nummer",
+    "duplicate": "SAP Nummer mehrfach in der Datei",
+    "quantity": "Ungültige Anzahl",
+    "out_of_stock": "Nicht an Lager",
+    "not_orderable": "Menge nicht bestellbar",
+}
+
+PREVIEW_COLUMNS = ["Zeile", "SAP Nummer", "Produktname", "Lager", "Heute bestellt", "Anzahl",
+                   "Nach Bestellung", "Erlaubte Mengen", "Fehler"]
+
+# ---------------------------
+# Funktion: Trennzeichen einer CSV-Datei erkennen
+# ---------------------------
+# Nur Komma, Semikolon (wie im Schweizer Excel) oder Tab; sonst könnte die Erkennung auch an
+# einer Ziffer trennen. Ohne erkennbares Trennzeichen gilt das Semikolon.
+def csv_separator(data):
+    sample = data[:64 * 1024].decode("utf-8-sig", errors="ignore")
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t").delimiter
+    except csv.Error:
+        return ";"
+
+# ---------------------------
+# Funktion: Hochgeladene Datei lesen
+# ---------------------------
+# Gibt ein DataFrame mit den Spalten Zeile (Zeilennummer in der Datei), SAP Nummer
+# (formatiert wie im Katalog) und Anzahl (Text wie in der Datei) zurück.
+def read_upload(data, file_name):
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        def read(header):
+            return pd.read_excel(io.BytesIO(data), header=header, dtype=object)
+    elif extension in (".csv", ".txt"):
+        separator = csv_separator(data)
+        def read(header):
+            return pd.read_csv(io.BytesIO(data), header=header, dtype=str, sep=separator,
+                               encoding="utf-8-sig", skip_blank_lines=True)
+    else:
+        raise ValueError(f"Dateityp nicht unterstützt: {file_name} (CSV oder XLSX)")
+
+    try:
+        df = read(0)
+    except Exception as e:
+        raise ValueError(f"Datei kann nicht gelesen werden: {e}")
+    headers = [str(column).strip().lower() for column in df.columns]
+    sap_column = next((column for column, header in zip(df.columns, headers) if header in SAP_HEADERS), None)
+    quantity_column = next((column for column, header in zip(df.columns, headers) if header in QUANTITY_HEADERS), None)
+
+    first_line = 2
+    if sap_column is None or quantity_column is None:
+        # Keine Überschrift: erste Zeile gehört zu den Daten
+        df = read(None)
+        if df.shape[1] < 2:
+            raise ValueError("Die Datei braucht zwei Spalten: SAP Nummer und Anzahl")
+        sap_column, quantity_column = df.columns[:2]
+        first_line = 1
+
+    df = df[[sap_column, quantity_column]].dropna(how="all")
+    return pd.DataFrame({
+        "Zeile": df.index + first_line,
+        "SAP Nummer": format_number_column(df[sap_column]).str.strip(),
+        "Anzahl": df[quantity_column].astype(object).where(df[quantity_column].notna(), "").astype(str).str.strip(),
+    }).reset_index(drop=True)
+
+# ---------------------------
+# Funktion: Heute bereits bestellte Mengen eines Stores (aus den vorberechneten Summen)
+# ---------------------------
+def ordered_today(conn, store_number):
+    rows = conn.execute(text('''
+        SELECT "SAP_Nummer", "Anzahl" FROM summen_store_sap_tag
+        WHERE "Storenummer" = :store_number AND "Tag" = :day
+    '''), {"store_number": str(store_number), "day": utc_day(utc_timestamp())})
+    return dict(rows.fetchall())
+
+# ---------------------------
+# Funktion: Alle Zeilen gegen den Katalog prüfen
+# ---------------------------
+# lookup: CatalogSnapshot.product_lookup; today: SAP-Nummer -> heute bestellte Menge.
+# Gibt die Vorschau (PREVIEW_COLUMNS) zurück; "Fehler" ist "" oder ein Code aus ERRORS
+# (bei mehreren Fehlern der erste in der Reihenfolge von ERRORS).
+def validate_upload(upload, lookup, today=None):
+    joined = upload.join(lookup, on="SAP Nummer")
+    quantity = pd.to_numeric(joined["Anzahl"], errors="coerce")
+
+    qty_matrix = joined[QTY_COLUMNS].to_numpy(dtype=float)
+    orderable = (qty_matrix == quantity.to_numpy(dtype=float)[:, None]).any(axis=1)
+
+    errors = np.select(
+        [
+            joined["SAP Nummer"] == "",
+            joined["name"].isna(),
+            joined["SAP Nummer"].duplicated(keep=False),
+            quantity.isna() | (quantity <= 0) | (quantity % 1 != 0),
+            joined["available"].eq(False),
+            ~orderable,
+        ],
+        list(ERRORS),
+        default="",
+    )
+
+    already = joined["SAP Nummer"].map(today or {}).fillna(0).astype(int)
+    valid_quantity = quantity.where(errors == "", 0).fillna(0).astype(int)
+    allowed = [
+        ", ".join(format_number(qty) for qty in row[~np.isnan(row)])
+        for row in qty_matrix
+    ]
+    return pd.DataFrame({
+        "Zeile": joined["Zeile"],
+        "SAP Nummer": joined["SAP Nummer"],
+        "Produktname": joined["name"].fillna(""),
+        "Lager": joined["stock"].astype("Int64"),
+        "Heute bestellt": already,
+        "Anzahl": joined["Anzahl"],
+        "Nach Bestellung": already + valid_quantity,
+        "Erlaubte Mengen": allowed,
+        "Fehler": errors,
+    }, columns=PREVIEW_COLUMNS)
+
+# ---------------------------
+# Funktion: Geprüfte Sammelbestellung speichern (eine Transaktion)
+# ---------------------------
+# Gibt die Belegnummer zurück. Mit fehlerhaften Zeilen wird nichts gespeichert.
+def save_upload(preview, store_number, store_name=None):
+    if preview.empty:
+        raise ValueError("Die Datei enthält keine Bestellpositionen")
+    if (preview["Fehler"] != "").any():
+        raise ValueError("Die Datei enthält fehlerhafte Zeilen, es wurde nichts bestellt")
+    lines = {
+        sap_number: {"name": name, "quantity": int(quantity)}
+        for sap_number, name, quantity in zip(preview["SAP Nummer"], preview["Produktname"], preview["Anzahl"].astype(float))
+    }
+    return save_order_now(store_number, lines, store_name)
+
+# ---------------------------
+# Skript ausführen
+# ---------------------------
+if __name__ == "__main__":
+    from katalog import load_catalog_frame, build_order_lookup
+    from datenbank import get_read_engine
+
+    parser = argparse.ArgumentParser(description="Sammelbestellung aus CSV/XLSX prüfen und speichern")
+    parser.add_argument("datei", help="CSV- oder Excel-Datei mit SAP Nummer und Anzahl")
+    parser.add_argument("--store", required=True, help="Storenummer")
+    parser.add_argument("--produkte", default="data/produkte.xlsx", help="Produktkatalog")
+    parser.add_argument("--speichern", action="store_true", help="Bestellung speichern (sonst nur prüfen)")
+    args = parser.parse_args()
+
+    lookup = build_order_lookup(load_catalog_frame(args.produkte))
+    start = time.perf_counter()
+    with open(args.datei, "rb") as f:
+        upload = read_upload(f.read(), args.datei)
+    with get_read_engine().connect() as conn:
+        preview = validate_upload(upload, lookup, ordered_today(conn, args.store))
+    print(f"{len(preview)} Zeilen geprüft in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    failed = preview[preview["Fehler"] != ""]
+    for line, sap_number, quantity, error in zip(failed["Zeile"], failed["SAP Nummer"], failed["Anzahl"], failed["Fehler"]):
+        print(f"Zeile {line}: {sap_number} - {ERRORS[error]} (Anzahl {quantity})")
+    if not failed.empty:
+        print(f"{len(failed)} fehlerhafte Zeilen, nichts bestellt.")
+        sys.exit(1)
+
+    if args.speichern:
+        receipt = save_upload(preview, args.store)
+        print(f"Bestellung {receipt} mit {len(preview)} Positionen gespeichert.")
+    else:
+        print("Alle Zeilen gültig. Mit --speichern bestellen.")
@@ -1,2 +1,3 @@
 cd C:\Users\mzuerche\Desktop\Merch Shop
+python bilder.py
 streamlit run mein_app.py